@@ -1,94 +1,253 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, current_app, g, request, jsonify, stream_with_context, url_for
 from flask_cors import CORS
-from pulp import LpProblem, LpVariable, LpMinimize, lpSum, PULP_CBC_CMD, value, LpStatus
-import sqlite3
+from werkzeug.local import LocalProxy
 import logging
-import requests
 import json
 import os
+import time
 from dotenv import load_dotenv
-import unicodedata
+from catalog import DB_PATH, CatalogCache
+from diet_model import get_model_template, linprog, reset_solver_instances
+from nutrition import calculate_bmr, calculate_energy_needs
+from nutrition_batch import HAVE_NUMPY, iter_norm_chunks, profile_columns, read_csv_columns
+from household import optimize_household, parse_household
+from multiday import optimize_plan, parse_plan
+from optimizer import optimize_profile, parse_profile, result_id, solve_profile, sweep_profile
+from presolve import presolve_products
+from result_cache import ResultCache
+from scheduler import SolverBusyError, SolverScheduler
+from sensitivity import parse_sweep
+from batch import iter_optimize_batch, make_batch_pool
+from jobs import JobQueue, QueueFullError
+from llm_client import LLMClient, LLMClientError
+from meal_plan_cache import MealPlanCache, meal_plan_cache_key
+from metrics import (CATALOG_PRODUCTS, HTTP_REQUESTS, HTTP_SECONDS, STARTUP_SECONDS, process_memory, record_process_memory,
+                     render_metrics, request_timings, server_timing_header, start_request, timed)
 
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app)
-
-logging.basicConfig(level=logging.DEBUG)
-
-ACTIVITY_MULTIPLIERS = {
-    "sedentary": 1.4,
-    "low": 1.6,
-    "moderate": 1.8,
-    "active": 1.9,
-    "very active": 2.0
-}
-
-def calculate_bmr(gender, weight, height, age):
-    if gender.lower() == "male":
-        return 88.362 + (13.397 * weight) + (4.799 * height) - (5.677 * age)
-    else:
-        return 447.593 + (9.247 * weight) + (3.098 * height) - (4.330 * age)
-
-def calculate_energy_needs(bmr, activity):
-    multiplier = ACTIVITY_MULTIPLIERS.get(activity.lower(), 1.4)
-    return bmr * multiplier
-
-def get_efsa_norms(gender, weight, age, eer_kcal, period_days=1):
-    mj_per_day = eer_kcal / 238.83
-    norms = {
-        'protein': 0.83 * weight,
-        'fat': (0.20 * eer_kcal) / 9,
-        'carbs': (0.45 * eer_kcal) / 4,
-        'kj': eer_kcal * 4.184,
-        'kcal': eer_kcal,
-        'A': 0.750 if gender.lower() == 'male' else 0.650,
-        'B1': 0.1 * mj_per_day,
-        'B2': 1.6,
-        'PP': 1.6 * mj_per_day,
-        'C': 110 if gender.lower() == 'male' else 95,
-        'Ca': 950,
-        'P': 550,
-        'Fe': 11 if gender.lower() == 'male' else (16 if age < 50 else 11)
-    }
-    norms_upper = {
-        'protein': 2.0 * weight,
-        'fat': (0.30 * eer_kcal) / 9,
-        'carbs': (0.60 * eer_kcal) / 4,
-        'kcal': eer_kcal * 1.1,
-        'kj': eer_kcal * 4.184 * 1.1
-    }
+bp = Blueprint('diet', __name__)
+
+def load_config(app):
+    """Reads the service configuration from the environment into ``app.config``."""
+    # Root log level (DEBUG, INFO, WARNING, ...)
+    app.config['LOG_LEVEL'] = os.getenv('LOG_LEVEL', 'INFO').upper()
+    # Warm-up (catalog, taxonomy, solver templates, one solve) taking longer than this many seconds is logged as a warning
+    app.config['STARTUP_BUDGET'] = float(os.getenv('STARTUP_BUDGET', '60'))
+    # Product database (default: db/food.db next to this file)
+    app.config['CATALOG_DB_PATH'] = os.getenv('CATALOG_DB_PATH') or None
+    # LP solver backend: 'pulp' (CBC subprocess) or 'highs' (in-process HiGHS on a resident model template)
+    app.config['DIET_SOLVER'] = os.getenv('DIET_SOLVER', 'pulp')
+    # LP solve admission: concurrent solves per process (default: the cores split between the WEB_CONCURRENCY
+    # server processes, which gunicorn.conf.py sets), waiting solves, longest wait,
+    # per-request wall-clock solve budget in seconds, and the Retry-After sent when refused
+    app.config['SOLVER_CONCURRENCY'] = (int(os.getenv('SOLVER_CONCURRENCY', '0'))
+                                        or max(1, (os.cpu_count() or 1) // max(1, int(os.getenv('WEB_CONCURRENCY', '1')))))
+    app.config['SOLVER_QUEUE_DEPTH'] = int(os.getenv('SOLVER_QUEUE_DEPTH', '32'))
+    app.config['SOLVER_QUEUE_TIMEOUT'] = float(os.getenv('SOLVER_QUEUE_TIMEOUT', '30'))
+    app.config['SOLVER_TIME_BUDGET'] = float(os.getenv('SOLVER_TIME_BUDGET', '10'))
+    app.config['SOLVER_RETRY_AFTER'] = int(os.getenv('SOLVER_RETRY_AFTER', '1'))
+    # /optimize result cache: bounded LRU with TTL, optionally persisted to SQLite
+    app.config['RESULT_CACHE_SIZE'] = int(os.getenv('RESULT_CACHE_SIZE', '1024'))
+    app.config['RESULT_CACHE_TTL'] = int(os.getenv('RESULT_CACHE_TTL', '3600'))
+    app.config['RESULT_CACHE_PATH'] = os.getenv('RESULT_CACHE_PATH') or None
+    app.config['RESULT_CACHE_NORM_DIGITS'] = int(os.getenv('RESULT_CACHE_NORM_DIGITS', '3'))
+    # /optimize results kept by result_id so /meal-plan can reuse them without re-solving, in a SQLite file
+    # shared by every server process (empty: this process only)
+    app.config['OPTIMIZE_RESULT_STORE_SIZE'] = int(os.getenv('OPTIMIZE_RESULT_STORE_SIZE', '4096'))
+    app.config['OPTIMIZE_RESULT_TTL'] = int(os.getenv('OPTIMIZE_RESULT_TTL', '3600'))
+    app.config['OPTIMIZE_RESULT_STORE_PATH'] = os.getenv('OPTIMIZE_RESULT_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db', 'optimize_results.db')) or None
+    # /optimize/batch: solver processes per server process (default: SOLVER_CONCURRENCY, the most that
+    # can hold a slot at once) and maximum profiles per request
+    app.config['BATCH_WORKERS'] = int(os.getenv('BATCH_WORKERS', '0'))
+    app.config['BATCH_MAX_ITEMS'] = int(os.getenv('BATCH_MAX_ITEMS', '10000'))
+    # /optimize/household: most members planned in one solve
+    app.config['HOUSEHOLD_MAX_MEMBERS'] = int(os.getenv('HOUSEHOLD_MAX_MEMBERS', '12'))
+    # /optimize/plan: longest plan, default days a product may repeat on, and day solves run at once per plan
+    app.config['PLAN_MAX_DAYS'] = int(os.getenv('PLAN_MAX_DAYS', '14'))
+    app.config['PLAN_MAX_REPEATS'] = int(os.getenv('PLAN_MAX_REPEATS', '3'))
+    app.config['PLAN_WORKERS'] = int(os.getenv('PLAN_WORKERS', '0')) or os.cpu_count()
+    # /tdee/batch: maximum profiles per request and profiles per streamed chunk
+    app.config['TDEE_BATCH_MAX_ITEMS'] = int(os.getenv('TDEE_BATCH_MAX_ITEMS', '1000000'))
+    app.config['TDEE_BATCH_CHUNK_SIZE'] = int(os.getenv('TDEE_BATCH_CHUNK_SIZE', '10000'))
+    # /meal-plan background jobs: concurrent LLM calls, queue depth and result retention
+    app.config['MEAL_PLAN_WORKERS'] = int(os.getenv('MEAL_PLAN_WORKERS', '4'))
+    app.config['MEAL_PLAN_QUEUE_DEPTH'] = int(os.getenv('MEAL_PLAN_QUEUE_DEPTH', '32'))
+    app.config['MEAL_PLAN_JOB_TTL'] = int(os.getenv('MEAL_PLAN_JOB_TTL', '3600'))
+    app.config['MEAL_PLAN_RETRY_AFTER'] = int(os.getenv('MEAL_PLAN_RETRY_AFTER', '5'))
+    # Job records are shared through this SQLite file, so any server process answers GET /meal-plan/<job_id>
+    # (empty: this process only)
+    app.config['MEAL_PLAN_JOB_STORE_PATH'] = os.getenv('MEAL_PLAN_JOB_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db', 'meal_plan_jobs.db')) or None
+    # Chat completions client: endpoint, model, timeouts, retries, connection pool and circuit breaker
+    app.config['OPENAI_API_KEY'] = os.getenv('OPENAI_API_KEY')
+    app.config['OPENAI_BASE_URL'] = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+    app.config['OPENAI_MODEL'] = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
+    app.config['OPENAI_CONNECT_TIMEOUT'] = float(os.getenv('OPENAI_CONNECT_TIMEOUT', '5'))
+    app.config['OPENAI_READ_TIMEOUT'] = float(os.getenv('OPENAI_READ_TIMEOUT', '30'))
+    app.config['OPENAI_MAX_RETRIES'] = int(os.getenv('OPENAI_MAX_RETRIES', '3'))
+    app.config['OPENAI_POOL_SIZE'] = int(os.getenv('OPENAI_POOL_SIZE', '10'))
+    app.config['OPENAI_BREAKER_THRESHOLD'] = int(os.getenv('OPENAI_BREAKER_THRESHOLD', '5'))
+    app.config['OPENAI_BREAKER_RESET'] = float(os.getenv('OPENAI_BREAKER_RESET', '30'))
+    # Generated meal plans are cached in SQLite by request hash, capped at MEAL_PLAN_CACHE_MAX_BYTES of text
+    app.config['MEAL_PLAN_CACHE_PATH'] = os.getenv('MEAL_PLAN_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db', 'meal_plans.db'))
+    app.config['MEAL_PLAN_CACHE_MAX_BYTES'] = int(os.getenv('MEAL_PLAN_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))
+
+def init_process_services(app):
+    """Creates the services that must not be shared across a fork: SQLite connections, HTTP pools, threads and locks."""
+    services = app.extensions['diet']
+    services['solver_scheduler'] = SolverScheduler(app.config['SOLVER_CONCURRENCY'], app.config['SOLVER_QUEUE_DEPTH'],
+                                                   app.config['SOLVER_QUEUE_TIMEOUT'], app.config['SOLVER_TIME_BUDGET'])
+    services['result_cache'] = ResultCache(app.config['RESULT_CACHE_SIZE'], app.config['RESULT_CACHE_TTL'], app.config['RESULT_CACHE_PATH'])
+    services['optimization_results'] = ResultCache(app.config['OPTIMIZE_RESULT_STORE_SIZE'], app.config['OPTIMIZE_RESULT_TTL'],
+                                                   app.config['OPTIMIZE_RESULT_STORE_PATH'])
+    services['meal_plan_jobs'] = JobQueue(app.config['MEAL_PLAN_WORKERS'], app.config['MEAL_PLAN_QUEUE_DEPTH'], app.config['MEAL_PLAN_JOB_TTL'],
+                                          app.config['MEAL_PLAN_JOB_STORE_PATH'])
+    services['llm_client'] = LLMClient(
+        base_url=app.config['OPENAI_BASE_URL'],
+        model=app.config['OPENAI_MODEL'],
+        api_key=app.config['OPENAI_API_KEY'],
+        connect_timeout=app.config['OPENAI_CONNECT_TIMEOUT'],
+        read_timeout=app.config['OPENAI_READ_TIMEOUT'],
+        max_retries=app.config['OPENAI_MAX_RETRIES'],
+        pool_size=app.config['OPENAI_POOL_SIZE'],
+        breaker_threshold=app.config['OPENAI_BREAKER_THRESHOLD'],
+        breaker_reset=app.config['OPENAI_BREAKER_RESET']
+    )
+    services['meal_plan_cache'] = MealPlanCache(app.config['MEAL_PLAN_CACHE_PATH'], app.config['MEAL_PLAN_CACHE_MAX_BYTES'])
+    # Starts no process until the first batch, so a pre-forking master never uses its own
+    services['batch_pool'] = make_batch_pool(app.config['BATCH_WORKERS'] or app.config['SOLVER_CONCURRENCY'])
+
+def create_app(config=None):
+    """Application factory: configuration from the environment (overridden by ``config``), services and routes.
+
+    Nothing is loaded here; the production entry point (wsgi.py) calls
+    warm_up() before forking workers.
+    """
+    app = Flask(__name__)
+    CORS(app)
+    load_config(app)
+    if config:
+        app.config.update(config)
+    logging.basicConfig(level=app.config['LOG_LEVEL'])
+    logging.getLogger().setLevel(app.config['LOG_LEVEL'])
+    # Catalog is loaded once per process (or once in the master before forking) and refreshed only when food.db changes
+    app.extensions['diet'] = {'catalog_cache': CatalogCache(app.config.get('CATALOG_DB_PATH') or DB_PATH)}
+    init_process_services(app)
+    app.register_blueprint(bp)
+    return app
+
+def warm_up(app):
+    """Loads the catalog, its taxonomy and allergen indexes and the solver templates, then runs one solve.
+
+    Meant for the master process of a pre-forking server, so workers share
+    all of it copy-on-write and the first real request is not cold.
+    Returns {stage: seconds}; stages are also exported as diet_startup_seconds.
+    """
+    timings = {}
+    started = time.perf_counter()
+
+    def stage(name, fn):
+        stage_started = time.perf_counter()
+        result = fn()
+        timings[name] = time.perf_counter() - stage_started
+        STARTUP_SECONDS.set(timings[name], stage=name)
+        return result
+
+    with app.app_context():
+        # Taxonomy tags and allergen bitsets are built with the snapshot
+        catalog = stage('catalog_load', catalog_cache.get)
+        CATALOG_PRODUCTS.set(len(catalog.foods))
+        if linprog is not None:
+            # Sensitivity, sweeps and the 'highs' backend all solve on the resident template
+            stage('model_template', lambda: get_model_template(catalog))
+        stage('presolve_index', lambda: presolve_products(catalog, catalog.all_products))
+        profile, _ = parse_profile({})
+        stage('warmup_solve', lambda: solve_profile(catalog, profile, app.config['DIET_SOLVER']))
+    timings['total'] = time.perf_counter() - started
+    STARTUP_SECONDS.set(timings['total'], stage='total')
+    logging.info("Warm-up finished in %.2f s (%s)", timings['total'],
+                 ', '.join(f"{name} {seconds:.2f} s" for name, seconds in timings.items() if name != 'total'))
+    if timings['total'] > app.config['STARTUP_BUDGET']:
+        logging.warning(f"Warm-up took {timings['total']:.1f} s, over the {app.config['STARTUP_BUDGET']:.0f} s startup budget")
+    return timings
+
+def after_fork(app):
+    """Re-creates per-process state in a freshly forked worker.
+
+    The catalog snapshot and model templates stay shared with the master;
+    the catalog's SQLite watch connection, Highs instances and all
+    per-process services are replaced.
+    """
+    app.extensions['diet']['catalog_cache'].after_fork()
+    reset_solver_instances()
+    init_process_services(app)
+    memory = process_memory()
+    logging.info(f"Worker {os.getpid()} ready: rss {memory.get('rss', 0) / 2 ** 20:.1f} MB, "
+                 f"pss {memory.get('pss', 0) / 2 ** 20:.1f} MB")
+
+def _service(name):
+    # Module-level handle on a service of the app handling the current request
+    return LocalProxy(lambda: current_app.extensions['diet'][name])
+
+catalog_cache = _service('catalog_cache')
+solver_scheduler = _service('solver_scheduler')
+result_cache = _service('result_cache')
+optimization_results = _service('optimization_results')
+meal_plan_jobs = _service('meal_plan_jobs')
+llm_client = _service('llm_client')
+meal_plan_cache = _service('meal_plan_cache')
+batch_pool = _service('batch_pool')
+
+def in_app_context(fn):
+    """Wraps ``fn`` to run inside the current app's context, e.g. on a job thread."""
+    app = current_app._get_current_object()
+
+    def run(*args, **kwargs):
+        with app.app_context():
+            return fn(*args, **kwargs)
+    return run
+
+def current_catalog():
+    """Current catalog snapshot (reloaded only if the DB changed), timed as the 'catalog_load' stage."""
+    with timed('catalog_load'):
+        catalog = catalog_cache.get()
+    CATALOG_PRODUCTS.set(len(catalog.foods))
+    return catalog
+
+def solver_busy_response(payload):
+    """503 response telling the client when to retry a solve refused by admission control."""
+    response = jsonify(payload)
+    response.status_code = 503
+    response.headers['Retry-After'] = str(current_app.config['SOLVER_RETRY_AFTER'])
+    return response
+
+@bp.before_app_request
+def start_timing():
+    g.started = time.perf_counter()
+    start_request()
+
+@bp.after_app_request
+def record_timing(response):
+    """Reports per-stage timings in a Server-Timing header and records request metrics."""
+    elapsed = time.perf_counter() - g.get('started', time.perf_counter())
+    timings = request_timings() + [('total', elapsed)]
+    response.headers['Server-Timing'] = server_timing_header(timings)
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    HTTP_REQUESTS.inc(endpoint=endpoint, code=response.status_code)
+    HTTP_SECONDS.observe(elapsed, endpoint=endpoint)
+    return response
+
+def build_chatgpt_request(diet_data, user_info):
+    """Builds the chat completions request body for a meal plan."""
+    # Prepare product list for ChatGPT
+    products_info = []
+    for product, amount in diet_data['diet'].items():
+        products_info.append(f"- {product}: {amount}g")
     
-    # Scale only macronutrients and calories for the period
-    # Vitamins and minerals remain daily norms
-    energy_nutrients = ['protein', 'fat', 'carbs', 'kj', 'kcal']
-    for nut in energy_nutrients:
-        if nut in norms:
-            norms[nut] *= period_days
-    for nut in norms_upper:
-        if nut in energy_nutrients:
-            norms_upper[nut] *= period_days
-    return norms, norms_upper
-
-nut_keys = ['protein', 'fat', 'carbs', 'kj', 'kcal', 'A', 'B1', 'B2', 'PP', 'C', 'Ca', 'P', 'Fe']
-
-def generate_meal_plan_with_chatgpt(diet_data, user_info):
-    """Generates a meal plan using ChatGPT based on optimized diet data."""
-    try:
-        # Get API key from environment
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            return {'error': 'OpenAI API key not found. Please set OPENAI_API_KEY environment variable.'}
-        
-        # Prepare product list for ChatGPT
-        products_info = []
-        for product, amount in diet_data['diet'].items():
-            products_info.append(f"- {product}: {amount}g")
-        
-        products_text = '\n'.join(products_info)
-        
-        # Build the prompt in Latvian
-        prompt = f"""
+    products_text = '\n'.join(products_info)
+    
+    # Build the prompt in Latvian
+    prompt = f"""
 Tu esi profesionāls uztura speciālists. Izveido detalizētu ēdienkārtu, pamatojoties uz šiem produktiem un to daudzumiem:
 
 PRODUKTI UN DAUDZUMI:
@@ -115,101 +274,80 @@ Formatē atbildi skaidrā, organizētā veidā ar sadaļām katrai maltītei un
 ATBILDEI JĀBŪT LATVIEŠU VALODĀ!
 """
 
-        # Send request to ChatGPT
-        headers = {
-            'Authorization': f'Bearer {api_key}',
-            'Content-Type': 'application/json'
-        }
-        
-        data = {
-            'model': 'gpt-3.5-turbo',
-            'messages': [
-                {
-                    'role': 'system',
-                    'content': 'Tu esi profesionāls uztura speciālists ar plašu pieredzi ēdienkārtu izveidē un uztura ieteikumos. Atbildi vienmēr latviešu valodā.'
-                },
-                {
-                    'role': 'user',
-                    'content': prompt
-                }
-            ],
-            'max_tokens': 1500,
-            'temperature': 0.7
-        }
-        
-        response = requests.post(
-            'https://api.openai.com/v1/chat/completions',
-            headers=headers,
-            json=data,
-            timeout=30
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            meal_plan = result['choices'][0]['message']['content']
-            return {'meal_plan': meal_plan, 'success': True}
-        else:
-            error_msg = f"ChatGPT API error: {response.status_code} - {response.text}"
-            logging.error(error_msg)
-            return {'error': error_msg, 'success': False}
-            
-    except requests.exceptions.Timeout:
-        return {'error': 'ChatGPT API timeout. Please try again.', 'success': False}
-    except requests.exceptions.RequestException as e:
-        return {'error': f'Network error: {str(e)}', 'success': False}
+    # The model is filled in by the LLM client from its configuration
+    data = {
+        'messages': [
+            {
+                'role': 'system',
+                'content': 'Tu esi profesionāls uztura speciālists ar plašu pieredzi ēdienkārtu izveidē un uztura ieteikumos. Atbildi vienmēr latviešu valodā.'
+            },
+            {
+                'role': 'user',
+                'content': prompt
+            }
+        ],
+        'max_tokens': 1500,
+        'temperature': 0.7
+    }
+    return data
+
+def meal_plan_key(body):
+    """Cache key of a meal plan request, including the model it is sent to."""
+    return meal_plan_cache_key(dict(body, model=llm_client.model))
+
+def generate_meal_plan_with_chatgpt(diet_data, user_info, force_refresh=False):
+    """Generates a meal plan using ChatGPT based on optimized diet data.
+
+    Identical prompts are answered from the meal plan cache unless
+    ``force_refresh`` is set; concurrent identical requests share one call.
+    """
+    if not llm_client.api_key:
+        return {'error': 'OpenAI API key not found. Please set OPENAI_API_KEY environment variable.'}
+    try:
+        body = build_chatgpt_request(diet_data, user_info)
+
+        def call_llm():
+            with timed('llm'):
+                return llm_client.chat(body)
+
+        meal_plan, cache_state = meal_plan_cache.get_or_generate(meal_plan_key(body), call_llm, force_refresh)
+        return {'meal_plan': meal_plan, 'success': True, 'cache': cache_state}
+    except LLMClientError as e:
+        logging.error(str(e))
+        return {'error': str(e), 'success': False}
     except Exception as e:
         logging.error(f"Unexpected error in ChatGPT integration: {str(e)}")
         return {'error': f'Unexpected error: {str(e)}', 'success': False}
 
-def load_products_from_db():
-    """Loads products from the SQLite database."""
-    import os
-    db_path = os.path.join(os.path.dirname(__file__), 'db', 'food.db')
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT * FROM products")
-    
-    rows = cursor.fetchall()
-    conn.close()
-    
-    foods = []
-    for row in rows:
-        # Determine if lactose is present in allergens
-        has_lactose = 'laktoze' in str(row[15]).lower() if row[15] else False
-        
-        food = {
-            'id': row[0],
-            'name': row[1],
-            'protein': row[2] or 0,
-            'fat': row[3] or 0,
-            'carbs': row[4] or 0,
-            'kj': row[5] or 0,
-            'kcal': row[6] or 0,
-            'A': row[7] or 0,
-            'B1': row[8] or 0,
-            'B2': row[9] or 0,
-            'PP': row[10] or 0,
-            'C': row[11] or 0,
-            'Ca': row[12] or 0,
-            'P': row[13] or 0,
-            'Fe': row[14] or 0,
-            'price_per_100g': row[16] or 0,
-            'has_lactose': has_lactose,
-            'allergens': row[15] or ''
-        }
-        # Filter out erroneous or service rows
-        name_normalized = str(food['name']).strip().lower()
-        # Also blocklist specific fats we do not want to use
-        name_no_diacritics = ''.join(c for c in unicodedata.normalize('NFKD', name_normalized) if not unicodedata.combining(c))
-        blocked = {'dienas norma', 'kombinetie tauki', 'cukas tauki'}
-        if name_normalized in blocked or name_no_diacritics in blocked or not name_normalized:
-            continue
-        foods.append(food)
-    
-    return foods
+def stream_meal_plan_with_chatgpt(diet_data, user_info, force_refresh=False):
+    """Streams a ChatGPT meal plan; yields {'content': delta} chunks, or {'error': ...} and stops.
+
+    Like generate_meal_plan_with_chatgpt() it goes through the meal plan
+    cache's single-flight path: a cached plan, or one another request is
+    generating, is sent as a single chunk once ready; a completed stream
+    is stored in the cache.
+    """
+    if not llm_client.api_key:
+        yield {'error': 'OpenAI API key not found. Please set OPENAI_API_KEY environment variable.'}
+        return
+    body = build_chatgpt_request(diet_data, user_info)
+
+    def stream():
+        with timed('llm'):
+            yield from llm_client.stream_chat(body)
+
+    try:
+        for delta, _ in meal_plan_cache.stream_or_generate(meal_plan_key(body), stream, force_refresh):
+            yield {'content': delta}
+    except LLMClientError as e:
+        logging.error(str(e))
+        yield {'error': str(e)}
 
-@app.route('/tdee', methods=['POST'])
+def sse_event(event, data):
+    """Formats one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@bp.route('/tdee', methods=['POST'])
 def calculate_tdee():
     """Calculate Total Daily Energy Expenditure."""
     data = request.json
@@ -233,345 +371,177 @@ def calculate_tdee():
     
     return jsonify({'kcal': round(eer_kcal, 2), 'bmr': round(bmr, 2)})
 
-@app.route('/optimize', methods=['POST'])
+@bp.route('/tdee/batch', methods=['POST'])
+def calculate_tdee_batch():
+    """BMR, EER and EFSA norms for many profiles, streaming one NDJSON line per chunk of rows.
+
+    Input is columnar: a JSON object of gender, weight, height, age,
+    activity and period lists, or a CSV file with those headers (uploaded
+    as ``file`` or sent as text/csv).
+    """
+    if not HAVE_NUMPY:
+        return jsonify({'error': 'Batch norms need NumPy installed on the server'}), 501
+    if 'file' in request.files:
+        data = read_csv_columns(line.decode('utf-8-sig') for line in request.files['file'].stream)
+    elif request.mimetype == 'text/csv':
+        data = read_csv_columns(request.get_data(as_text=True).splitlines())
+    else:
+        data = request.get_json(silent=True)
+    columns, error = profile_columns(data, current_app.config['TDEE_BATCH_MAX_ITEMS'])
+    if error:
+        return jsonify({'error': error}), 400
+    chunks = iter_norm_chunks(columns, current_app.config['TDEE_BATCH_CHUNK_SIZE'])
+
+    def generate():
+        for chunk in chunks:
+            yield json.dumps(chunk) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@bp.route('/catalog/stats', methods=['GET'])
+def catalog_stats():
+    """Returns catalog cache hit/miss counters and the loaded version."""
+    return jsonify(catalog_cache.stats())
+
+@bp.route('/catalog/reload', methods=['POST'])
+def reload_catalog():
+    """Forces a catalog reload, e.g. after prices were updated."""
+    catalog_cache.reload()
+    return jsonify(catalog_cache.stats())
+
+@bp.route('/llm/stats', methods=['GET'])
+def llm_stats():
+    """Returns LLM client latency, retry and circuit breaker counters."""
+    return jsonify(llm_client.stats())
+
+@bp.route('/solver/stats', methods=['GET'])
+def solver_stats():
+    """Returns running/waiting solves and admission counters."""
+    return jsonify(solver_scheduler.stats())
+
+@bp.route('/meal-plan/cache/stats', methods=['GET'])
+def meal_plan_cache_stats():
+    """Returns meal plan cache size, hit/miss and single-flight counters."""
+    return jsonify(meal_plan_cache.stats())
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Stage timings, solver status, catalog and worker memory counters in the Prometheus text format."""
+    record_process_memory()
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/optimize', methods=['POST'])
 def optimize_diet():
-    data = request.json
-    if not isinstance(data, dict):
-        return jsonify({'error': 'Invalid input: JSON object required'}), 400
-
-    allergens = data.get('allergens', [])
-    gender = data.get('gender', 'male').lower()
-    try:
-        weight = float(data.get('weight', 70 if gender == 'male' else 60))
-        height = float(data.get('height', 175 if gender == 'male' else 165))
-        age = float(data.get('age', 30))
-        if weight <= 0 or height <= 0 or age <= 0:
-            return jsonify({'error': 'Invalid input: weight, height, and age must be positive'}), 400
-        bmi = weight / ((height / 100) ** 2)
-        if bmi < 18.5:
-            logging.warning(f"BMI {bmi:.1f} is underweight")
-    except (TypeError, ValueError):
-        return jsonify({'error': 'Invalid input: weight, height, and age must be numeric'}), 400
-
-    activity = data.get('activity', 'sedentary')
-    period = data.get('period', 'week')
-    period_days = 7 if period.lower() == 'week' else 1
-
-    bmr = calculate_bmr(gender, weight, height, age)
-    eer_kcal = calculate_energy_needs(bmr, activity)
-    norms, norms_upper = get_efsa_norms(gender, weight, age, eer_kcal, period_days)
-
-    # Load products from DB
-    foods = load_products_from_db()
-
-    # Filter products by allergens
-    available_foods = []
-    excluded_by_allergen = []
-    for food in foods:
-        # Check each allergen
-        skip_food = False
-        # Normalize allergen string from DB for robust matching
-        food_allergens_norm = ''.join(c for c in unicodedata.normalize('NFKD', (food.get('allergens') or '').lower()) if not unicodedata.combining(c))
-        # Map common input allergens to Latvian DB keywords (normalized/ascii)
-        allergen_map = {
-            'lactose': ['laktoze'],
-            'milk': ['piens', 'laktoze'],
-            'gluten': ['glutens', 'kviesi', 'rudzi', 'miezi', 'auzas'],
-            'eggs': ['olas', 'olu'],
-            'soy': ['soja'],
-            'nuts': ['rieksti', 'zemesrieksti', 'mandeles', 'lazdu', 'valrieksti'],
-            'sesame': ['sezama'],
-            'sulfites': ['sulfiti'],
-            'fish': ['zivis', 'zivju']
-        }
-        for allergen in allergens:
-            key = str(allergen or '').strip().lower()
-            if key == 'lactose' and food['has_lactose']:
-                skip_food = True
-                excluded_by_allergen.append({'name': food['name'], 'reason': 'lactose'})
-                break
-            patterns = allergen_map.get(key, [])
-            if patterns and any(p in food_allergens_norm for p in patterns):
-                skip_food = True
-                excluded_by_allergen.append({'name': food['name'], 'reason': key})
-                break
-        if not skip_food:
-            available_foods.append(food)
-
-    # Optional vegetarian filter based on request
-    # Accept either diet_type == 'vegetarian' or vegetarian == True
-    diet_type = str(data.get('diet_type', '')).strip().lower()
-    vegetarian_flag = bool(data.get('vegetarian', False)) or diet_type == 'vegetarian'
-    if vegetarian_flag:
-        def is_meat_or_fish(name: str) -> bool:
-            n = name.strip().lower()
-            meat_keywords = ['gaļa', 'cūk', 'liellop', 'vistas', 'vista', 'teļa', 'tītara', 'truša', 'zoss', 'pīles']
-            fish_keywords = ['ziv', 'siļķ', 'šprot', 'lasis', 'zandarts', 'menca', 'līdaka', 'karpa', 'kaviār']
-            offal_keywords = ['aknas', 'smadzenes']
-            processed_keywords = ['desa', 'šķiņķ', 'cīsiņ', 'žāvētā']
-            return any(k in n for k in meat_keywords + fish_keywords + offal_keywords + processed_keywords)
-        available_foods = [f for f in available_foods if not is_meat_or_fish(f['name'])]
-    
-    if not available_foods:
-        return jsonify({'error': 'No foods available after applying restrictions'})
-
-    model = LpProblem("Budget_Diet_Optimization", LpMinimize)
-    # Safe solver variable names and per-product caps
-    per_product_weekly_cap_units = 10 if period_days == 7 else 3
-
-    def make_safe_var(name: str) -> str:
-        base = ''.join(ch if ch.isalnum() else '_' for ch in name)
-        base = base.strip('_') or 'var'
-        return base
-
-    name_to_var = {}
-    used = set()
-    for f in available_foods:
-        candidate = make_safe_var(f['name'])
-        v = candidate
-        idx = 2
-        while v in used:
-            v = f"{candidate}_{idx}"
-            idx += 1
-        used.add(v)
-        name_to_var[f['name']] = v
-
-    x_vars = {name_to_var[f['name']]: LpVariable(name_to_var[f['name']], lowBound=0, upBound=min(3 * period_days, per_product_weekly_cap_units)) for f in available_foods}
-    x_by_name = {f['name']: x_vars[name_to_var[f['name']]] for f in available_foods}
-
-    # Objective: price + small health-aware nudges
-    # price term dominates, nudges push away from sweets/refined grains and toward vegetables/whole grains/legumes
-    price_term = lpSum(f['price_per_100g'] * x_by_name[f['name']] for f in available_foods)
-
-    for nut in nut_keys:
-        model += lpSum(f[nut] * x_by_name[f['name']] for f in available_foods) >= norms[nut], f"Min_{nut}"
-    for nut in ['protein', 'fat', 'carbs', 'kcal', 'kj']:
-        if nut in norms_upper:
-            model += lpSum(f[nut] * x_by_name[f['name']] for f in available_foods) <= norms_upper[nut], f"Max_{nut}"
-
-    # WHO: limit free sugar to ≤50g/day; cap pure sugar product 'Cukurs' (100g per unit)
-    cukurs_names = []
-    for n in x_by_name.keys():
-        norm = ''.join(c for c in unicodedata.normalize('NFKD', n.lower()) if not unicodedata.combining(c))
-        if 'cukurs' in norm:
-            cukurs_names.append(n)
-    if cukurs_names:
-        cukurs_total_units = lpSum(x_by_name[n] for n in cukurs_names)
-        if bool(data.get('no_added_sugar', False)):
-            model += cukurs_total_units == 0.0, "No_Added_Sugar_Cukurs"
-        else:
-            model += cukurs_total_units <= 0.5 * period_days, "Max_Added_Sugar_Cukurs"
-
-    # Categorize foods by keywords for realistic constraints
-    names = {f['name'] for f in available_foods}
-    def normalize_text(text: str) -> str:
-        # Lowercase, strip spaces, remove diacritics for robust matching
-        t = (text or '').strip().lower()
-        return ''.join(c for c in unicodedata.normalize('NFKD', t) if not unicodedata.combining(c))
-
-    normalized_name_map = {name: normalize_text(name) for name in names}
-
-    def in_names(keyword_list):
-        # keyword_list should be normalized (ascii, no diacritics)
-        return [name for name in names if any(kw in normalized_name_map[name] for kw in keyword_list)]
-
-    oils = in_names(['ella'])
-    refined_grains = in_names(['makaroni', 'mannas', 'milti', 'maize'])
-    whole_grains = in_names(['griki', 'auzu', 'rudzu', 'miezu', 'putraimi', 'risi', 'grubas'])
-    legumes = in_names(['zirn', 'pupi', 'lec', 'soja'])
-    vegetables = in_names(['tomat', 'gurk', 'burkan', 'biet', 'kapost', 'spinat', 'salat', 'redis', 'kirb', 'kartupel', 'kabac', 'pipar', 'sipol', 'purav', 'skaben'])
-    fruits = in_names(['abol', 'apelsin', 'banan', 'vinog', 'upen', 'aven', 'zemen', 'mandarin', 'bumbier', 'plum', 'citron', 'dzerven', 'bruklen', 'aprikoz', 'persik', 'kirs'])
-    offal = in_names(['aknas', 'smadzenes'])
-    fish = in_names(['ziv', 'silk', 'sprot', 'lasis', 'zandarts', 'menca', 'lidaka', 'karpa', 'kaviar', 'kilav'])
-    poultry = in_names(['vistas', 'vista', 'titara', 'piles', 'zoss'])
-    red_meat = in_names(['liellopu', 'cuka', 'tela', 'aita', 'jera', 'cukas'])
-    processed_meat = in_names(['desa', 'skink', 'cisin', 'zavet'])
-    sweets = in_names(['sokolade', 'konfekt', 'marmelad', 'cepumi', 'kakao', 'karamel'])
-    potatoes = in_names(['kartupel'])
-    pasta = in_names(['makaroni'])
-
-    # Health-aware nudges in objective (very small weights)
-    nudge_penalty = lpSum(0.01 * x_by_name[n] for n in (sweets + refined_grains)) if (sweets or refined_grains) else 0
-    nudge_reward = lpSum(-0.005 * x_by_name[n] for n in (vegetables + whole_grains + legumes)) if (vegetables or whole_grains or legumes) else 0
-    model += price_term + nudge_penalty + nudge_reward, "Total_Cost_With_Health_Nudges"
-
-    # Oils: ≤30g/day (WHO) → 210g/week → 2.1 units/week
-    if oils:
-        model += lpSum(x_by_name[name] for name in oils) <= (0.3 * period_days), "Max_Oil"
-
-    # Offal: ≤200g/week → 2 units/week
-    if offal:
-        if period_days == 7:
-            model += lpSum(x_by_name[name] for name in offal) <= 2.0, "Max_Offal_Week"
-        else:
-            model += lpSum(x_by_name[name] for name in offal) <= 0.3, "Max_Offal_Day"
+    """Optimizes the diet for one profile.
 
-    # Vegetables: ≥400g/day (WHO) → 2800g/week → 28 units/week
-    if vegetables:
-        model += lpSum(x_by_name[name] for name in vegetables) >= (4.0 * period_days), "Min_Vegetables"
-
-    # Fruits: ≥200g/day (practical minimum) → 1400g/week → 14 units/week
-    if fruits:
-        model += lpSum(x_by_name[name] for name in fruits) >= (2.0 * period_days), "Min_Fruits"
-
-    # Legumes: ≥600g/week → 6 units/week (or 1 unit/day)
-    if legumes:
-        if period_days == 7:
-            model += lpSum(x_by_name[name] for name in legumes) >= 6.0, "Min_Legumes_Week"
-        else:
-            model += lpSum(x_by_name[name] for name in legumes) >= 1.0, "Min_Legumes_Day"
-
-    # Refined grains: ≤200g/day → 1400g/week → 14 units/week
-    if refined_grains:
-        model += lpSum(x_by_name[name] for name in refined_grains) <= (2.0 * period_days), "Max_Refined_Grains"
-
-    # Whole grains should be ≥ refined grains to encourage healthy choices
-    if whole_grains and refined_grains:
-        model += lpSum(x_by_name[name] for name in whole_grains) >= lpSum(x_by_name[name] for name in refined_grains), "Min_Whole_vs_Refined"
-
-    # WHO: red meat ≤500g/week (5 units/week)
-    if red_meat:
-        if period_days == 7:
-            model += lpSum(x_by_name[name] for name in red_meat) <= 5.0, "Max_Red_Meat_Week"
-        else:
-            model += lpSum(x_by_name[name] for name in red_meat) <= 0.7, "Max_Red_Meat_Day"
-
-    # WHO: processed meat ideally 0; enforce zero consumption
-    if processed_meat:
-        model += lpSum(x_by_name[name] for name in processed_meat) == 0.0, "No_Processed_Meat"
-
-    # Limit sweets (chocolate/candies/cookies/cocoa) to ≤100g/day → 1 unit/day
-    if sweets:
-        model += lpSum(x_by_name[name] for name in sweets) <= (1.0 * period_days), "Max_Sweets"
-
-    # Optional caps to avoid over-reliance on cheap starches
-    if potatoes:
-        if period_days == 7:
-            model += lpSum(x_by_name[name] for name in potatoes) <= 7.0, "Max_Potatoes_Week"
-        else:
-            model += lpSum(x_by_name[name] for name in potatoes) <= 1.0, "Max_Potatoes_Day"
-    if pasta:
-        if period_days == 7:
-            model += lpSum(x_by_name[name] for name in pasta) <= 7.0, "Max_Pasta_Week"
-        else:
-            model += lpSum(x_by_name[name] for name in pasta) <= 1.0, "Max_Pasta_Day"
+    With ``?sensitivity=true`` the payload also carries shadow prices of the
+    active constraints, reduced costs and price ranges per product.
+    """
+    profile, error = parse_profile(request.json)
+    if error:
+        return jsonify({'error': error}), 400
 
+    catalog = current_catalog()
+    sensitivity = request.args.get('sensitivity', '').lower() in ('1', 'true', 'yes')
+    try:
+        payload = optimize_profile(catalog, profile, current_app.config['DIET_SOLVER'], result_cache,
+                                   current_app.config['RESULT_CACHE_NORM_DIGITS'], sensitivity, solver_scheduler)
+    except SolverBusyError as e:
+        return solver_busy_response({'error': str(e)})
+    if 'error' not in payload:
+        # Pass result_id to /meal-plan to skip solving the same diet again
+        payload['result_id'] = result_id(payload)
+        optimization_results.set(payload['result_id'], payload)
+    return jsonify(payload)
+
+@bp.route('/optimize/batch', methods=['POST'])
+def optimize_diet_batch():
+    """Optimizes a list of profiles, streaming one NDJSON line per finished solve."""
+    data = request.json
+    profiles = data.get('profiles') if isinstance(data, dict) else data
+    if not isinstance(profiles, list):
+        return jsonify({'error': 'Invalid input: list of profiles required'}), 400
+    if len(profiles) > current_app.config['BATCH_MAX_ITEMS']:
+        return jsonify({'error': f"Invalid input: at most {current_app.config['BATCH_MAX_ITEMS']} profiles per batch"}), 400
+
+    catalog = current_catalog()
+    # Batch solves run on the process's batch pool, each item admitted through the solver scheduler;
+    # slots are released from the pool's thread, outside the app context, so it gets the scheduler itself
+    items = iter_optimize_batch(profiles, catalog, current_app.config['DIET_SOLVER'], batch_pool,
+                                solver_scheduler._get_current_object(), result_cache,
+                                current_app.config['RESULT_CACHE_NORM_DIGITS'], current_app.config['SOLVER_TIME_BUDGET'])
+
+    def generate():
+        for item in items:
+            yield json.dumps(item, ensure_ascii=False) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@bp.route('/optimize/household', methods=['POST'])
+def optimize_diet_household():
+    """Plans the diets of several people in one solve, buying food for the whole household.
+
+    The body has ``members`` (a list of /optimize profiles, optionally
+    ``name``d), a shared ``period`` and optional ``pack_sizes`` in grams
+    (one size for every product or {product name: grams}), which rounds
+    purchases up to whole packs.
+    """
+    catalog = current_catalog()
+    household, error = parse_household(request.json, catalog, current_app.config['HOUSEHOLD_MAX_MEMBERS'])
+    if error:
+        return jsonify({'error': error}), 400
 
-    # Additional public-health aligned constraints (add only if applicable):
-    # AHA: fish at least ~450g/week (two ~225g servings)
-    if not vegetarian_flag and fish:
-        if period_days == 7:
-            model += lpSum(x_by_name[name] for name in fish) >= 4.5, "Min_Fish_Week"
-        else:
-            model += lpSum(x_by_name[name] for name in fish) >= 0.7, "Min_Fish_Day"
-
-    # Ensure presence of animal protein (meat/poultry/fish) unless vegetarian
-    if not vegetarian_flag and (red_meat or poultry or fish):
-        animal_groups = []
-        if red_meat:
-            animal_groups.append(lpSum(x_by_name[name] for name in red_meat))
-        if poultry:
-            animal_groups.append(lpSum(x_by_name[name] for name in poultry))
-        if fish:
-            animal_groups.append(lpSum(x_by_name[name] for name in fish))
-        if animal_groups:
-            min_units = 3.0 if period_days == 7 else 0.5
-            model += lpSum(animal_groups) >= min_units, "Min_Animal_Protein"
-
-    # Encourage land animal protein presence as well (poultry or red meat) unless vegetarian
-    if not vegetarian_flag and (poultry or red_meat):
-        land_groups = []
-        if poultry:
-            land_groups.append(lpSum(x_by_name[name] for name in poultry))
-        if red_meat:
-            land_groups.append(lpSum(x_by_name[name] for name in red_meat))
-        if land_groups:
-            min_land_units = 3.0 if period_days == 7 else 0.5
-            model += lpSum(land_groups) >= min_land_units, "Min_Land_Animal_Protein"
-
-
-    solver = PULP_CBC_CMD(options=['primal', '-feasTol 1e-6'], msg=False)
-    status = model.solve(solver)
-
-    if LpStatus[status] != 'Optimal':
-        error_msg = {'error': 'No optimal solution found', 'status': LpStatus[status]}
-        if LpStatus[status] == 'Infeasible':
-            error_msg['details'] = 'Infeasible constraints. Possible issues:'
-            for nut in nut_keys:
-                total = sum(f[nut] * value(x_by_name[f['name']]) for f in available_foods)
-                if total < norms[nut]:
-                    error_msg['details'] += f" {nut} ({total:.2f} < {norms[nut]:.2f})"
-        return jsonify(error_msg)
-
-    # Build detailed diet items with nutrition data
-    diet_items = []
-    for food in available_foods:
-        name = food['name']
-        if name in x_by_name and value(x_by_name[name]) > 0:
-            units = value(x_by_name[name])
-            grams = round(units * 100, 2)
-            diet_items.append({
-                'name': name,
-                'grams': grams,
-                'kcal': round(food['kcal'] * units, 2),
-                'protein': round(food['protein'] * units, 2),
-                'fat': round(food['fat'] * units, 2),
-                'carbs': round(food['carbs'] * units, 2),
-                'cost': round(food['price_per_100g'] * units, 2)
-            })
-    
-    # Also keep simple dict format for backwards compatibility
-    diet = {item['name']: item['grams'] for item in diet_items}
-    
-    total_cost = round(value(model.objective), 2)
-    nutrient_totals = {nut: round(sum(f[nut] * value(x_by_name[f['name']]) for f in available_foods), 2) for nut in nut_keys}
-
-    # Coverage block (grams per category)
-    def sum_grams(group):
-        return round(sum(value(x_by_name[n]) * 100 for n in group if n in x_by_name), 2)
-    coverage = {
-        'fish': sum_grams(fish),
-        'poultry': sum_grams(poultry),
-        'red_meat': sum_grams(red_meat),
-        'whole_grains': sum_grams(whole_grains),
-        'refined_grains': sum_grams(refined_grains),
-        'vegetables': sum_grams(vegetables),
-        'fruits': sum_grams(fruits),
-        'legumes': sum_grams(legumes),
-        'sweets': sum_grams(sweets)
-    }
+    try:
+        payload = optimize_household(catalog, household, current_app.config['DIET_SOLVER'], result_cache,
+                                     current_app.config['RESULT_CACHE_NORM_DIGITS'], solver_scheduler)
+    except SolverBusyError as e:
+        return solver_busy_response({'error': str(e)})
+    return jsonify(payload)
+
+@bp.route('/optimize/plan', methods=['POST'])
+def optimize_diet_plan():
+    """Plans ``days`` days (default 7) one by one, each meeting the daily norms.
+
+    The body is an /optimize profile plus ``days`` and ``max_repeats``,
+    the most days any product may appear on. Weekly limits such as
+    Max_Red_Meat_Week apply to the plan as a whole.
+    """
+    plan, error = parse_plan(request.json, current_app.config['PLAN_MAX_DAYS'], current_app.config['PLAN_MAX_REPEATS'])
+    if error:
+        return jsonify({'error': error}), 400
 
-    return jsonify({
-        'diet': diet,
-        'items': diet_items,  # Detailed items with all nutrition info
-        'total_cost': total_cost,
-        'nutrient_totals': nutrient_totals,
-        'norms': {nut: round(norms[nut], 2) for nut in norms},
-        'period': period,
-        'status': LpStatus[status],
-        'coverage': coverage,
-        'excluded_by_allergen': excluded_by_allergen
-    })
-
-@app.route('/meal-plan', methods=['POST'])
-def generate_meal_plan():
-    """Generates a ChatGPT meal plan based on the optimized diet."""
+    try:
+        payload = optimize_plan(current_catalog(), plan, current_app.config['DIET_SOLVER'], result_cache,
+                                current_app.config['RESULT_CACHE_NORM_DIGITS'], solver_scheduler,
+                                current_app.config['PLAN_WORKERS'])
+    except SolverBusyError as e:
+        return solver_busy_response({'error': str(e)})
+    return jsonify(payload)
+
+@bp.route('/optimize/sweep', methods=['POST'])
+def optimize_diet_sweep():
+    """Varies one product's price or one norm over a range and reports where the diet changes.
+
+    The body is an /optimize profile plus ``sweep``: ``{"product": name}`` or
+    ``{"norm": nutrient, "bound": "min"|"max"}`` with ``from`` and ``to``.
+    """
     data = request.json
-    if not isinstance(data, dict):
-        return jsonify({'error': 'Invalid input: JSON object required'}), 400
+    profile, error = parse_profile(data)
+    if error:
+        return jsonify({'error': error}), 400
+    spec, error = parse_sweep(data)
+    if error:
+        return jsonify({'error': error}), 400
 
-    # First, compute the optimized diet
-    diet_response = optimize_diet()
-    if isinstance(diet_response, tuple):  # Error path
-        return diet_response
-    
-    diet_data = diet_response.get_json()
-    
-    if 'error' in diet_data:
-        return jsonify(diet_data), 400
-    
-    # Prepare user info
-    user_info = {
+    try:
+        payload, status_code = sweep_profile(current_catalog(), profile, spec, solver_scheduler)
+    except SolverBusyError as e:
+        return solver_busy_response({'error': str(e)})
+    return jsonify(payload), status_code
+
+def meal_plan_user_info(data):
+    """User details passed to ChatGPT along with the diet."""
+    return {
         'gender': data.get('gender', 'male'),
         'weight': data.get('weight', 70),
         'height': data.get('height', 175),
@@ -579,26 +549,179 @@ def generate_meal_plan():
         'activity': data.get('activity', 'moderate'),
         'period': data.get('period', 'week')
     }
+
+def force_refresh_requested():
+    """True when the caller asked to bypass the meal plan cache with ``?refresh=true``."""
+    return request.args.get('refresh', '').lower() in ('1', 'true', 'yes')
+
+def resolve_diet(data, profile):
+    """Diet for a meal plan request; returns (diet_data, HTTP status).
+
+    Uses, in order: a ``result_id`` returned by /optimize, a ``diet``
+    mapping of product name to grams sent by the client, or a fresh solve
+    of the request profile (503 if the solver refuses it).
+    """
+    if data.get('result_id') is not None:
+        diet_data = optimization_results.get(str(data['result_id']))
+        if diet_data is None:
+            return {'error': 'Unknown or expired result_id'}, 404
+        return diet_data, 200
+
+    diet = data.get('diet')
+    if diet is not None:
+        if not isinstance(diet, dict) or not diet:
+            return {'error': 'Invalid input: diet must map product names to grams'}, 400
+        try:
+            diet = {str(name): float(grams) for name, grams in diet.items()}
+        except (TypeError, ValueError):
+            return {'error': 'Invalid input: diet must map product names to grams'}, 400
+        return {
+            'diet': diet,
+            'total_cost': data.get('total_cost'),
+            'nutrient_totals': data.get('nutrient_totals'),
+            'norms': data.get('norms', {nut: round(v, 2) for nut, v in profile['norms'].items()}),
+            'period': data.get('period', profile['period']),
+            'status': data.get('status', 'Optimal')
+        }, 200
+
+    catalog = current_catalog()
+    try:
+        diet_data = optimize_profile(catalog, profile, current_app.config['DIET_SOLVER'], result_cache,
+                                     current_app.config['RESULT_CACHE_NORM_DIGITS'], scheduler=solver_scheduler)
+    except SolverBusyError as e:
+        return {'error': str(e)}, 503
+    if 'error' in diet_data:
+        return diet_data, 400
+    return diet_data, 200
+
+def build_meal_plan(data, profile, force_refresh=False):
+    """Optimizes the diet (or reuses a given one) and generates a ChatGPT meal plan; returns (payload, HTTP status)."""
+    # First, get the optimized diet
+    diet_data, status_code = resolve_diet(data, profile)
+    if status_code != 200:
+        return diet_data, status_code
     
     # Generate a meal plan via ChatGPT
-    meal_plan_result = generate_meal_plan_with_chatgpt(diet_data, user_info)
+    meal_plan_result = generate_meal_plan_with_chatgpt(diet_data, meal_plan_user_info(data), force_refresh)
     
     if not meal_plan_result.get('success', False):
-        return jsonify({
+        return {
             'error': 'Failed to generate meal plan',
             'details': meal_plan_result.get('error', 'Unknown error')
-        }), 500
+        }, 500
     
     # Return the combined result
-    return jsonify({
+    return {
         'diet': diet_data['diet'],
         'total_cost': diet_data['total_cost'],
         'nutrient_totals': diet_data['nutrient_totals'],
         'norms': diet_data['norms'],
         'period': diet_data['period'],
         'status': diet_data['status'],
-        'meal_plan': meal_plan_result['meal_plan']
-    })
+        'meal_plan': meal_plan_result['meal_plan'],
+        'meal_plan_cache': meal_plan_result['cache']
+    }, 200
+
+@bp.route('/meal-plan', methods=['POST'])
+def generate_meal_plan():
+    """Queues a ChatGPT meal plan job; poll GET /meal-plan/<job_id> for the result.
+
+    With ``?wait=true`` the meal plan is generated synchronously instead;
+    ``?refresh=true`` regenerates it even if an identical one is cached.
+    """
+    data = request.json
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Invalid input: JSON object required'}), 400
+    profile, error = parse_profile(data)
+    if error:
+        return jsonify({'error': error}), 400
+
+    if request.args.get('wait', '').lower() in ('1', 'true', 'yes'):
+        payload, status_code = build_meal_plan(data, profile, force_refresh_requested())
+        if status_code == 503:
+            return solver_busy_response(payload)
+        return jsonify(payload), status_code
+
+    try:
+        job_id = meal_plan_jobs.submit(in_app_context(build_meal_plan), data, profile, force_refresh_requested())
+    except QueueFullError as e:
+        response = jsonify({'error': str(e)})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(current_app.config['MEAL_PLAN_RETRY_AFTER'])
+        return response
+    return jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': url_for('.meal_plan_status', job_id=job_id)
+    }), 202
+
+@bp.route('/meal-plan/stream', methods=['POST'])
+def stream_meal_plan():
+    """Streams a meal plan as Server-Sent Events.
+
+    Events: 'diet' (the optimized diet, sent first), 'token' (each piece of
+    LLM output as it arrives), then 'summary' with the full meal plan, or
+    'error' if the LLM call fails.
+    """
+    data = request.json
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Invalid input: JSON object required'}), 400
+    profile, error = parse_profile(data)
+    if error:
+        return jsonify({'error': error}), 400
+
+    diet_data, status_code = resolve_diet(data, profile)
+    if status_code == 503:
+        return solver_busy_response(diet_data)
+    if status_code != 200:
+        return jsonify(diet_data), status_code
+    user_info = meal_plan_user_info(data)
+    force_refresh = force_refresh_requested()
+
+    def generate():
+        started = time.perf_counter()
+        yield sse_event('diet', diet_data)
+        parts = []
+        for chunk in stream_meal_plan_with_chatgpt(diet_data, user_info, force_refresh):
+            if 'error' in chunk:
+                yield sse_event('error', {'error': 'Failed to generate meal plan', 'details': chunk['error']})
+                return
+            parts.append(chunk['content'])
+            yield sse_event('token', chunk)
+        yield sse_event('summary', {
+            'diet': diet_data['diet'],
+            'total_cost': diet_data['total_cost'],
+            'nutrient_totals': diet_data['nutrient_totals'],
+            'norms': diet_data['norms'],
+            'period': diet_data['period'],
+            'status': diet_data['status'],
+            'meal_plan': ''.join(parts),
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        })
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/meal-plan/<job_id>', methods=['GET'])
+def meal_plan_status(job_id):
+    """Returns the status of a meal plan job and, once finished, its result."""
+    job = meal_plan_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+
+    response = {'job_id': job_id, 'status': job['status']}
+    if job['status'] == 'succeeded':
+        payload, status_code = job['result']
+        if status_code != 200:
+            response['status'] = 'failed'
+            response['error'] = payload.get('error')
+            response['details'] = payload.get('details', payload.get('status'))
+        else:
+            response['result'] = payload
+    elif job['status'] == 'failed':
+        response['error'] = job['error']
+    return jsonify(response)
 
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=5000, debug=True)
\ No newline at end of file
+    # Development server; production runs wsgi.py under gunicorn (see gunicorn.conf.py)
+    create_app({'LOG_LEVEL': os.getenv('LOG_LEVEL', 'DEBUG').upper()}).run(host="127.0.0.1", port=5000, debug=True)
\ No newline at end of file
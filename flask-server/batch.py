@@ -0,0 +1,128 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+
+from catalog import CatalogSnapshot
+from catalog_store import CatalogColumns
+from diet_model import solve_budget
+from metrics import timed
+from optimizer import finish_payload, parse_profile, result_cache_key, solve_profile
+from scheduler import SolverBusyError
+
+# Catalog snapshot shared by every solve in a worker process, replaced when the version changes
+_worker_catalog = None
+
+
+def make_batch_pool(max_workers=None):
+    """Process pool for batch solves, meant to live as long as the server process.
+
+    Workers are started by a forkserver (spawn where that is unavailable),
+    never forked from a threaded server process, and map the catalog store
+    themselves, so a batch ships only its profiles.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    return ProcessPoolExecutor(max_workers=max_workers or os.cpu_count() or 1, mp_context=context)
+
+
+def _solve_in_worker(version, store_path, profile, backend, time_budget):
+    global _worker_catalog
+    if _worker_catalog is None or _worker_catalog.version != version:
+        _worker_catalog = CatalogSnapshot(version, CatalogColumns(store_path))
+    with solve_budget(time_budget):
+        return solve_profile(_worker_catalog, profile, backend)
+
+
+def iter_optimize_batch(profiles, catalog, backend='pulp', pool=None, scheduler=None, cache=None, norm_digits=3, time_budget=None):
+    """Solves a list of /optimize request bodies, yielding each payload as it finishes.
+
+    Every payload carries the ``index`` of its profile. Invalid input and
+    failed solves are reported per item (``error``/``status``) and do not
+    abort the batch. Cached profiles are answered without a solve; the rest
+    run on ``pool`` (see make_batch_pool), or in this thread without one.
+    Each solve is admitted by ``scheduler`` (SolverScheduler), holding one
+    of its slots while it runs; an item refused a slot is reported as
+    ``Busy``. Each solve gets ``time_budget`` seconds.
+    """
+    pending = []
+    for index, data in enumerate(profiles):
+        try:
+            profile, error = parse_profile(data)
+        except (AttributeError, TypeError) as e:
+            profile, error = None, f'Invalid input: {str(e)}'
+        if error:
+            yield {'index': index, 'error': error, 'status': 'Invalid'}
+            continue
+        key = result_cache_key(profile, catalog.version, norm_digits) if cache is not None else None
+        result = cache.get(key) if cache is not None else None
+        if result is not None:
+            yield dict(finish_payload(catalog, profile, result, 'hit'), index=index)
+            continue
+        pending.append((index, profile, key))
+
+    def finish(index, profile, key, result):
+        if cache is not None and result.get('status') != 'Time Limit':
+            cache.set(key, result)
+        return dict(finish_payload(catalog, profile, result, 'miss' if cache is not None else None), index=index)
+
+    def failed(index, e):
+        logging.error(f"Batch item {index} failed: {str(e)}")
+        return {'index': index, 'error': f'Unexpected error: {str(e)}', 'status': 'Error'}
+
+    def busy(index, e):
+        return {'index': index, 'error': str(e), 'status': 'Busy'}
+
+    if pool is None or len(pending) <= 1:
+        for index, profile, key in pending:
+            try:
+                with scheduler.slot() if scheduler is not None else nullcontext(), solve_budget(time_budget):
+                    result = solve_profile(catalog, profile, backend)
+            except SolverBusyError as e:
+                yield busy(index, e)
+                continue
+            except Exception as e:
+                yield failed(index, e)
+                continue
+            yield finish(index, profile, key, result)
+        return
+
+    def collect(future):
+        index, profile, key = futures.pop(future)
+        try:
+            result = future.result()
+        except Exception as e:
+            return failed(index, e)
+        return finish(index, profile, key, result)
+
+    futures = {}
+    try:
+        for index, profile, key in pending:
+            if scheduler is not None:
+                try:
+                    with timed('queue_wait'):
+                        scheduler.acquire()
+                except SolverBusyError as e:
+                    yield busy(index, e)
+                    continue
+            future = pool.submit(_solve_in_worker, catalog.version, catalog.columns.path, profile, backend, time_budget)
+            if scheduler is not None:
+                future.add_done_callback(lambda _: scheduler.release())
+            futures[future] = (index, profile, key)
+            for done in [f for f in futures if f.done()]:
+                yield collect(done)
+        for done in as_completed(list(futures)):
+            yield collect(done)
+    finally:
+        # A closed stream (client gone) drops the solves that have not started
+        for future in futures:
+            future.cancel()
+
+
+def optimize_batch(profiles, catalog, backend='pulp', pool=None, scheduler=None, cache=None, norm_digits=3, time_budget=None):
+    """Solves a list of /optimize request bodies and returns the payloads in input order."""
+    results = [None] * len(profiles)
+    for item in iter_optimize_batch(profiles, catalog, backend, pool, scheduler, cache, norm_digits, time_budget):
+        results[item['index']] = item
+    return results
@@ -0,0 +1,319 @@
+"""Offline benchmark for the diet optimizer.
+
+Builds synthetic catalogs in the real ``products`` schema, solves a grid of
+profiles against each one and reports p50/p95 latency per stage, peak
+memory, /tdee throughput and the end-to-end Flask request path. Catalogs of
+``--large-size`` rows and more solve an evenly sampled subset of the grid.
+Multi-day plans on the shipped catalog are solved both decomposed per day
+and as one monolithic model, to compare their latency and cost.
+
+    python benchmark.py --sizes 117,1000 --output bench.json
+    python benchmark.py --baseline bench.json --threshold 0.25
+
+Exits with status 1 when a tracked timing is more than ``--threshold``
+slower than in the baseline file.
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Keep the app import free of side effects: no meal plan cache file, no debug logging
+os.environ.setdefault('MEAL_PLAN_CACHE_PATH', ':memory:')
+
+from catalog import DB_PATH, CatalogCache
+from diet_model import solve_budget
+from metrics import request_timings, start_request
+from multiday import parse_plan, solve_plan
+from optimizer import parse_profile, solve_profile
+
+DEFAULT_SIZES = (117, 1000, 10000, 100000)
+
+PROFILE_GRID = {
+    'gender': ('male', 'female'),
+    'activity': ('sedentary', 'moderate', 'very active'),
+    'period': ('day', 'week'),
+    'allergens': ((), ('milk',), ('gluten', 'nuts')),
+    'vegetarian': (False, True)
+}
+
+
+def make_synthetic_db(path, rows, seed=0, sku_share=0.0):
+    """Writes a ``products`` table with ``rows`` products derived from the real catalog.
+
+    Real products are repeated with nutrients and prices scaled by a random
+    factor, so names (and with them categories and allergens) stay
+    realistic and the LP stays feasible at every size. A ``sku_share``
+    fraction of the copies keep the original nutrients and only get a new
+    price, like other brands or pack sizes of the same product.
+    """
+    rng = random.Random(seed)
+    source = sqlite3.connect(DB_PATH)
+    schema = source.execute("SELECT sql FROM sqlite_master WHERE name = 'products'").fetchone()[0]
+    templates = source.execute("SELECT * FROM products ORDER BY id").fetchall()
+    source.close()
+
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute(schema)
+    products = []
+    for i in range(rows):
+        template = list(templates[i % len(templates)])
+        copy = i // len(templates)
+        template[0] = i + 1
+        if copy:
+            template[1] = f"{template[1]} #{copy}"
+            scale = 1.0 if rng.random() < sku_share else rng.uniform(0.8, 1.2)
+            for col in range(2, 15):
+                if template[col] is not None:
+                    template[col] = template[col] * scale
+            for col in (16, 17):
+                if template[col] is not None:
+                    template[col] = template[col] * rng.uniform(0.7, 1.3)
+        products.append(template)
+    conn.executemany(f"INSERT INTO products VALUES ({', '.join('?' * len(templates[0]))})", products)
+    conn.commit()
+    conn.close()
+
+
+def profile_grid(limit=None):
+    """/optimize request bodies covering every combination in PROFILE_GRID."""
+    keys = list(PROFILE_GRID)
+    bodies = [dict(zip(keys, values)) for values in itertools.product(*PROFILE_GRID.values())]
+    for body in bodies:
+        body['allergens'] = list(body['allergens'])
+    return bodies[:limit] if limit else bodies
+
+
+def sample_profiles(bodies, count):
+    """Evenly spaced subset of ``bodies``, used where solving the whole grid takes too long."""
+    if not count or count >= len(bodies):
+        return bodies
+    step = len(bodies) / count
+    return [bodies[int(i * step)] for i in range(count)]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    """{stage: [seconds]} -> {stage: {p50_ms, p95_ms, n}}."""
+    return {stage: {
+        'p50_ms': round(percentile(values, 50) * 1000, 3),
+        'p95_ms': round(percentile(values, 95) * 1000, 3),
+        'n': len(values)
+    } for stage, values in samples.items()}
+
+
+def bench_catalog(path, bodies, backend, repeat):
+    """Loads the catalog at ``path`` and solves every profile; returns stage stats and peak memory."""
+    cache = CatalogCache(path)
+    tracemalloc.start()
+    started = time.perf_counter()
+    catalog = cache.get()
+    load_seconds = time.perf_counter() - started
+    _, load_peak = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    solve_profile(catalog, parse_profile(bodies[0])[0], backend)
+    _, solve_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples = {}
+    statuses = {}
+    for body in bodies:
+        profile, _ = parse_profile(body)
+        for _ in range(repeat):
+            start_request()
+            started = time.perf_counter()
+            result = solve_profile(catalog, profile, backend)
+            timings = request_timings() + [('total', time.perf_counter() - started)]
+            for stage, seconds in timings:
+                samples.setdefault(stage, []).append(seconds)
+            status = result.get('status', 'Error')
+            statuses[status] = statuses.get(status, 0) + 1
+    return {
+        'products': len(catalog.foods),
+        'catalog_load_ms': round(load_seconds * 1000, 3),
+        'peak_memory_mb': {
+            'catalog_load': round(load_peak / 2 ** 20, 2),
+            'solve': round(solve_peak / 2 ** 20, 2)
+        },
+        'stages': summarize(samples),
+        'statuses': statuses
+    }
+
+
+def bench_plans(path, bodies, backend, days, max_repeats, time_budget):
+    """Solves each profile as a ``days``-day plan, decomposed and monolithic, under ``time_budget`` seconds each.
+
+    Returns latency stats, statuses and total costs per formulation, plus
+    the mean cost of the decomposed plans relative to the monolithic ones.
+    """
+    catalog = CatalogCache(path).get()
+    modes = {}
+    for decompose in (True, False):
+        samples, statuses, costs = [], {}, []
+        for body in bodies:
+            plan, _ = parse_plan(dict(body, days=days, max_repeats=max_repeats, decompose=decompose))
+            started = time.perf_counter()
+            with solve_budget(time_budget):
+                result = solve_plan(catalog, plan, backend)
+            samples.append(time.perf_counter() - started)
+            status = result.get('status', 'Error')
+            statuses[status] = statuses.get(status, 0) + 1
+            costs.append(result.get('total_cost'))
+        modes['decomposed' if decompose else 'monolithic'] = dict(summarize({'plan': samples})['plan'],
+                                                                  statuses=statuses, costs=costs)
+    pairs = [(a, b) for a, b in zip(modes['decomposed']['costs'], modes['monolithic']['costs']) if a and b]
+    return {
+        'days': days,
+        'max_repeats': max_repeats,
+        'time_budget_s': time_budget,
+        'modes': modes,
+        'cost_ratio': round(sum(a / b for a, b in pairs) / len(pairs), 4) if pairs else None
+    }
+
+
+def bench_tdee(client, requests_count):
+    body = {'gender': 'female', 'weight': 62, 'height': 168, 'age': 34, 'activity': 'moderate'}
+    started = time.perf_counter()
+    for _ in range(requests_count):
+        client.post('/tdee', json=body)
+    elapsed = time.perf_counter() - started
+    return {'requests': requests_count, 'requests_per_s': round(requests_count / elapsed, 1)}
+
+
+def bench_flask(app, path, bodies, repeat):
+    """End-to-end /optimize through the Flask test client, with the result cache cleared before each request."""
+    services = app.extensions['diet']
+    services['catalog_cache'] = CatalogCache(path)
+    client = app.test_client()
+    client.post('/optimize', json=bodies[0])  # load the catalog outside the timed loop
+    samples = []
+    for body in bodies:
+        for _ in range(repeat):
+            services['result_cache'].clear()
+            started = time.perf_counter()
+            client.post('/optimize', json=body)
+            samples.append(time.perf_counter() - started)
+    return summarize({'optimize': samples})['optimize']
+
+
+def tracked_timings(results):
+    """Flattens the timings that are compared against a baseline: {name: milliseconds}."""
+    tracked = {}
+    for size, entry in results['catalogs'].items():
+        tracked[f'{size}/total_p50_ms'] = entry['stages']['total']['p50_ms']
+        tracked[f'{size}/total_p95_ms'] = entry['stages']['total']['p95_ms']
+        if 'flask' in entry:
+            tracked[f'{size}/flask_p50_ms'] = entry['flask']['p50_ms']
+    if 'plans' in results:
+        tracked['plans/decomposed_p50_ms'] = results['plans']['modes']['decomposed']['p50_ms']
+    if 'tdee' in results:
+        tracked['tdee/ms_per_request'] = round(1000 / results['tdee']['requests_per_s'], 4)
+    return tracked
+
+
+def find_regressions(results, baseline, threshold):
+    """Lists tracked timings more than ``threshold`` (a fraction) slower than in ``baseline``."""
+    current = tracked_timings(results)
+    previous = tracked_timings(baseline)
+    regressions = []
+    for name, value in current.items():
+        base = previous.get(name)
+        if base and value > base * (1 + threshold):
+            regressions.append({'metric': name, 'baseline': base, 'current': value,
+                                'change': round(value / base - 1, 3)})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the diet optimizer on synthetic catalogs.')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='comma-separated catalog sizes (rows in the products table)')
+    parser.add_argument('--backend', default=os.getenv('DIET_SOLVER', 'pulp'), choices=('pulp', 'highs'))
+    parser.add_argument('--profiles', type=int, default=None, help='use only the first N profiles of the grid')
+    parser.add_argument('--large-size', type=int, default=10000, help='catalogs with at least this many rows are "large"')
+    parser.add_argument('--large-profiles', type=int, default=6, help='profiles sampled from the grid for large catalogs')
+    parser.add_argument('--repeat', type=int, default=1, help='solves per profile')
+    parser.add_argument('--flask-profiles', type=int, default=5, help='profiles sent through the Flask test client per size')
+    parser.add_argument('--tdee-requests', type=int, default=2000)
+    parser.add_argument('--plan-profiles', type=int, default=4,
+                        help='profiles sampled from the grid for the multi-day plan comparison (0 to skip)')
+    parser.add_argument('--plan-days', type=int, default=7)
+    parser.add_argument('--plan-repeats', type=int, default=3, help='max_repeats of the benchmarked plans')
+    parser.add_argument('--plan-budget', type=float, default=30, help='solve time budget per plan in seconds')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sku-share', type=float, default=0.0,
+                        help='fraction of synthetic products that are same-nutrition SKUs of a real product')
+    parser.add_argument('--output', help='write JSON results to this file (default: stdout)')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown against the baseline (0.2 = 20%%)')
+    args = parser.parse_args(argv)
+
+    from app import create_app
+    app = create_app({'DIET_SOLVER': args.backend, 'LOG_LEVEL': 'WARNING'})
+
+    bodies = profile_grid(args.profiles)
+    results = {
+        'backend': args.backend,
+        'profiles': len(bodies),
+        'repeat': args.repeat,
+        'sku_share': args.sku_share,
+        'python': sys.version.split()[0],
+        'catalogs': {}
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (int(s) for s in args.sizes.split(',') if s.strip()):
+            path = os.path.join(tmp, f'products_{size}.db')
+            make_synthetic_db(path, size, args.seed, args.sku_share)
+            size_bodies = sample_profiles(bodies, args.large_profiles) if size >= args.large_size else bodies
+            entry = bench_catalog(path, size_bodies, args.backend, args.repeat)
+            if args.flask_profiles:
+                entry['flask'] = bench_flask(app, path, size_bodies[:args.flask_profiles], args.repeat)
+            results['catalogs'][str(size)] = entry
+            logging.warning(f"{size} rows: total p50 {entry['stages']['total']['p50_ms']} ms, "
+                            f"p95 {entry['stages']['total']['p95_ms']} ms")
+    if args.plan_profiles:
+        results['plans'] = bench_plans(DB_PATH, sample_profiles(bodies, args.plan_profiles), args.backend,
+                                       args.plan_days, args.plan_repeats, args.plan_budget)
+        for mode, entry in results['plans']['modes'].items():
+            logging.warning(f"{args.plan_days}-day plans, {mode}: p50 {entry['p50_ms']} ms, p95 {entry['p95_ms']} ms")
+    if args.tdee_requests:
+        results['tdee'] = bench_tdee(app.test_client(), args.tdee_requests)
+    results['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        results['regressions'] = find_regressions(results, baseline, args.threshold)
+        for regression in results['regressions']:
+            logging.warning(f"Regression: {regression['metric']} {regression['baseline']} -> {regression['current']} ms")
+        exit_code = 1 if results['regressions'] else 0
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,271 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from catalog_store import CATEGORIES, CATEGORY_BITS, ProductView, bit_indices, open_catalog_store
+from taxonomy import ALLERGENS, ALLERGEN_BITS, normalize_text
+
+DB_PATH = os.path.join(os.path.dirname(__file__), 'db', 'food.db')
+# Columnar catalog files (default: catalog_store/ next to the database)
+STORE_DIR = os.getenv('CATALOG_STORE_DIR') or None
+
+# Service rows and fats we do not want to use (compared without diacritics)
+BLOCKED_NAMES = {'dienas norma', 'kombinetie tauki', 'cukas tauki'}
+
+
+# Stable column names of the catalog, mapped onto the products table's spreadsheet headers
+PRODUCT_COLUMNS = {
+    'id': 'id',
+    'name': 'Product',
+    'protein': '"Olb.v."',
+    'fat': 'Tauki',
+    'carbs': '"Oglh."',
+    'kj': '"kJ(100g)"',
+    'kcal': '"kcal(100g)"',
+    'A': 'A',
+    'B1': 'B1',
+    'B2': 'B2',
+    'PP': 'PP',
+    'C': 'C',
+    'Ca': 'Ca',
+    'P': 'P',
+    'Fe': 'Fe',
+    'allergens': 'Allergeni',
+    'price_per_kg': 'Cena_1kg',
+    'price_per_100g': 'Cena_100g'
+}
+# View exposing the products table under PRODUCT_COLUMNS names (created by ingest.py)
+CATALOG_VIEW = 'catalog_products'
+CATALOG_VIEW_SELECT = f"SELECT {', '.join(f'{column} AS {name}' for name, column in PRODUCT_COLUMNS.items())} FROM products"
+
+
+def load_products_from_db(db_path=DB_PATH):
+    """Loads products from the SQLite database by the named columns of the catalog_products view."""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        has_view = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = ?", (CATALOG_VIEW,)).fetchone()
+        # A database ingest.py has not migrated yet has no view: read the same named columns from the table
+        source = CATALOG_VIEW if has_view else f"({CATALOG_VIEW_SELECT})"
+        rows = conn.execute(f"SELECT * FROM {source} ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+    foods = []
+    for row in rows:
+        # Determine if lactose is present in allergens
+        has_lactose = 'laktoze' in str(row['allergens']).lower() if row['allergens'] else False
+
+        food = {
+            'id': row['id'],
+            'name': row['name'],
+            'protein': row['protein'] or 0,
+            'fat': row['fat'] or 0,
+            'carbs': row['carbs'] or 0,
+            'kj': row['kj'] or 0,
+            'kcal': row['kcal'] or 0,
+            'A': row['A'] or 0,
+            'B1': row['B1'] or 0,
+            'B2': row['B2'] or 0,
+            'PP': row['PP'] or 0,
+            'C': row['C'] or 0,
+            'Ca': row['Ca'] or 0,
+            'P': row['P'] or 0,
+            'Fe': row['Fe'] or 0,
+            'price_per_100g': row['price_per_100g'] or 0,
+            'has_lactose': has_lactose,
+            'allergens': row['allergens'] or ''
+        }
+        # Filter out erroneous or service rows
+        name_normalized = str(food['name']).strip().lower()
+        if name_normalized in BLOCKED_NAMES or normalize_text(name_normalized) in BLOCKED_NAMES or not name_normalized:
+            continue
+        foods.append(food)
+
+    return foods
+
+
+def load_catalog_revision(db_path=DB_PATH):
+    """Revision counter bumped by every ingest.py run, or None for a database never ingested into."""
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute("SELECT value FROM catalog_meta WHERE key = 'revision'").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+    return int(row[0]) if row else None
+
+
+def catalog_version(foods) -> str:
+    """Content hash of the catalog, stable across processes and restarts."""
+    digest = hashlib.sha1()
+    for food in foods:
+        digest.update(repr(sorted(food.items())).encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+
+class CatalogSnapshot:
+    """Read-only view of the product catalog at one database version.
+
+    Product data lives in a memory-mapped columnar store (see
+    catalog_store), shared by every process serving the same version;
+    ``columns`` reads it by integer product index and ``foods`` still
+    offers each product as a read-only dict, built when indexed.
+    ``category_products`` maps every taxonomy category to a product bitset,
+    so requests look groups up instead of scanning names for keywords.
+
+    Allergens are parsed once, when the store is written, into an
+    ``allergen_mask`` per product (bits over ``taxonomy.ALLERGENS``) and
+    here into one product bitset per allergen (bit i = product i), so a
+    request's exclusion is a few integer ops.
+    """
+
+    __slots__ = ('version', 'columns', 'foods', 'category_products', 'allergen_products',
+                 'all_products', '_allowed_by_mask', 'loaded_at')
+
+    def __init__(self, version, columns, loaded_at=None):
+        self.version = version
+        self.columns = columns
+        self.foods = ProductView(columns)
+        self.all_products = (1 << len(columns)) - 1
+        self.category_products = {category: 0 for category in CATEGORIES}
+        self.allergen_products = {allergen: 0 for allergen in ALLERGENS}
+        for i in range(len(columns)):
+            tags = columns.category_mask(i)
+            if tags:
+                for category in CATEGORIES:
+                    if tags & CATEGORY_BITS[category]:
+                        self.category_products[category] |= 1 << i
+            allergens = columns.allergen_mask(i)
+            if allergens:
+                for allergen in ALLERGENS:
+                    if allergens & ALLERGEN_BITS[allergen]:
+                        self.allergen_products[allergen] |= 1 << i
+        # Allowed-products bitset per allergen combination (at most 2**len(ALLERGENS))
+        self._allowed_by_mask = {0: self.all_products}
+        self.loaded_at = loaded_at if loaded_at is not None else time.time()
+
+    def allowed_products(self, mask) -> int:
+        """Bitset of products free of every allergen in ``mask``."""
+        allowed = self._allowed_by_mask.get(mask)
+        if allowed is None:
+            excluded = 0
+            for allergen in ALLERGENS:
+                if mask & ALLERGEN_BITS[allergen]:
+                    excluded |= self.allergen_products[allergen]
+            allowed = self.all_products & ~excluded
+            self._allowed_by_mask[mask] = allowed
+        return allowed
+
+    def products_in(self, category, available) -> list:
+        """Indices of the ``available`` products in a taxonomy category."""
+        return bit_indices(self.category_products[category] & available)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __reduce__(self):
+        # The columns pickle as their file path: a worker process maps the same store
+        return (CatalogSnapshot, (self.version, self.columns, self.loaded_at))
+
+
+class CatalogCache:
+    """Process-wide catalog cache that reloads only when the database changes.
+
+    Change detection combines the database file's mtime/size (the file was
+    replaced or rewritten) with ``PRAGMA data_version`` on a long-lived
+    connection (another connection committed to the same file).
+    Each version is written once to a columnar store file in ``store_dir``
+    and memory-mapped, so processes serving the same version share it.
+    """
+
+    def __init__(self, db_path=DB_PATH, store_dir=STORE_DIR):
+        self.db_path = db_path
+        self.store_dir = store_dir or os.path.join(os.path.dirname(os.path.abspath(db_path)), 'catalog_store')
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._fingerprint = None
+        self.revision = None
+        self._watch_conn = None
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def _data_version(self):
+        if self._watch_conn is None:
+            self._watch_conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        return self._watch_conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _current_fingerprint(self):
+        try:
+            st = os.stat(self.db_path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino, self._data_version())
+
+    def _load(self, fingerprint):
+        foods = load_products_from_db(self.db_path)
+        version = catalog_version(foods)
+        self._snapshot = CatalogSnapshot(version, open_catalog_store(self.store_dir, version, foods))
+        self.revision = load_catalog_revision(self.db_path)
+        self._fingerprint = fingerprint
+        self.reloads += 1
+        logging.info(f"Catalog loaded: {len(foods)} products, version {self._snapshot.version}")
+        return self._snapshot
+
+    def get(self) -> CatalogSnapshot:
+        """Returns the current snapshot, reloading it if the database changed."""
+        with self._lock:
+            fingerprint = self._current_fingerprint()
+            if self._snapshot is not None and fingerprint == self._fingerprint:
+                self.hits += 1
+                return self._snapshot
+            self.misses += 1
+            if self._snapshot is not None and fingerprint is not None and fingerprint[2] != self._fingerprint[2]:
+                # File was replaced: the watch connection still points at the old inode
+                self._close_watch()
+                fingerprint = self._current_fingerprint()
+            return self._load(fingerprint)
+
+    def reload(self) -> CatalogSnapshot:
+        """Explicit reload hook, e.g. after a manual price update."""
+        with self._lock:
+            self._close_watch()
+            return self._load(self._current_fingerprint())
+
+    def after_fork(self):
+        """Drops the watch connection inherited from the parent process, keeping the loaded snapshot.
+
+        SQLite connections must not cross a fork. The file part of the
+        fingerprint is kept, so a database replaced since the snapshot was
+        loaded is still noticed; the data_version part restarts on the
+        worker's own connection.
+        """
+        self._lock = threading.Lock()
+        self._watch_conn = None
+        if self._fingerprint is not None:
+            self._fingerprint = self._fingerprint[:3] + (self._data_version(),)
+
+    def _close_watch(self):
+        if self._watch_conn is not None:
+            self._watch_conn.close()
+            self._watch_conn = None
+
+    def stats(self):
+        with self._lock:
+            snapshot = self._snapshot
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'reloads': self.reloads,
+                'version': snapshot.version if snapshot else None,
+                'revision': self.revision,
+                'products': len(snapshot) if snapshot else 0,
+                'store': snapshot.columns.path if snapshot else None,
+                'store_bytes': snapshot.columns.nbytes if snapshot else 0,
+                'loaded_at': snapshot.loaded_at if snapshot else None
+            }
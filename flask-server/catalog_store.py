@@ -0,0 +1,254 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+from array import array
+from types import MappingProxyType
+
+from nutrition import nut_keys
+from taxonomy import FOOD_TAXONOMY, allergen_mask, categorize
+
+try:
+    import numpy as np
+except ImportError:  # columns are still readable one value at a time, but not as arrays
+    np = None
+
+MAGIC = b'DIETCAT\0'
+# Bumped whenever the layout or the meaning of a column changes; older files are rebuilt
+STORE_FORMAT = 1
+# Every column starts on a cache-line boundary
+ALIGNMENT = 64
+CATEGORIES = tuple(FOOD_TAXONOMY)
+CATEGORY_BITS = {category: 1 << i for i, category in enumerate(CATEGORIES)}
+
+
+def store_path(store_dir, version):
+    """File holding catalog ``version`` in ``store_dir``."""
+    return os.path.join(store_dir, f'catalog-{version}.v{STORE_FORMAT}.bin')
+
+
+def _text_column(values):
+    blob = bytearray()
+    offsets = array('q', [0])
+    for value in values:
+        blob += str(value).encode('utf-8')
+        offsets.append(len(blob))
+    return offsets, array('B', bytes(blob))
+
+
+def write_catalog_store(path, version, foods):
+    """Writes ``foods`` (product dicts from load_products_from_db) as a columnar catalog file.
+
+    Numeric columns are native-endian arrays at ALIGNMENT-byte offsets after
+    a JSON header: ``nutrients`` is products x nut_keys row-major, with
+    ``price``, ``category_mask`` (bits over CATEGORIES), ``allergen_mask``
+    (bits over taxonomy.ALLERGENS), ``has_lactose`` and ``product_id``
+    alongside. Names and Allergeni strings are UTF-8 blobs with offsets.
+    The file is written under a temporary name and moved into place, so
+    readers never see a partial file.
+    """
+    names, names_blob = _text_column(f['name'] for f in foods)
+    allergens, allergens_blob = _text_column(f['allergens'] for f in foods)
+    columns = {
+        'product_id': array('q', (int(f['id'] or 0) for f in foods)),
+        'nutrients': array('d', (float(f[nut]) for f in foods for nut in nut_keys)),
+        'price': array('d', (float(f['price_per_100g']) for f in foods)),
+        'category_mask': array('I', (sum(CATEGORY_BITS[c] for c in categorize(f['name'])) for f in foods)),
+        'allergen_mask': array('H', (allergen_mask(f['allergens']) for f in foods)),
+        'has_lactose': array('B', (bool(f['has_lactose']) for f in foods)),
+        'name_offsets': names,
+        'names': names_blob,
+        'allergen_offsets': allergens,
+        'allergens': allergens_blob
+    }
+    layout = {}
+    offset = 0
+    for name, values in columns.items():
+        layout[name] = {'typecode': values.typecode, 'offset': offset, 'count': len(values)}
+        offset += -(-len(values) * values.itemsize // ALIGNMENT) * ALIGNMENT
+    header = json.dumps({
+        'format': STORE_FORMAT,
+        'version': version,
+        'byteorder': sys.byteorder,
+        'products': len(foods),
+        'nut_keys': nut_keys,
+        'categories': list(CATEGORIES),
+        'columns': layout
+    }).encode('utf-8')
+    data_start = -(-(len(MAGIC) + 4 + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    with open(tmp_path, 'wb') as out:
+        out.write(MAGIC + struct.pack('<I', len(header)) + header)
+        for name, values in columns.items():
+            out.seek(data_start + layout[name]['offset'])
+            out.write(values.tobytes())
+        out.truncate(data_start + offset)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp_path, path)
+
+
+class CatalogColumns:
+    """Read-only, memory-mapped view of a catalog file written by write_catalog_store().
+
+    Every process that opens the same file shares one physical copy of it
+    through the page cache; nothing here is copied onto the Python heap.
+    Single values are read through typed memoryviews (no NumPy needed);
+    ``array()`` returns zero-copy NumPy views for vectorized code.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a catalog store file")
+        (header_size,) = struct.unpack_from('<I', self._mmap, len(MAGIC))
+        header_end = len(MAGIC) + 4 + header_size
+        header = json.loads(self._mmap[len(MAGIC) + 4:header_end].decode('utf-8'))
+        if (header['format'] != STORE_FORMAT or header['byteorder'] != sys.byteorder
+                or header['nut_keys'] != nut_keys or header['categories'] != list(CATEGORIES)):
+            raise ValueError(f"{path} was written for another store format, platform or taxonomy")
+        self.version = header['version']
+        self.size = header['products']
+        self.nbytes = len(self._mmap)
+        data_start = -(-header_end // ALIGNMENT) * ALIGNMENT
+        self._layout = {name: dict(column, offset=data_start + column['offset'])
+                        for name, column in header['columns'].items()}
+        buffer = memoryview(self._mmap)
+        self._views = {}
+        for name, column in self._layout.items():
+            itemsize = array(column['typecode']).itemsize
+            start = column['offset']
+            self._views[name] = buffer[start:start + column['count'] * itemsize].cast(column['typecode'])
+        self._nut_position = {nut: k for k, nut in enumerate(nut_keys)}
+        self._tags = {}
+
+    def __len__(self):
+        return self.size
+
+    def __reduce__(self):
+        # Another process maps the same file instead of receiving a copy
+        return (CatalogColumns, (self.path,))
+
+    def array(self, name):
+        """Zero-copy NumPy view of a column; ``nutrients`` is shaped (products, len(nut_keys))."""
+        column = self._layout[name]
+        values = np.frombuffer(self._mmap, dtype=column['typecode'], count=column['count'], offset=column['offset'])
+        return values.reshape(self.size, len(nut_keys)) if name == 'nutrients' else values
+
+    def nutrient(self, i, nut):
+        return self._views['nutrients'][i * len(nut_keys) + self._nut_position[nut]]
+
+    def price(self, i):
+        return self._views['price'][i]
+
+    def category_mask(self, i):
+        return self._views['category_mask'][i]
+
+    def allergen_mask(self, i):
+        return self._views['allergen_mask'][i]
+
+    def _text(self, column, i):
+        offsets = self._views[f'{column[:-1]}_offsets']
+        return bytes(self._views[column][offsets[i]:offsets[i + 1]]).decode('utf-8')
+
+    def name(self, i):
+        return self._text('names', i)
+
+    def find(self, name):
+        """Index of the first product called ``name``, or None."""
+        target = str(name).encode('utf-8')
+        offsets, names = self._views['name_offsets'], self._views['names']
+        for i in range(self.size):
+            if offsets[i + 1] - offsets[i] == len(target) and names[offsets[i]:offsets[i + 1]] == target:
+                return i
+        return None
+
+    def find_all(self, name):
+        """Indices of every product called ``name`` (names are not unique)."""
+        target = str(name).encode('utf-8')
+        offsets, names = self._views['name_offsets'], self._views['names']
+        return [i for i in range(self.size)
+                if offsets[i + 1] - offsets[i] == len(target) and names[offsets[i]:offsets[i + 1]] == target]
+
+    def tags(self, i):
+        """Taxonomy categories of product ``i`` (frozensets are shared per distinct mask)."""
+        mask = self._views['category_mask'][i]
+        tags = self._tags.get(mask)
+        if tags is None:
+            tags = self._tags[mask] = frozenset(c for c in CATEGORIES if mask & CATEGORY_BITS[c])
+        return tags
+
+    def product(self, i):
+        """Product ``i`` in the dict layout of load_products_from_db, plus ``tags`` and ``allergen_mask``."""
+        food = {'id': self._views['product_id'][i], 'name': self.name(i)}
+        row = self._views['nutrients'][i * len(nut_keys):(i + 1) * len(nut_keys)]
+        food.update(zip(nut_keys, row))
+        food['price_per_100g'] = self._views['price'][i]
+        food['has_lactose'] = bool(self._views['has_lactose'][i])
+        food['allergens'] = self._text('allergens', i)
+        food['tags'] = self.tags(i)
+        food['allergen_mask'] = self._views['allergen_mask'][i]
+        return MappingProxyType(food)
+
+
+class ProductView:
+    """Sequence of a catalog's products, each materialized from the columns only when indexed.
+
+    Code that loops over every product should read the columns (or their
+    ``array()`` views) by index instead.
+    """
+
+    __slots__ = ('columns',)
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.columns.product(j) for j in range(*i.indices(len(self.columns)))]
+        if i < 0:
+            i += len(self.columns)
+        if not 0 <= i < len(self.columns):
+            raise IndexError('product index out of range')
+        return self.columns.product(i)
+
+    def __iter__(self):
+        return (self.columns.product(i) for i in range(len(self.columns)))
+
+
+def open_catalog_store(store_dir, version, foods):
+    """Maps catalog ``version`` from ``store_dir``, writing the file from ``foods`` first if needed.
+
+    Files of other versions are removed once the new one is in place;
+    processes still mapping them keep their mapping until they reload.
+    """
+    path = store_path(store_dir, version)
+    try:
+        return CatalogColumns(path)
+    except FileNotFoundError:
+        pass
+    except (ValueError, KeyError, struct.error) as e:
+        logging.warning(f"Rebuilding catalog store {path}: {str(e)}")
+    write_catalog_store(path, version, foods)
+    for name in os.listdir(store_dir):
+        if name.startswith('catalog-') and name != os.path.basename(path) and '.tmp-' not in name:
+            try:
+                os.remove(os.path.join(store_dir, name))
+            except OSError:
+                pass
+    logging.info(f"Catalog store written: {path}")
+    return CatalogColumns(path)
+
+
+def bit_indices(bits):
+    """Indices of the set bits of a product bitset, ascending."""
+    return [i for i, bit in enumerate(reversed(bin(bits)[2:])) if bit == '1']
@@ -0,0 +1,74 @@
+from diet_model import build_diet_lp, solve_diet_lp
+from metrics import timed
+
+# Objective weight of relaxing a row by 100 % of its bound; far above the cost of any diet,
+# so the elastic solve relaxes as little as possible before it looks at prices
+RELAXATION_PENALTY = 1e4
+# Relaxations below this (relative to the bound) are solver noise
+MIN_RELAXATION = 1e-7
+
+
+def elastic_lp(lp):
+    """Elastic copy of ``lp``: every row gets a penalized slack column.
+
+    '>=' rows get a slack that adds to the row, '<=' rows one that subtracts
+    from it and '==' rows one of each. Slacks are weighted by the size of
+    the row's bound, so relaxing the kcal minimum by 1 % costs the same as
+    relaxing the fish minimum by 1 %. Returns (elastic lp, slacks) with
+    slacks as [(row, sign, column index, weight)].
+    """
+    foods = list(lp['foods'])
+    cost = list(lp['cost'])
+    upper = list(lp['upper'])
+    rows = []
+    slacks = []
+    for row in lp['rows']:
+        coeffs = dict(row['coeffs'])
+        # Rows bounded at 0 (e.g. whole vs refined grains) are relaxed in absolute units
+        weight = 1.0 / abs(row['rhs']) if abs(row['rhs']) > 1e-9 else 1.0
+        # No row can be violated by more than its bound plus the largest activity the products allow
+        bound = abs(row['rhs']) + sum(abs(c) * lp['upper'][i] for i, c in row['coeffs'].items())
+        signs = {'>=': (1,), '<=': (-1,)}.get(row['sense'], (1, -1))
+        for sign in signs:
+            column = len(foods)
+            foods.append({'name': f"Relax_{row['name']}_{'up' if sign < 0 else 'down'}"})
+            cost.append(RELAXATION_PENALTY * weight)
+            upper.append(bound)
+            coeffs[column] = sign
+            slacks.append((row, sign, column, weight))
+        rows.append(dict(row, coeffs=coeffs))
+    return {'foods': foods, 'cost': cost, 'upper': upper, 'rows': rows}, slacks
+
+
+def diagnose_infeasibility(catalog, product_ids, norms, norms_upper, period_days, vegetarian_flag, no_added_sugar, backend='pulp'):
+    """Finds the smallest relaxation of the diet rows that makes the LP feasible, in one elastic solve.
+
+    Returns (relaxations, units) where relaxations lists each row to relax
+    with its ``constraint`` name, ``sense``, ``rhs``, ``relax_by`` and
+    ``relaxed_rhs``, largest relative relaxation first, and units holds the
+    cheapest best-effort diet under that relaxation (units of 100 g per
+    product in ``product_ids``). Both are None if the elastic solve fails.
+    """
+    with timed('model_build'):
+        lp, slacks = elastic_lp(build_diet_lp(catalog, product_ids, norms, norms_upper, period_days, vegetarian_flag,
+                                              no_added_sugar))
+    with timed('diagnosis'):
+        status, amounts, _ = solve_diet_lp(lp, backend)
+    if status != 'Optimal':
+        return None, None
+    relaxations = []
+    for row, sign, column, weight in slacks:
+        amount = amounts[column]
+        if amount * weight <= MIN_RELAXATION:
+            continue
+        relaxations.append({
+            'constraint': row['name'],
+            'sense': row['sense'],
+            'rhs': round(row['rhs'], 4),
+            # A '>=' row is met once its bound is lowered by the slack, a '<=' row once raised
+            'relax_by': round(amount, 4),
+            'relaxed_rhs': round(row['rhs'] - sign * amount, 4),
+            'relative': round(amount * weight, 4)
+        })
+    relaxations.sort(key=lambda r: r['relative'], reverse=True)
+    return relaxations, amounts[:len(product_ids)]
@@ -0,0 +1,670 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from pulp import LpProblem, LpVariable, LpMinimize, LpSolutionOptimal, LpStatus, lpSum, PULP_CBC_CMD, value
+
+from catalog_store import CATEGORY_BITS, bit_indices
+from metrics import timed
+from nutrition import nut_keys
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is only needed for the 'highs' backend and presolve
+    np = None
+
+try:
+    from scipy.optimize import linprog
+    from scipy.sparse import csr_matrix, vstack
+except ImportError:  # SciPy is only needed for the 'highs' backend
+    linprog = None
+
+try:
+    import highspy
+except ImportError:  # without highspy template solves run cold through linprog
+    highspy = None
+
+# Coefficients of the food-group rows: (taxonomy category, sign) terms summed per product
+GROUP_ROW_TERMS = {
+    'Added_Sugar_Cukurs': [('added_sugar', 1)],
+    'Oil': [('oils', 1)],
+    'Offal': [('offal', 1)],
+    'Vegetables': [('vegetables', 1)],
+    'Fruits': [('fruits', 1)],
+    'Legumes': [('legumes', 1)],
+    'Refined_Grains': [('refined_grains', 1)],
+    'Whole_vs_Refined': [('whole_grains', 1), ('refined_grains', -1)],
+    'Red_Meat': [('red_meat', 1)],
+    'Processed_Meat': [('processed_meat', 1)],
+    'Sweets': [('sweets', 1)],
+    'Potatoes': [('potatoes', 1)],
+    'Pasta': [('pasta', 1)],
+    'Fish': [('fish', 1)],
+    'Animal_Protein': [('red_meat', 1), ('poultry', 1), ('fish', 1)],
+    'Land_Animal_Protein': [('poultry', 1), ('red_meat', 1)]
+}
+UPPER_NUTRIENTS = ['protein', 'fat', 'carbs', 'kcal', 'kj']
+# Every row family of the model, in the order rows are added
+ROW_FAMILIES = [f"Min_{nut}" for nut in nut_keys] + [f"Max_{nut}" for nut in UPPER_NUTRIENTS] + list(GROUP_ROW_TERMS)
+
+# Health-aware nudges in objective (very small weights)
+OBJECTIVE_NUDGES = {'sweets': 0.01, 'refined_grains': 0.01, 'vegetables': -0.005, 'whole_grains': -0.005, 'legumes': -0.005}
+
+
+def objective_costs(catalog):
+    """Objective cost (price plus health nudges) of every catalog product as an array, from the catalog's columns."""
+    cost = catalog.columns.array('price').copy()
+    tags = catalog.columns.array('category_mask')
+    for category, w in OBJECTIVE_NUDGES.items():
+        cost[(tags & CATEGORY_BITS[category]) != 0] += w
+    return cost
+
+
+def product_upper_bound(period_days):
+    # Safe per-product caps
+    per_product_weekly_cap_units = 10 if period_days == 7 else 3
+    return min(3 * period_days, per_product_weekly_cap_units)
+
+
+def diet_rows(norms, norms_upper, period_days, vegetarian_flag, no_added_sugar, present):
+    """Active rows for one request as dicts with ``family``, ``name``, ``sense`` and ``rhs``.
+
+    ``present(category)`` tells whether any available food is in the category;
+    group constraints are only added for groups that can be satisfied.
+    """
+    rows = []
+
+    def add_row(family, name, sense, rhs):
+        rows.append({'family': family, 'name': name, 'sense': sense, 'rhs': rhs})
+
+    for nut in nut_keys:
+        add_row(f"Min_{nut}", f"Min_{nut}", '>=', norms[nut])
+    for nut in UPPER_NUTRIENTS:
+        if nut in norms_upper:
+            add_row(f"Max_{nut}", f"Max_{nut}", '<=', norms_upper[nut])
+
+    # WHO: limit free sugar to ≤50g/day; cap pure sugar product 'Cukurs' (100g per unit)
+    if present('added_sugar'):
+        if no_added_sugar:
+            add_row('Added_Sugar_Cukurs', "No_Added_Sugar_Cukurs", '==', 0.0)
+        else:
+            add_row('Added_Sugar_Cukurs', "Max_Added_Sugar_Cukurs", '<=', 0.5 * period_days)
+
+    # Oils: ≤30g/day (WHO) → 210g/week → 2.1 units/week
+    if present('oils'):
+        add_row('Oil', "Max_Oil", '<=', 0.3 * period_days)
+
+    # Offal: ≤200g/week → 2 units/week
+    if present('offal'):
+        if period_days == 7:
+            add_row('Offal', "Max_Offal_Week", '<=', 2.0)
+        else:
+            add_row('Offal', "Max_Offal_Day", '<=', 0.3)
+
+    # Vegetables: ≥400g/day (WHO) → 2800g/week → 28 units/week
+    if present('vegetables'):
+        add_row('Vegetables', "Min_Vegetables", '>=', 4.0 * period_days)
+
+    # Fruits: ≥200g/day (practical minimum) → 1400g/week → 14 units/week
+    if present('fruits'):
+        add_row('Fruits', "Min_Fruits", '>=', 2.0 * period_days)
+
+    # Legumes: ≥600g/week → 6 units/week (or 1 unit/day)
+    if present('legumes'):
+        if period_days == 7:
+            add_row('Legumes', "Min_Legumes_Week", '>=', 6.0)
+        else:
+            add_row('Legumes', "Min_Legumes_Day", '>=', 1.0)
+
+    # Refined grains: ≤200g/day → 1400g/week → 14 units/week
+    if present('refined_grains'):
+        add_row('Refined_Grains', "Max_Refined_Grains", '<=', 2.0 * period_days)
+
+    # Whole grains should be ≥ refined grains to encourage healthy choices
+    if present('whole_grains') and present('refined_grains'):
+        add_row('Whole_vs_Refined', "Min_Whole_vs_Refined", '>=', 0.0)
+
+    # WHO: red meat ≤500g/week (5 units/week)
+    if present('red_meat'):
+        if period_days == 7:
+            add_row('Red_Meat', "Max_Red_Meat_Week", '<=', 5.0)
+        else:
+            add_row('Red_Meat', "Max_Red_Meat_Day", '<=', 0.7)
+
+    # WHO: processed meat ideally 0; enforce zero consumption
+    if present('processed_meat'):
+        add_row('Processed_Meat', "No_Processed_Meat", '==', 0.0)
+
+    # Limit sweets (chocolate/candies/cookies/cocoa) to ≤100g/day → 1 unit/day
+    if present('sweets'):
+        add_row('Sweets', "Max_Sweets", '<=', 1.0 * period_days)
+
+    # Optional caps to avoid over-reliance on cheap starches
+    if present('potatoes'):
+        if period_days == 7:
+            add_row('Potatoes', "Max_Potatoes_Week", '<=', 7.0)
+        else:
+            add_row('Potatoes', "Max_Potatoes_Day", '<=', 1.0)
+    if present('pasta'):
+        if period_days == 7:
+            add_row('Pasta', "Max_Pasta_Week", '<=', 7.0)
+        else:
+            add_row('Pasta', "Max_Pasta_Day", '<=', 1.0)
+
+    # Additional public-health aligned constraints (add only if applicable):
+    # AHA: fish at least ~450g/week (two ~225g servings)
+    if not vegetarian_flag and present('fish'):
+        if period_days == 7:
+            add_row('Fish', "Min_Fish_Week", '>=', 4.5)
+        else:
+            add_row('Fish', "Min_Fish_Day", '>=', 0.7)
+
+    # Ensure presence of animal protein (meat/poultry/fish) unless vegetarian
+    if not vegetarian_flag and (present('red_meat') or present('poultry') or present('fish')):
+        min_units = 3.0 if period_days == 7 else 0.5
+        add_row('Animal_Protein', "Min_Animal_Protein", '>=', min_units)
+
+    # Encourage land animal protein presence as well (poultry or red meat) unless vegetarian
+    if not vegetarian_flag and (present('poultry') or present('red_meat')):
+        min_land_units = 3.0 if period_days == 7 else 0.5
+        add_row('Land_Animal_Protein', "Min_Land_Animal_Protein", '>=', min_land_units)
+
+    return rows
+
+
+def _product_values(catalog, product_ids):
+    """({nutrient: values}, prices, category masks) of ``product_ids``, read from the catalog's columns by index."""
+    columns = catalog.columns
+    if np is not None:
+        ids = np.asarray(product_ids, dtype=np.intp)
+        nutrients = columns.array('nutrients')[ids]
+        return ({nut: nutrients[:, k].tolist() for k, nut in enumerate(nut_keys)},
+                columns.array('price')[ids].tolist(), columns.array('category_mask')[ids].tolist())
+    return ({nut: [columns.nutrient(i, nut) for i in product_ids] for nut in nut_keys},
+            [columns.price(i) for i in product_ids], [columns.category_mask(i) for i in product_ids])
+
+
+def build_diet_lp(catalog, product_ids, norms, norms_upper, period_days, vegetarian_flag, no_added_sugar):
+    """Describes the diet LP over the catalog products ``product_ids`` as plain data shared by every solver backend.
+
+    Column k is product ``product_ids[k]``; ``foods`` only names the columns.
+    Rows are dicts with ``name``, ``coeffs`` ({column: coefficient}),
+    ``sense`` ('>=', '<=' or '==') and ``rhs``. An LP may also list
+    ``integer`` column indices, which makes it a MIP for both backends.
+    """
+    nutrients, prices, masks = _product_values(catalog, product_ids)
+    present = 0
+    for mask in masks:
+        present |= mask
+    rows = diet_rows(norms, norms_upper, period_days, vegetarian_flag, no_added_sugar,
+                     lambda category: bool(present & CATEGORY_BITS[category]))
+    for row in rows:
+        family = row.pop('family')
+        if family.startswith(('Min_', 'Max_')):
+            row['coeffs'] = dict(enumerate(nutrients[family[4:]]))
+            continue
+        terms = [(CATEGORY_BITS[category], sign) for category, sign in GROUP_ROW_TERMS[family]]
+        coeffs = {}
+        for k, mask in enumerate(masks):
+            c = sum(sign for bit, sign in terms if mask & bit)
+            if c:
+                coeffs[k] = c
+        row['coeffs'] = coeffs
+    # Objective: price + small health-aware nudges
+    # price term dominates, nudges push away from sweets/refined grains and toward vegetables/whole grains/legumes
+    nudges = [(CATEGORY_BITS[category], w) for category, w in OBJECTIVE_NUDGES.items()]
+    return {
+        'foods': [{'name': catalog.columns.name(i)} for i in product_ids],
+        'cost': [price + sum(w for bit, w in nudges if mask & bit) for price, mask in zip(prices, masks)],
+        'upper': [product_upper_bound(period_days)] * len(product_ids),
+        'rows': rows
+    }
+
+
+# Shortest time limit handed to a solver once the budget is spent (0 means "no limit" to CBC)
+MIN_SOLVE_SECONDS = 0.01
+# Row and bound violation up to which a solution cut short by the time limit still counts as feasible
+FEASIBILITY_TOLERANCE = 1e-6
+
+# Wall-clock deadline of the LP solves running on this thread (see solve_budget)
+_budget = threading.local()
+
+
+@contextmanager
+def solve_budget(seconds):
+    """Limits the LP solves in the enclosed block on this thread to ``seconds`` of wall-clock time in total.
+
+    A solve that runs out of time returns the status 'Time Limit', with its
+    amounts and objective if it had reached a feasible point and without
+    them (objective None) otherwise. ``seconds`` of None or 0 means no limit.
+    """
+    previous = getattr(_budget, 'deadline', None)
+    _budget.deadline = time.monotonic() + seconds if seconds else None
+    try:
+        yield
+    finally:
+        _budget.deadline = previous
+
+
+def remaining_budget():
+    """Seconds left of this thread's solve budget, or None without one."""
+    deadline = getattr(_budget, 'deadline', None)
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), MIN_SOLVE_SECONDS)
+
+
+def lp_feasible(lp, amounts):
+    """True if ``amounts`` satisfy the bounds and rows of ``lp`` within FEASIBILITY_TOLERANCE."""
+    if any(a < -FEASIBILITY_TOLERANCE or a > u + FEASIBILITY_TOLERANCE for a, u in zip(amounts, lp['upper'])):
+        return False
+    for row in lp['rows']:
+        activity = sum(c * amounts[i] for i, c in row['coeffs'].items())
+        tolerance = FEASIBILITY_TOLERANCE * max(1.0, abs(row['rhs']))
+        if row['sense'] != '<=' and activity < row['rhs'] - tolerance:
+            return False
+        if row['sense'] != '>=' and activity > row['rhs'] + tolerance:
+            return False
+    return True
+
+
+def make_safe_var(name: str) -> str:
+    base = ''.join(ch if ch.isalnum() else '_' for ch in name)
+    base = base.strip('_') or 'var'
+    return base
+
+
+def solve_with_pulp(lp):
+    """Solves the LP through PuLP and the CBC command-line solver."""
+    foods = lp['foods']
+    model = LpProblem("Budget_Diet_Optimization", LpMinimize)
+
+    # Safe solver variable names
+    used = set()
+    integer = set(lp.get('integer', ()))
+    x = []
+    for i, f in enumerate(foods):
+        candidate = make_safe_var(f['name'])
+        v = candidate
+        idx = 2
+        while v in used:
+            v = f"{candidate}_{idx}"
+            idx += 1
+        used.add(v)
+        x.append(LpVariable(v, lowBound=0, upBound=lp['upper'][i], cat='Integer' if i in integer else 'Continuous'))
+
+    model += lpSum(c * x[i] for i, c in enumerate(lp['cost'])), "Total_Cost_With_Health_Nudges"
+    for row in lp['rows']:
+        expr = lpSum(c * x[i] for i, c in row['coeffs'].items())
+        if row['sense'] == '>=':
+            model += expr >= row['rhs'], row['name']
+        elif row['sense'] == '<=':
+            model += expr <= row['rhs'], row['name']
+        else:
+            model += expr == row['rhs'], row['name']
+
+    time_limit = remaining_budget()
+    solver = PULP_CBC_CMD(options=['primal', '-feasTol 1e-6'], msg=False, timeLimit=time_limit)
+    status = model.solve(solver)
+    amounts = [value(v) or 0.0 for v in x]
+    if time_limit is not None and LpStatus[status] == 'Optimal' and model.sol_status != LpSolutionOptimal:
+        # CBC stopped on time; PuLP still says 'Optimal', so check the point it stopped at
+        if not lp_feasible(lp, amounts):
+            return 'Time Limit', [0.0] * len(foods), None
+        return 'Time Limit', amounts, value(model.objective)
+    return LpStatus[status], amounts, value(model.objective)
+
+
+# scipy.optimize.linprog status codes mapped onto PuLP's status names
+HIGHS_STATUS = {0: 'Optimal', 1: 'Not Solved', 2: 'Infeasible', 3: 'Unbounded', 4: 'Undefined'}
+
+
+def lp_to_arrays(lp):
+    """Assembles cost, sparse constraint matrices and bounds as NumPy arrays."""
+    n = len(lp['foods'])
+    ub_rows, ub_cols, ub_vals, b_ub = [], [], [], []
+    eq_rows, eq_cols, eq_vals, b_eq = [], [], [], []
+    for row in lp['rows']:
+        if row['sense'] == '==':
+            r = len(b_eq)
+            b_eq.append(row['rhs'])
+            target = (eq_rows, eq_cols, eq_vals)
+            sign = 1.0
+        else:
+            # linprog only takes A_ub @ x <= b_ub, so flip '>=' rows
+            r = len(b_ub)
+            sign = -1.0 if row['sense'] == '>=' else 1.0
+            b_ub.append(sign * row['rhs'])
+            target = (ub_rows, ub_cols, ub_vals)
+        for i, c in row['coeffs'].items():
+            if c:
+                target[0].append(r)
+                target[1].append(i)
+                target[2].append(sign * c)
+    A_ub = csr_matrix((ub_vals, (ub_rows, ub_cols)), shape=(len(b_ub), n)) if b_ub else None
+    A_eq = csr_matrix((eq_vals, (eq_rows, eq_cols)), shape=(len(b_eq), n)) if b_eq else None
+    arrays = {
+        'c': np.asarray(lp['cost'], dtype=float),
+        'A_ub': A_ub,
+        'b_ub': np.asarray(b_ub, dtype=float) if b_ub else None,
+        'A_eq': A_eq,
+        'b_eq': np.asarray(b_eq, dtype=float) if b_eq else None,
+        'bounds': np.column_stack([np.zeros(n), np.asarray(lp['upper'], dtype=float)])
+    }
+    if lp.get('integer'):
+        arrays['integrality'] = np.zeros(n, dtype=int)
+        arrays['integrality'][list(lp['integer'])] = 1
+    return arrays
+
+
+def solve_with_highs(lp):
+    """Solves the LP (or MIP, see build_diet_lp) in-process with HiGHS through scipy.optimize.linprog."""
+    arrays = lp_to_arrays(lp)
+    options = {'primal_feasibility_tolerance': 1e-6}
+    time_limit = remaining_budget()
+    if time_limit is not None:
+        options['time_limit'] = time_limit
+    res = linprog(method='highs', options=options, **arrays)
+    status = HIGHS_STATUS.get(res.status, 'Undefined')
+    if time_limit is not None and res.status == 1:
+        status = 'Time Limit'
+        if res.x is not None and not lp_feasible(lp, res.x):
+            return status, [0.0] * len(lp['foods']), None
+    if res.x is None:
+        return status, [0.0] * len(lp['foods']), None
+    # Drop numerical noise so near-zero amounts do not show up as 0 g items
+    amounts = [float(v) if v > 1e-9 else 0.0 for v in res.x]
+    return status, amounts, float(res.fun)
+
+
+SOLVER_BACKENDS = {
+    'pulp': solve_with_pulp,
+    'highs': solve_with_highs
+}
+
+
+def solve_diet_lp(lp, backend='pulp'):
+    """Solves the LP with the named backend; returns (status, amounts, objective)."""
+    if backend == 'highs' and linprog is None:
+        logging.warning("SciPy is not installed, falling back to the PuLP/CBC solver backend")
+        backend = 'pulp'
+    solve = SOLVER_BACKENDS.get(backend)
+    if solve is None:
+        raise ValueError(f"Unknown solver backend: {backend}")
+    return solve(lp)
+
+
+def bitset_to_mask(bits, n):
+    """Expands a product bitset (bit i = product i) into a boolean NumPy array."""
+    raw = bits.to_bytes((n + 7) // 8 or 1, 'little')
+    return np.unpackbits(np.frombuffer(raw, dtype=np.uint8), bitorder='little')[:n].astype(bool)
+
+
+def mask_to_bitset(mask):
+    """Packs a boolean NumPy array back into a product bitset."""
+    return int.from_bytes(np.packbits(mask, bitorder='little').tobytes(), 'little')
+
+
+class DietModelTemplate:
+    """Full-catalog diet LP built once per catalog version and patched per request.
+
+    The constraint matrix has one row per ROW_FAMILIES entry over every
+    product. A request only changes row bounds (rows that do not apply
+    become free) and column bounds (unavailable products are fixed to 0).
+    With highspy installed each thread keeps a resident Highs instance, so
+    consecutive solves warm-start from the previous optimal basis; without
+    it the cached matrix is sliced and solved cold through linprog.
+    """
+
+    def __init__(self, catalog):
+        self.version = catalog.version
+        self.size = len(catalog)
+        self.category_products = catalog.category_products
+        self.family_index = {family: r for r, family in enumerate(ROW_FAMILIES)}
+        # Coefficients come straight from the catalog's column arrays, indexed by product
+        nutrients = catalog.columns.array('nutrients')
+        in_category = {category: (catalog.columns.array('category_mask') & bit) != 0
+                       for category, bit in CATEGORY_BITS.items()}
+        rows, cols, vals = [], [], []
+        for r, family in enumerate(ROW_FAMILIES):
+            if family.startswith(('Min_', 'Max_')):
+                coefficients = nutrients[:, nut_keys.index(family[4:])]
+            else:
+                coefficients = sum(sign * in_category[category] for category, sign in GROUP_ROW_TERMS[family])
+            nonzero = np.flatnonzero(coefficients)
+            rows.append(np.full(len(nonzero), r))
+            cols.append(nonzero)
+            vals.append(coefficients[nonzero])
+        self.matrix = csr_matrix((np.concatenate(vals).astype(float), (np.concatenate(rows), np.concatenate(cols))),
+                                 shape=(len(ROW_FAMILIES), self.size))
+        self.cost = objective_costs(catalog)
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # Highs instances stay with their thread; workers build their own
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def request_bounds(self, available, norms, norms_upper, period_days, vegetarian_flag, no_added_sugar):
+        """Row and column bounds for one request; returns (rows, row_lower, row_upper, col_upper)."""
+        rows = diet_rows(norms, norms_upper, period_days, vegetarian_flag, no_added_sugar,
+                         lambda category: bool(self.category_products[category] & available))
+        row_lower = np.full(len(ROW_FAMILIES), -np.inf)
+        row_upper = np.full(len(ROW_FAMILIES), np.inf)
+        for row in rows:
+            r = self.family_index[row['family']]
+            if row['sense'] in ('>=', '=='):
+                row_lower[r] = row['rhs']
+            if row['sense'] in ('<=', '=='):
+                row_upper[r] = row['rhs']
+        col_upper = np.where(bitset_to_mask(available, self.size), float(product_upper_bound(period_days)), 0.0)
+        return rows, row_lower, row_upper, col_upper
+
+    def _highs(self):
+        h = getattr(self._local, 'highs', None)
+        if h is None:
+            n, m = self.size, len(ROW_FAMILIES)
+            csc = self.matrix.tocsc()
+            lp = highspy.HighsLp()
+            lp.num_col_ = n
+            lp.num_row_ = m
+            lp.col_cost_ = self.cost
+            lp.col_lower_ = np.zeros(n)
+            lp.col_upper_ = np.zeros(n)
+            lp.row_lower_ = np.full(m, -highspy.kHighsInf)
+            lp.row_upper_ = np.full(m, highspy.kHighsInf)
+            lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+            lp.a_matrix_.start_ = csc.indptr
+            lp.a_matrix_.index_ = csc.indices
+            lp.a_matrix_.value_ = csc.data
+            h = highspy.Highs()
+            h.setOptionValue('output_flag', False)
+            h.setOptionValue('solver', 'simplex')
+            h.setOptionValue('primal_feasibility_tolerance', 1e-6)
+            h.passModel(lp)
+            self._local.highs = h
+        return h
+
+    def _solve_highspy(self, row_lower, row_upper, col_upper, cost=None):
+        h = self._highs()
+        n, m = self.size, len(ROW_FAMILIES)
+        # A cost override (e.g. a price sweep) stays on the instance until the next solve resets it
+        if cost is not None or getattr(self._local, 'cost_override', False):
+            h.changeColsCost(n, np.arange(n, dtype=np.int32), self.cost if cost is None else cost)
+            self._local.cost_override = cost is not None
+        h.changeColsBounds(n, np.arange(n, dtype=np.int32), np.zeros(n), col_upper)
+        h.changeRowsBounds(m, np.arange(m, dtype=np.int32),
+                           np.nan_to_num(row_lower, neginf=-highspy.kHighsInf),
+                           np.nan_to_num(row_upper, posinf=highspy.kHighsInf))
+        time_limit = remaining_budget()
+        h.setOptionValue('time_limit', time_limit if time_limit is not None else highspy.kHighsInf)
+        h.run()
+        model_status = h.getModelStatus()
+        if model_status == highspy.HighsModelStatus.kOptimal:
+            status = 'Optimal'
+        elif model_status in (highspy.HighsModelStatus.kInfeasible, highspy.HighsModelStatus.kUnboundedOrInfeasible):
+            status = 'Infeasible'
+        elif model_status == highspy.HighsModelStatus.kTimeLimit:
+            status = 'Time Limit'
+        else:
+            status = 'Not Solved'
+        logging.debug(f"Template solve: {status} in {h.getInfo().simplex_iteration_count} simplex iterations")
+        if status == 'Time Limit' and h.getInfo().primal_solution_status == 2:
+            # Out of time at a primal feasible point: keep it
+            return status, np.asarray(h.getSolution().col_value), h.getInfo().objective_function_value
+        if status != 'Optimal':
+            return status, np.zeros(n), None
+        return status, np.asarray(h.getSolution().col_value), h.getInfo().objective_function_value
+
+    def _highspy_sensitivity(self):
+        # Duals and ranging of the last optimal solve on this thread's Highs instance
+        h = self._highs()
+        solution = h.getSolution()
+        ranging_status, ranging = h.getRanging()
+        info = {'row_dual': np.asarray(solution.row_dual), 'col_dual': np.asarray(solution.col_dual), 'ranging': None}
+        if ranging_status == highspy.HighsStatus.kOk and ranging.valid:
+            info['ranging'] = {
+                'cost_down': np.asarray(ranging.col_cost_dn.value_),
+                'cost_up': np.asarray(ranging.col_cost_up.value_),
+                'row_down': np.asarray(ranging.row_bound_dn.value_),
+                'row_up': np.asarray(ranging.row_bound_up.value_)
+            }
+        return info
+
+    def _solve_linprog(self, row_lower, row_upper, col_upper, cost=None, sensitivity=False):
+        # linprog has no ranged or free rows: keep only bounded sides of active rows
+        eq = np.flatnonzero(row_lower == row_upper)
+        ge = np.flatnonzero(np.isfinite(row_lower) & (row_lower != row_upper))
+        le = np.flatnonzero(np.isfinite(row_upper) & (row_lower != row_upper))
+        A_ub = vstack([-self.matrix[ge], self.matrix[le]]).tocsr()
+        b_ub = np.concatenate([-row_lower[ge], row_upper[le]])
+        options = {'primal_feasibility_tolerance': 1e-6}
+        time_limit = remaining_budget()
+        if time_limit is not None:
+            options['time_limit'] = time_limit
+        res = linprog(self.cost if cost is None else cost,
+                      A_ub=A_ub if len(b_ub) else None, b_ub=b_ub if len(b_ub) else None,
+                      A_eq=self.matrix[eq] if len(eq) else None, b_eq=row_lower[eq] if len(eq) else None,
+                      bounds=np.column_stack([np.zeros(self.size), col_upper]),
+                      method='highs', options=options)
+        status = HIGHS_STATUS.get(res.status, 'Undefined')
+        if time_limit is not None and res.status == 1:
+            status = 'Time Limit'
+            if res.x is not None:
+                activity = self.matrix @ res.x
+                tolerance = FEASIBILITY_TOLERANCE * np.maximum(1.0, np.abs(activity))
+                if np.any(activity < row_lower - tolerance) or np.any(activity > row_upper + tolerance):
+                    res.x = None
+        if res.x is None:
+            return (status, np.zeros(self.size), None) + ((None,) if sensitivity else ())
+        if not sensitivity:
+            return status, res.x, float(res.fun)
+        # Marginals are d(objective)/d(b); '>=' rows were flipped, so their sign flips back
+        row_dual = np.zeros(len(ROW_FAMILIES))
+        if len(b_ub):
+            row_dual[ge] = -res.ineqlin.marginals[:len(ge)]
+            row_dual[le] = res.ineqlin.marginals[len(ge):]
+        if len(eq):
+            row_dual[eq] = res.eqlin.marginals
+        col_dual = np.asarray(res.lower.marginals) + np.asarray(res.upper.marginals)
+        return status, res.x, float(res.fun), {'row_dual': row_dual, 'col_dual': col_dual, 'ranging': None}
+
+    def solve(self, available, norms, norms_upper, period_days, vegetarian_flag, no_added_sugar):
+        """Solves one request; returns (status, amounts per catalog product, objective)."""
+        _, row_lower, row_upper, col_upper = self.request_bounds(
+            available, norms, norms_upper, period_days, vegetarian_flag, no_added_sugar)
+        if highspy is not None:
+            status, x, objective = self._solve_highspy(row_lower, row_upper, col_upper)
+        else:
+            status, x, objective = self._solve_linprog(row_lower, row_upper, col_upper)
+        # Drop numerical noise so near-zero amounts do not show up as 0 g items
+        amounts = [float(v) if v > 1e-9 else 0.0 for v in x]
+        return status, amounts, objective
+
+    def analyze(self, available, norms, norms_upper, period_days, vegetarian_flag, no_added_sugar, cost=None):
+        """Solves one request and keeps its dual information.
+
+        Returns (status, amounts, objective, rows, info); ``rows`` are the
+        request's active rows and ``info`` holds ``row_dual`` (objective
+        change per unit of row bound, per ROW_FAMILIES entry), ``col_dual``
+        (reduced cost per product) and, with highspy, ``ranging``: the
+        cost and row-bound intervals over which the optimal basis stays
+        optimal. ``info`` is None unless the status is 'Optimal'. ``cost``
+        replaces the objective coefficients for this solve only;
+        consecutive highspy solves warm-start from the previous basis.
+        """
+        rows, row_lower, row_upper, col_upper = self.request_bounds(
+            available, norms, norms_upper, period_days, vegetarian_flag, no_added_sugar)
+        if highspy is not None:
+            status, x, objective = self._solve_highspy(row_lower, row_upper, col_upper, cost)
+            info = self._highspy_sensitivity() if status == 'Optimal' else None
+        else:
+            status, x, objective, info = self._solve_linprog(row_lower, row_upper, col_upper, cost, sensitivity=True)
+            if status != 'Optimal':
+                info = None
+        amounts = [float(v) if v > 1e-9 else 0.0 for v in x]
+        return status, amounts, objective, rows, info
+
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def get_model_template(catalog) -> DietModelTemplate:
+    """Returns the resident model template for the catalog's version, building it once."""
+    with _templates_lock:
+        template = _templates.get(catalog.version)
+        if template is None:
+            template = DietModelTemplate(catalog)
+            # Only the current catalog version stays resident
+            _templates.clear()
+            _templates[catalog.version] = template
+        return template
+
+
+def reset_solver_instances():
+    """Drops Highs instances inherited from a parent process; a forked worker builds its own on first use.
+
+    The template matrices stay shared copy-on-write.
+    """
+    for template in _templates.values():
+        template._local = threading.local()
+    if highspy is not None:
+        highspy.Highs.resetGlobalScheduler(True)
+
+
+def install_model_template(template):
+    """Makes a prebuilt template (e.g. shipped to a worker process) the resident one."""
+    with _templates_lock:
+        _templates.clear()
+        _templates[template.version] = template
+
+
+def solve_request(catalog, available, norms, norms_upper, period_days, vegetarian_flag, no_added_sugar, backend='pulp'):
+    """Solves the diet for the products in the ``available`` bitset.
+
+    Returns (status, {product index: units of 100 g}, objective). The 'highs'
+    backend reuses the catalog's resident model template; 'pulp' builds the
+    LP over the available products and solves it with CBC.
+    """
+    if backend == 'highs' and linprog is None:
+        logging.warning("SciPy is not installed, falling back to the PuLP/CBC solver backend")
+        backend = 'pulp'
+    if backend == 'highs':
+        with timed('model_build'):
+            template = get_model_template(catalog)
+        with timed('solve'):
+            status, amounts, objective = template.solve(available, norms, norms_upper, period_days, vegetarian_flag, no_added_sugar)
+        return status, {i: amounts[i] for i in bit_indices(available)}, objective
+    product_ids = bit_indices(available)
+    with timed('model_build'):
+        lp = build_diet_lp(catalog, product_ids, norms, norms_upper, period_days, vegetarian_flag, no_added_sugar)
+    with timed('solve'):
+        status, amounts, objective = solve_diet_lp(lp, backend)
+    return status, dict(zip(product_ids, amounts)), objective
@@ -0,0 +1,31 @@
+import gc
+import logging
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:8000')
+# /meal-plan jobs and stored /optimize results are shared between workers through SQLite files
+# (MEAL_PLAN_JOB_STORE_PATH, OPTIMIZE_RESULT_STORE_PATH), so any worker answers a poll or a result_id
+# Set the worker count here (WEB_CONCURRENCY), not with --workers: the app reads it back to split the cores
+# between workers, SOLVER_CONCURRENCY defaulting to max(1, cores // workers) solves per worker
+workers = int(os.getenv('WEB_CONCURRENCY', '0')) or multiprocessing.cpu_count()
+os.environ['WEB_CONCURRENCY'] = str(workers)
+# Threads per worker; LP solves are further limited by SOLVER_CONCURRENCY
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+loglevel = os.getenv('LOG_LEVEL', 'info').lower()
+# Build and warm the app once in the master so workers share the catalog and solver templates copy-on-write
+preload_app = True
+
+
+def when_ready(server):
+    import wsgi
+    from metrics import process_memory
+    # Objects created so far are never collected, so GC passes in the workers do not touch (and copy) their pages
+    gc.freeze()
+    logging.info(f"Master ready in {wsgi.startup_seconds:.2f} s, rss {process_memory()['rss'] / 2 ** 20:.1f} MB")
+
+
+def post_fork(server, worker):
+    import wsgi
+    wsgi.post_fork()
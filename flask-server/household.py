@@ -0,0 +1,253 @@
+import json
+import math
+from contextlib import nullcontext
+
+from catalog_store import bit_indices
+from diagnosis import diagnose_infeasibility
+from diet_model import build_diet_lp, solve_diet_lp
+from metrics import SOLVER_STATUS, timed
+from optimizer import COVERAGE_GROUPS, allergen_report, available_products, describe_diet, parse_profile, result_cache_key
+
+
+def parse_household(data, catalog, max_members=12):
+    """Validates an /optimize/household body; returns (household, error message).
+
+    ``members`` is a list of /optimize profiles, each with an optional
+    ``name``; they share one ``period`` (default 'week'). ``pack_sizes``
+    optionally rounds purchases up to whole packs: grams per pack for
+    every product, or {product name: grams} for some of them, each named
+    product being in ``catalog``.
+    """
+    if not isinstance(data, dict):
+        return None, 'Invalid input: JSON object required'
+    members = data.get('members')
+    if not isinstance(members, list) or not members:
+        return None, 'Invalid input: non-empty list of members required'
+    if len(members) > max_members:
+        return None, f'Invalid input: at most {max_members} members per household'
+    period = str(data.get('period', 'week'))
+    parsed = []
+    for k, member in enumerate(members):
+        if not isinstance(member, dict):
+            return None, f'Invalid input: member {k + 1} must be a JSON object'
+        # Food is bought for the whole household, so every member plans over the same period
+        profile, error = parse_profile(dict(member, period=period))
+        if error:
+            return None, f'{error} (member {k + 1})'
+        parsed.append((str(member.get('name') or f'member_{k + 1}'), profile))
+    if len({name for name, _ in parsed}) < len(parsed):
+        return None, 'Invalid input: member names must be unique'
+
+    pack_sizes = data.get('pack_sizes')
+    if pack_sizes is not None:
+        sizes = pack_sizes.values() if isinstance(pack_sizes, dict) else [pack_sizes]
+        try:
+            if not all(float(grams) > 0 and math.isfinite(float(grams)) for grams in sizes):
+                return None, 'Invalid input: pack sizes must be positive grams'
+        except (TypeError, ValueError):
+            return None, 'Invalid input: pack sizes must be numeric grams'
+        if isinstance(pack_sizes, dict):
+            unknown = [name for name in pack_sizes if not catalog.columns.find_all(name)]
+            if unknown:
+                return None, f"Invalid input: unknown product in pack_sizes: {', '.join(map(str, unknown))}"
+    return {
+        'members': parsed,
+        'period': period,
+        'period_days': parsed[0][1]['period_days'],
+        'pack_sizes': pack_sizes
+    }, None
+
+
+def household_cache_key(household, catalog_version, norm_digits=3):
+    """Result cache key: every member's solver inputs (see result_cache_key) plus names and pack sizes."""
+    return json.dumps({
+        'members': [[name, json.loads(result_cache_key(profile, catalog_version, norm_digits))]
+                    for name, profile in household['members']],
+        'pack_sizes': household['pack_sizes']
+    }, sort_keys=True)
+
+
+def pack_units(catalog, product_ids, pack_sizes):
+    """{product index: pack size in units of 100 g} for the packed products; returns (packs, error message)."""
+    if pack_sizes is None:
+        return {}, None
+    if not isinstance(pack_sizes, dict):
+        return {i: float(pack_sizes) / 100 for i in product_ids}, None
+    available = set(product_ids)
+    packs = {}
+    for name, grams in pack_sizes.items():
+        matches = catalog.columns.find_all(name)
+        if not matches:
+            return None, f'Unknown product in pack_sizes: {name}'
+        # Every product of that name gets the size; products no member may eat are never bought
+        for i in matches:
+            if i in available:
+                packs[i] = float(grams) / 100
+    return packs, None
+
+
+def build_household_lp(catalog, members, product_ids, packs):
+    """One LP for the whole household.
+
+    Each member gets their own consumption columns (units of 100 g of each
+    product available to them) and their own copy of the diet rows, built
+    from their norms. Consumption is paid for through shared purchases:
+    unpacked products at their price per unit eaten, packed products
+    through an integer pack count per product that must cover what all
+    members eat of it (leftovers allowed). Returns (lp, member columns,
+    pack columns): {product index: column} per member and for the packs.
+    """
+    foods, cost, upper, rows = [], [], [], []
+    member_columns = []
+    eaten_by = {i: [] for i in product_ids}
+    for k, (name, profile, available) in enumerate(members):
+        ids = bit_indices(available)
+        lp = build_diet_lp(catalog, ids, profile['norms'], profile['norms_upper'], profile['period_days'],
+                           profile['vegetarian'], profile['no_added_sugar'])
+        columns = {}
+        for local, (i, food) in enumerate(zip(ids, lp['foods'])):
+            columns[i] = len(foods)
+            eaten_by[i].append(len(foods))
+            foods.append({'name': f"m{k + 1}_{food['name']}"})
+            # A packed product's price is paid per pack; members only carry the health nudges
+            cost.append(lp['cost'][local] - (catalog.columns.price(i) if i in packs else 0))
+            upper.append(lp['upper'][local])
+        for row in lp['rows']:
+            rows.append(dict(row, name=f"m{k + 1}_{row['name']}",
+                             coeffs={columns[ids[local]]: c for local, c in row['coeffs'].items()}))
+        member_columns.append(columns)
+
+    integer = []
+    pack_columns = {}
+    for i, units in packs.items():
+        if not eaten_by[i]:
+            continue
+        column = len(foods)
+        pack_columns[i] = column
+        integer.append(column)
+        foods.append({'name': f"Packs_{catalog.columns.name(i)}"})
+        cost.append(catalog.columns.price(i) * units)
+        upper.append(math.ceil(sum(upper[c] for c in eaten_by[i]) / units))
+        coeffs = {c: 1.0 for c in eaten_by[i]}
+        coeffs[column] = -units
+        rows.append({'name': f"Pack_{i}", 'coeffs': coeffs, 'sense': '<=', 'rhs': 0.0})
+    return {'foods': foods, 'cost': cost, 'upper': upper, 'rows': rows, 'integer': integer}, member_columns, pack_columns
+
+
+def solve_household(catalog, household, backend='pulp'):
+    """Solves the household LP (a MIP with pack sizes) and splits the result per member.
+
+    Returns the member results (each in the /optimize layout plus the
+    ``cost`` of what they eat) and the shared ``basket``: grams eaten,
+    packs and grams bought and the cost per product. An infeasible household reports the
+    relaxations each infeasible member would need.
+    """
+    members = [(name, profile, available_products(catalog, profile)) for name, profile in household['members']]
+    if not all(available for _, _, available in members):
+        return {'error': 'No foods available after applying restrictions'}
+    union = 0
+    for _, _, available in members:
+        union |= available
+    product_ids = bit_indices(union)
+    packs, error = pack_units(catalog, product_ids, household['pack_sizes'])
+    if error:
+        return {'error': error}
+
+    with timed('model_build'):
+        lp, member_columns, pack_columns = build_household_lp(catalog, members, product_ids, packs)
+    with timed('solve'):
+        status, amounts, objective = solve_diet_lp(lp, backend)
+    SOLVER_STATUS.inc(status=status)
+
+    if status != 'Optimal' and not (status == 'Time Limit' and objective is not None):
+        error_msg = {'error': 'No optimal solution found', 'status': status}
+        if status == 'Time Limit':
+            error_msg['details'] = 'The solver ran out of its time budget before reaching a feasible household plan'
+        if status == 'Infeasible':
+            # Shared purchases never make a household infeasible: diagnose each member on their own
+            error_msg['members'] = []
+            for name, profile, available in members:
+                relaxations, _ = diagnose_infeasibility(
+                    catalog, bit_indices(available), profile['norms'], profile['norms_upper'],
+                    profile['period_days'], profile['vegetarian'], profile['no_added_sugar'], backend)
+                if relaxations:
+                    error_msg['members'].append({'name': name, 'relaxations': relaxations})
+            error_msg['details'] = 'Infeasible constraints for ' + ', '.join(m['name'] for m in error_msg['members'])
+        return error_msg
+
+    with timed('assemble'):
+        results = []
+        eaten = {}
+        for (name, profile, available), columns in zip(members, member_columns):
+            groups = {category: catalog.products_in(category, available) for category in COVERAGE_GROUPS}
+            summary = describe_diet(catalog, list(columns), groups, {i: amounts[c] for i, c in columns.items()})
+            results.append({
+                'name': name,
+                'diet': summary['diet'],
+                'items': summary['items'],
+                'cost': round(sum(item['cost'] for item in summary['items']), 2),
+                'nutrient_totals': summary['nutrient_totals'],
+                'coverage': summary['coverage']
+            })
+            for i, c in columns.items():
+                eaten[i] = eaten.get(i, 0.0) + amounts[c]
+
+        basket = []
+        for i in product_ids:
+            units = eaten.get(i, 0.0)
+            price = catalog.columns.price(i)
+            if i in pack_columns:
+                count = round(amounts[pack_columns[i]])
+                if not count:
+                    continue
+                bought = count * packs[i]
+                item = {'packs': count, 'pack_grams': round(packs[i] * 100, 2)}
+            elif units > 0:
+                bought = units
+                item = {}
+            else:
+                continue
+            basket.append(dict({
+                'name': catalog.columns.name(i),
+                'grams': round(units * 100, 2),
+                'purchased_grams': round(bought * 100, 2),
+                'cost': round(price * bought, 2)
+            }, **item))
+    return {
+        'status': status,
+        'members': results,
+        'basket': {
+            'items': basket,
+            'leftover_grams': round(sum(item['purchased_grams'] - item['grams'] for item in basket), 2)
+        },
+        'total_cost': round(sum(item['cost'] for item in basket), 2)
+    }
+
+
+def optimize_household(catalog, household, backend='pulp', cache=None, norm_digits=3, scheduler=None):
+    """Solves a parsed household in one solve, serving repeated inputs from ``cache``.
+
+    Like optimize_profile() the solve holds a ``scheduler`` slot (which may
+    raise scheduler.SolverBusyError); only solved, not time-limited,
+    results are cached. Successful payloads carry each member's own norms and allergen
+    report and the shared ``period``.
+    """
+    key = household_cache_key(household, catalog.version, norm_digits) if cache is not None else None
+    result = cache.get(key) if cache is not None else None
+    cache_state = 'hit' if result is not None else 'miss'
+    if result is None:
+        with scheduler.slot() if scheduler is not None else nullcontext():
+            result = solve_household(catalog, household, backend)
+        if cache is not None and 'error' not in result and result.get('status') != 'Time Limit':
+            cache.set(key, result)
+    payload = dict(result)
+    if 'error' not in payload:
+        profiles = dict(household['members'])
+        payload['members'] = [dict(member,
+                                   norms={nut: round(v, 2) for nut, v in profiles[member['name']]['norms'].items()},
+                                   excluded_by_allergen=allergen_report(catalog, profiles[member['name']]['allergens']))
+                              for member in payload['members']]
+        payload['period'] = household['period']
+    if cache is not None:
+        payload['cache'] = cache_state
+    return payload
@@ -0,0 +1,268 @@
+"""Bulk catalog ingestion: streams CSV/JSON price and nutrient feeds into the products table.
+
+    python ingest.py prices.csv [more feeds ...] [--db db/food.db] [--strict]
+
+Feeds carry one product per row under the catalog_products column names
+(name, protein, fat, carbs, kj, kcal, A, B1, B2, PP, C, Ca, P, Fe,
+allergens, price_per_kg, price_per_100g) or the products table's own
+spreadsheet headers. Rows are upserted by product name in one WAL-mode
+transaction, so readers keep serving the previous catalog until it
+commits, and the catalog revision is bumped.
+"""
+import argparse
+import csv
+import json
+import logging
+import math
+import os
+import sqlite3
+import sys
+import time
+
+from catalog import CATALOG_VIEW, CATALOG_VIEW_SELECT, DB_PATH, PRODUCT_COLUMNS
+from nutrition import nut_keys
+
+# Schema of a products table created from scratch (the spreadsheet export layout)
+PRODUCTS_TABLE_SQL = ('CREATE TABLE IF NOT EXISTS products (id INTEGER, Product TEXT, "Olb.v." REAL, Tauki REAL, '
+                      '"Oglh." REAL, "kJ(100g)" REAL, "kcal(100g)" REAL, A REAL, B1 REAL, B2 REAL, PP REAL, C REAL, '
+                      'Ca REAL, P REAL, Fe REAL, Allergeni TEXT, Cena_1kg REAL, Cena_100g REAL, '
+                      'PRIMARY KEY (id AUTOINCREMENT))')
+
+# Largest plausible value of each field, in the unit the catalog stores it in.
+# A value above the limit is usually in the wrong unit (kJ as kcal, vitamins in µg, price per kg as per 100 g).
+FIELD_LIMITS = {
+    'protein': (100, 'g/100 g'), 'fat': (100, 'g/100 g'), 'carbs': (100, 'g/100 g'),
+    'kj': (4000, 'kJ/100 g'), 'kcal': (950, 'kcal/100 g'),
+    'A': (30, 'mg/100 g'), 'B1': (20, 'mg/100 g'), 'B2': (20, 'mg/100 g'), 'PP': (100, 'mg/100 g'),
+    'C': (3000, 'mg/100 g'), 'Ca': (3000, 'mg/100 g'), 'P': (3000, 'mg/100 g'), 'Fe': (100, 'mg/100 g'),
+    'price_per_kg': (1000, 'EUR/kg'), 'price_per_100g': (100, 'EUR/100 g')
+}
+KJ_PER_KCAL = 4.184
+# Relative disagreement allowed between kj and kcal, and between the two prices, when a feed has both
+ENERGY_TOLERANCE = 0.05
+PRICE_TOLERANCE = 0.01
+# Rows written per executemany() call
+BATCH_SIZE = 5000
+# Rejected rows reported individually
+MAX_REPORTED_ERRORS = 20
+
+# Feed header (case-insensitive) -> catalog column: the catalog names and the spreadsheet headers
+FEED_ALIASES = {name.lower(): name for name in PRODUCT_COLUMNS if name != 'id'}
+FEED_ALIASES.update({column.strip('"').lower(): name for name, column in PRODUCT_COLUMNS.items() if name != 'id'})
+# Fields a product needs before it can be added to the catalog
+REQUIRED_FOR_NEW = ['name'] + nut_keys + ['price_per_100g']
+
+
+class FeedError(Exception):
+    """A feed row that fails validation."""
+
+
+def ensure_catalog_schema(conn):
+    """Creates the products table if missing, its unique name index, the catalog_products view and catalog_meta."""
+    conn.execute(PRODUCTS_TABLE_SQL)
+    duplicates = conn.execute("SELECT Product FROM products GROUP BY Product HAVING COUNT(*) > 1 LIMIT 5").fetchall()
+    if duplicates:
+        raise FeedError(f"products has duplicate names, cannot upsert by name: {', '.join(r[0] for r in duplicates)}")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS products_name ON products (Product)")
+    conn.execute(f"CREATE VIEW IF NOT EXISTS {CATALOG_VIEW} AS {CATALOG_VIEW_SELECT}")
+    conn.execute("CREATE TABLE IF NOT EXISTS catalog_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+
+def read_feed(path, fmt=None):
+    """Yields (line number, raw row dict) from a CSV, JSON array or NDJSON feed, one row at a time.
+
+    The format comes from ``fmt`` or the file extension; CSV delimiters
+    (comma, semicolon or tab) are detected from the header.
+    """
+    fmt = fmt or {'.json': 'json', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}.get(os.path.splitext(path)[1].lower(), 'csv')
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if fmt == 'csv':
+            try:
+                dialect = csv.Sniffer().sniff(f.readline(), delimiters=',;\t')
+            except csv.Error:
+                dialect = csv.excel
+            f.seek(0)
+            reader = csv.DictReader(f, dialect=dialect)
+            for row in reader:
+                yield reader.line_num, row
+        elif fmt == 'ndjson':
+            for line_no, line in enumerate(f, 1):
+                if line.strip():
+                    yield line_no, json.loads(line)
+        elif fmt == 'json':
+            data = json.load(f)
+            for line_no, row in enumerate(data.get('products', []) if isinstance(data, dict) else data, 1):
+                yield line_no, row
+        else:
+            raise ValueError(f"Unknown feed format: {fmt}")
+
+
+def _number(field, value):
+    if isinstance(value, str):
+        # Spreadsheet exports use decimal commas
+        value = value.strip().replace(',', '.')
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise FeedError(f"{field} is not a number: {value!r}")
+    if not math.isfinite(number) or number < 0:
+        raise FeedError(f"{field} must be a non-negative number, got {value!r}")
+    limit, unit = FIELD_LIMITS[field]
+    if number > limit:
+        raise FeedError(f"{field} {number:g} is above {limit} {unit}; check the feed's units")
+    return number
+
+
+def normalize_row(raw):
+    """Maps a raw feed row onto catalog columns and validates it; returns {column: value}.
+
+    Missing and empty fields are left out, so an update only touches the
+    columns the feed has. kj/kcal and the two prices are derived from each
+    other when only one is given, and must agree when both are.
+    """
+    if not isinstance(raw, dict):
+        raise FeedError('row is not an object')
+    row = {}
+    for header, value in raw.items():
+        field = FEED_ALIASES.get(str(header or '').strip().lower())
+        if field is None or value is None or (isinstance(value, str) and not value.strip()):
+            continue
+        if field == 'name':
+            row['name'] = str(value).strip()
+        elif field == 'allergens':
+            row['allergens'] = str(value).strip()
+        else:
+            row[field] = _number(field, value)
+    if not row.get('name'):
+        raise FeedError('name is missing')
+    macros = [row[nut] for nut in ('protein', 'fat', 'carbs') if nut in row]
+    if sum(macros) > 101:
+        raise FeedError(f"protein, fat and carbs add up to {sum(macros):g} g per 100 g")
+    if 'kj' in row and 'kcal' in row:
+        if abs(row['kj'] - row['kcal'] * KJ_PER_KCAL) > ENERGY_TOLERANCE * row['kj'] + 1:
+            raise FeedError(f"kj {row['kj']:g} does not match kcal {row['kcal']:g}")
+    elif 'kcal' in row:
+        row['kj'] = round(row['kcal'] * KJ_PER_KCAL, 1)
+    elif 'kj' in row:
+        row['kcal'] = round(row['kj'] / KJ_PER_KCAL, 1)
+    if 'price_per_kg' in row and 'price_per_100g' in row:
+        if abs(row['price_per_kg'] - 10 * row['price_per_100g']) > PRICE_TOLERANCE * row['price_per_kg'] + 0.01:
+            raise FeedError(f"price_per_kg {row['price_per_kg']:g} does not match price_per_100g {row['price_per_100g']:g}")
+    elif 'price_per_kg' in row:
+        row['price_per_100g'] = round(row['price_per_kg'] / 10, 4)
+    elif 'price_per_100g' in row:
+        row['price_per_kg'] = round(row['price_per_100g'] * 10, 4)
+    return row
+
+
+def _upsert_sql(fields):
+    columns = [PRODUCT_COLUMNS[field] for field in fields]
+    updates = ', '.join(f"{column} = excluded.{column}" for column in columns if column != 'Product')
+    return (f"INSERT INTO products ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT (Product) DO {'UPDATE SET ' + updates if updates else 'NOTHING'}")
+
+
+def ingest_rows(conn, rows, strict=False, source=None):
+    """Validates and upserts (line number, raw row) pairs into the products table in one transaction.
+
+    Products are matched by name: known products get only the columns the
+    row has, unknown ones are added if the row has every REQUIRED_FOR_NEW
+    field. Invalid rows are skipped and counted (the first
+    MAX_REPORTED_ERRORS with their reason), or abort the whole ingestion
+    with ``strict``. Returns the ingestion stats.
+    """
+    started = time.perf_counter()
+    stats = {'rows': 0, 'inserted': 0, 'updated': 0, 'rejected': 0, 'errors': []}
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        ensure_catalog_schema(conn)
+        # Trimmed name -> stored name, so stray spaces in the feed or the table do not duplicate products
+        known = {row[0].strip(): row[0] for row in conn.execute("SELECT Product FROM products") if row[0] is not None}
+        # Rows grouped by the set of columns they carry, flushed in BATCH_SIZE chunks
+        pending = {}
+
+        def flush(fields):
+            conn.executemany(_upsert_sql(fields), pending.pop(fields))
+
+        for line_no, raw in rows:
+            stats['rows'] += 1
+            try:
+                row = normalize_row(raw)
+                if row['name'] not in known:
+                    missing = [field for field in REQUIRED_FOR_NEW if field not in row]
+                    if missing:
+                        raise FeedError(f"new product {row['name']!r} is missing {', '.join(missing)}")
+            except FeedError as e:
+                if strict:
+                    raise FeedError(f"row {line_no}: {str(e)}")
+                stats['rejected'] += 1
+                if len(stats['errors']) < MAX_REPORTED_ERRORS:
+                    stats['errors'].append({'row': line_no, 'error': str(e)})
+                continue
+            if row['name'] in known:
+                stats['updated'] += 1
+                row['name'] = known[row['name']]
+            else:
+                stats['inserted'] += 1
+                known[row['name']] = row['name']
+            fields = tuple(sorted(row))
+            pending.setdefault(fields, []).append([row[field] for field in fields])
+            if len(pending[fields]) >= BATCH_SIZE:
+                flush(fields)
+        for fields in list(pending):
+            flush(fields)
+        if stats['inserted'] or stats['updated']:
+            conn.execute("INSERT INTO catalog_meta (key, value) VALUES ('revision', '1') "
+                         "ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+            conn.executemany("INSERT OR REPLACE INTO catalog_meta (key, value) VALUES (?, ?)",
+                             [('ingested_at', str(time.time())), ('source', source or '')])
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    row = conn.execute("SELECT value FROM catalog_meta WHERE key = 'revision'").fetchone()
+    stats['revision'] = int(row[0]) if row else None
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def connect(db_path=DB_PATH):
+    """Connection for ingestion: WAL journal (readers are never blocked by the writer), explicit transactions."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+def ingest_feeds(paths, db_path=DB_PATH, fmt=None, strict=False):
+    """Ingests feed files into ``db_path`` in one transaction; returns the ingestion stats."""
+    def rows():
+        for path in paths:
+            yield from read_feed(path, fmt)
+
+    conn = connect(db_path)
+    try:
+        return ingest_rows(conn, rows(), strict, ', '.join(os.path.basename(path) for path in paths))
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load CSV/JSON price and nutrient feeds into the product catalog.')
+    parser.add_argument('feeds', nargs='+', help='feed files (.csv, .json or .ndjson/.jsonl)')
+    parser.add_argument('--db', default=os.getenv('CATALOG_DB_PATH') or DB_PATH, help='catalog database')
+    parser.add_argument('--format', choices=('csv', 'json', 'ndjson'), help='feed format (default: from the extension)')
+    parser.add_argument('--strict', action='store_true', help='abort without changes on the first invalid row')
+    args = parser.parse_args(argv)
+
+    try:
+        stats = ingest_feeds(args.feeds, args.db, args.format, args.strict)
+    except (FeedError, OSError, ValueError, sqlite3.Error) as e:
+        logging.error(f"Ingestion failed, no changes made: {str(e)}")
+        return 1
+    print(json.dumps(stats, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
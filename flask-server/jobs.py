@@ -0,0 +1,134 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at its depth limit."""
+
+
+class JobQueue:
+    """Bounded background executor for slow jobs with submit/poll semantics.
+
+    At most ``max_workers`` jobs run at once and at most ``max_pending``
+    jobs (queued + running) are accepted. Finished jobs are kept for
+    ``ttl`` seconds so clients can poll their result.
+
+    When ``path`` is set every job record (results must be JSON-serializable)
+    is also written to that SQLite file, so any process sharing it can
+    answer a poll for a job another process runs.
+    """
+
+    def __init__(self, max_workers=4, max_pending=32, ttl=3600, path=None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, record TEXT NOT NULL, finished_at REAL)")
+            self._conn.commit()
+
+    def submit(self, fn, *args, **kwargs) -> str:
+        """Queues ``fn(*args, **kwargs)`` and returns the job ID; raises QueueFullError."""
+        with self._lock:
+            self._prune()
+            self._prune_store()
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"Job queue is full ({self.max_pending} pending jobs)")
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {'job_id': job_id, 'status': 'queued', 'created_at': time.time()}
+            self._pending += 1
+            self._save(job_id)
+        self._executor.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def _run(self, job_id, fn, args, kwargs):
+        self._update(job_id, status='running', started_at=time.time())
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            logging.error(f"Job {job_id} failed: {str(e)}")
+            self._update(job_id, status='failed', error=f'Unexpected error: {str(e)}')
+        else:
+            self._update(job_id, status='succeeded', result=result)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                if job_id in self._jobs:
+                    self._jobs[job_id]['finished_at'] = time.time()
+                    self._save(job_id)
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+                self._save(job_id)
+
+    def _save(self, job_id):
+        if self._conn is None:
+            return
+        job = self._jobs[job_id]
+        try:
+            self._conn.execute("INSERT OR REPLACE INTO jobs (job_id, record, finished_at) VALUES (?, ?, ?)",
+                               (job_id, json.dumps(job), job.get('finished_at')))
+            self._conn.commit()
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logging.error(f"Job store write failed for {job_id}: {str(e)}")
+
+    def _prune(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if 'finished_at' in job and now - job['finished_at'] > self.ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _prune_store(self):
+        # On submit only, so polls do not write to the shared file
+        if self._conn is None:
+            return
+        try:
+            self._conn.execute("DELETE FROM jobs WHERE finished_at < ?", (time.time() - self.ttl,))
+            self._conn.commit()
+        except sqlite3.Error as e:
+            logging.error(f"Job store prune failed: {str(e)}")
+
+    def get(self, job_id):
+        """Returns a copy of the job record or None if it is unknown or expired."""
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(job_id)
+            if job is None and self._conn is not None:
+                # Submitted by another process sharing the store
+                try:
+                    row = self._conn.execute("SELECT record FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+                except sqlite3.Error as e:
+                    logging.error(f"Job store read failed for {job_id}: {str(e)}")
+                    row = None
+                if row is None:
+                    return None
+                job = json.loads(row[0])
+                return job if 'finished_at' not in job or time.time() - job['finished_at'] <= self.ttl else None
+            return dict(job) if job is not None else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': self._pending,
+                'max_pending': self.max_pending,
+                'max_workers': self.max_workers,
+                'jobs': len(self._jobs),
+                'persistent': self._conn is not None
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,246 @@
+import email.utils
+import json
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Upstream answers worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class LLMClientError(Exception):
+    """Raised when the completions API call fails after all retries."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class LLMTimeoutError(LLMClientError):
+    """Raised when the completions API does not answer within the timeout."""
+
+
+class CircuitOpenError(LLMClientError):
+    """Raised without calling upstream while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Opens after ``threshold`` consecutive failures and fails fast for ``reset_timeout`` seconds.
+
+    After the timeout one trial call is let through (half-open); its outcome
+    closes or re-opens the breaker.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.opens = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half-open'
+                return True
+            return self.state == 'closed'
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half-open' or self.failures >= self.threshold:
+                if self.state != 'open':
+                    self.opens += 1
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+
+def retry_after_seconds(value):
+    """Parses a Retry-After header (delay in seconds or an HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMClient:
+    """Shared client for the chat completions API.
+
+    Keeps a bounded pool of keep-alive connections, retries 429/5xx and
+    network errors with exponential backoff and full jitter (never sooner
+    than the server's Retry-After, and not at all when that asks for more
+    than ``backoff_max`` seconds), and fails fast through a circuit
+    breaker while upstream is down. ``stats()`` exposes latency, retry and
+    breaker counters.
+    """
+
+    def __init__(self, base_url='https://api.openai.com/v1', model='gpt-3.5-turbo', api_key=None,
+                 connect_timeout=5, read_timeout=30, max_retries=3, backoff_base=0.5, backoff_max=8,
+                 pool_size=10, breaker_threshold=5, breaker_reset=30):
+        self.base_url = base_url.rstrip('/')
+        self.model = model
+        self.api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'successes': 0, 'failures': 0, 'retries': 0, 'rejected': 0,
+                       'latency_total': 0.0, 'latency_max': 0.0, 'latency_last': 0.0}
+
+    @property
+    def completions_url(self):
+        return f"{self.base_url}/chat/completions"
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, amount in increments.items():
+                self._stats[key] += amount
+
+    def _backoff(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def _post(self, body, stream=False):
+        """POSTs ``body`` with retries; returns a 200 response or raises LLMClientError.
+
+        The breaker sees each call once, after its retries: only 429/5xx
+        answers and network errors count as failures, since any other
+        answer shows upstream is up.
+        """
+        if not self.breaker.allow():
+            self._count(rejected=1)
+            raise CircuitOpenError('ChatGPT API circuit breaker is open. Please try again later.')
+        try:
+            response = self._send(body, stream)
+        except LLMClientError as e:
+            self._count(failures=1)
+            if e.status_code is None or e.status_code in RETRY_STATUS_CODES:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        self._count(successes=1)
+        self.breaker.record_success()
+        return response
+
+    def _send(self, body, stream):
+        headers = {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json'
+        }
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            retry_after = None
+            try:
+                response = self.session.post(self.completions_url, headers=headers, json=body,
+                                             timeout=self.timeout, stream=stream)
+            except requests.exceptions.Timeout:
+                error = LLMTimeoutError('ChatGPT API timeout. Please try again.')
+            except requests.exceptions.RequestException as e:
+                error = LLMClientError(f'Network error: {str(e)}')
+            else:
+                self._record_latency(started)
+                if response.status_code == 200:
+                    return response
+                error = LLMClientError(f"ChatGPT API error: {response.status_code} - {response.text}", response.status_code)
+                retry_after = retry_after_seconds(response.headers.get('Retry-After'))
+                response.close()
+                if response.status_code not in RETRY_STATUS_CODES:
+                    # Client errors (bad key, bad request) will not get better with retries
+                    raise error
+            # Another call may have opened the breaker meanwhile: stop hammering upstream
+            if attempt >= self.max_retries or self.breaker.state == 'open':
+                raise error
+            if retry_after is not None and retry_after > self.backoff_max:
+                # Never park a job or request thread for as long as upstream asks; the breaker counts the failure
+                logging.warning(f"{error}; not retrying, Retry-After of {retry_after:.0f}s exceeds {self.backoff_max}s")
+                raise error
+            delay = self._backoff(attempt, retry_after)
+            logging.warning(f"{error}; retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries})")
+            self._count(retries=1)
+            time.sleep(delay)
+            attempt += 1
+
+    def _record_latency(self, started):
+        latency = time.perf_counter() - started
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['latency_total'] += latency
+            self._stats['latency_last'] = latency
+            self._stats['latency_max'] = max(self._stats['latency_max'], latency)
+
+    def chat(self, body):
+        """Sends a chat completions request and returns the message content."""
+        response = self._post(dict(body, model=self.model))
+        try:
+            return response.json()['choices'][0]['message']['content']
+        except (ValueError, KeyError, IndexError) as e:
+            raise LLMClientError(f'Malformed ChatGPT response: {str(e)}')
+
+    def stream_chat(self, body):
+        """Sends a streaming chat completions request and yields content deltas.
+
+        Retries only happen before the stream starts; a failure mid-stream
+        raises LLMClientError.
+        """
+        response = self._post(dict(body, model=self.model, stream=True), stream=True)
+        with response:
+            # Server-sent events: one 'data: {...}' line per delta, terminated by 'data: [DONE]'
+            response.encoding = 'utf-8'
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith('data:'):
+                        continue
+                    chunk = line[len('data:'):].strip()
+                    if chunk == '[DONE]':
+                        break
+                    delta = json.loads(chunk)['choices'][0].get('delta', {}).get('content')
+                    if delta:
+                        yield delta
+            except requests.exceptions.RequestException as e:
+                raise LLMClientError(f'Network error: {str(e)}')
+            except (ValueError, KeyError, IndexError) as e:
+                raise LLMClientError(f'Malformed ChatGPT stream chunk: {str(e)}')
+
+    def stats(self):
+        """Latency, retry and breaker counters.
+
+        ``requests`` counts HTTP attempts that got an answer (the latency
+        figures are per attempt) and ``retries`` the repeated attempts;
+        ``successes``, ``failures`` and ``rejected`` (by the open breaker)
+        count calls.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['latency_avg'] = stats['latency_total'] / stats['requests'] if stats['requests'] else 0.0
+        stats['breaker_state'] = self.breaker.state
+        stats['breaker_opens'] = self.breaker.opens
+        stats['model'] = self.model
+        stats['base_url'] = self.base_url
+        return stats
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+
+def meal_plan_cache_key(request_body):
+    """Content address of a chat completions request (prompt, model and sampling parameters)."""
+    canonical = json.dumps(request_body, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class MealPlanCache:
+    """SQLite-backed cache of generated meal plans keyed on the request hash.
+
+    The table is capped at ``max_bytes`` of stored text; the least recently
+    used plans are evicted first. ``get_or_generate`` and
+    ``stream_or_generate`` are single-flight: concurrent callers with the
+    same key wait for one upstream call. A failing database (locked,
+    corrupt) reads as a miss and drops writes, so plans are still generated.
+    """
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meal_plans (key TEXT PRIMARY KEY, meal_plan TEXT NOT NULL, "
+                           "size INTEGER NOT NULL, created_at REAL NOT NULL, used_at REAL NOT NULL)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        # key -> Event set when the in-flight generation for that key finishes
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Returns the cached meal plan text or None."""
+        with self._lock:
+            try:
+                row = self._conn.execute("SELECT meal_plan FROM meal_plans WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                self._conn.execute("UPDATE meal_plans SET used_at = ? WHERE key = ?", (time.time(), key))
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logging.error(f"Meal plan cache read failed: {str(e)}")
+                return None
+            return row[0]
+
+    def set(self, key, meal_plan):
+        size = len(meal_plan.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.execute("INSERT OR REPLACE INTO meal_plans (key, meal_plan, size, created_at, used_at) VALUES (?, ?, ?, ?, ?)",
+                                   (key, meal_plan, size, now, now))
+                self._evict()
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logging.error(f"Meal plan cache write failed: {str(e)}")
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM meal_plans").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used plans until the table fits again
+        for key, size in self._conn.execute("SELECT key, size FROM meal_plans ORDER BY used_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM meal_plans WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def get_or_generate(self, key, generate, force_refresh=False):
+        """Returns (meal_plan, 'hit'|'miss'|'coalesced'), calling ``generate()`` at most once per key at a time.
+
+        ``generate`` returns the meal plan text or raises; errors are not
+        cached and are re-raised to the caller that made the upstream call
+        (waiting callers retry on their own).
+        """
+        meal_plan, cache_state, event = self._join(key, force_refresh)
+        if event is None:
+            return meal_plan, cache_state
+        try:
+            meal_plan = generate()
+            self.set(key, meal_plan)
+            return meal_plan, 'miss'
+        finally:
+            self._finish(key, event)
+
+    def stream_or_generate(self, key, stream, force_refresh=False):
+        """Streaming get_or_generate(): yields (text, 'hit'|'miss'|'coalesced') pieces of the meal plan.
+
+        The caller that makes the upstream call relays each piece
+        ``stream()`` yields and caches the joined text once the stream
+        completes; cached and coalesced plans arrive as one piece.
+        """
+        meal_plan, cache_state, event = self._join(key, force_refresh)
+        if event is None:
+            yield meal_plan, cache_state
+            return
+        try:
+            parts = []
+            for piece in stream():
+                parts.append(piece)
+                yield piece, 'miss'
+            self.set(key, ''.join(parts))
+        finally:
+            self._finish(key, event)
+
+    def _join(self, key, force_refresh):
+        # (meal plan, cache state, None) when answered from the cache or another caller's generation,
+        # (None, 'miss', event) when this caller must generate and then call _finish(key, event)
+        while True:
+            if not force_refresh:
+                meal_plan = self.get(key)
+                if meal_plan is not None:
+                    with self._lock:
+                        self.hits += 1
+                    return meal_plan, 'hit', None
+            with self._lock:
+                event = self._inflight.get(key)
+                if event is None:
+                    event = self._inflight[key] = threading.Event()
+                    self.misses += 1
+                    return None, 'miss', event
+                self.coalesced += 1
+            # Another request is already generating this plan; reuse its result
+            event.wait()
+            meal_plan = self.get(key)
+            if meal_plan is not None:
+                return meal_plan, 'coalesced', None
+            force_refresh = False
+
+    def _finish(self, key, event):
+        with self._lock:
+            del self._inflight[key]
+        event.set()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM meal_plans")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM meal_plans").fetchone()
+            return {
+                'entries': entries,
+                'bytes': total,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'inflight': len(self._inflight)
+            }
@@ -0,0 +1,174 @@
+import bisect
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers sub-millisecond filters up to slow LLM calls
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 10, 25, 50, 75, 100, 150, 250, 500, 1000, 10000)
+
+
+def _label_text(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_label_text(self.labelnames, key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=STAGE_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket (non-cumulative) counts, sum, count
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _render_value(self, key, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += bucket_count
+            lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, [('le', bound)])} {cumulative}")
+        lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {total}")
+        lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {count}")
+        return lines
+
+
+REGISTRY = []
+
+STAGE_SECONDS = Histogram('diet_stage_seconds', 'Time spent in each request stage', ['stage'])
+SOLVER_STATUS = Counter('diet_solver_status_total', 'LP solves by solver status', ['status'])
+CATALOG_PRODUCTS = Gauge('diet_catalog_products', 'Products in the loaded catalog snapshot')
+AVAILABLE_PRODUCTS = Histogram('diet_available_products', 'Products left after allergen and vegetarian filtering',
+                               buckets=COUNT_BUCKETS)
+PRESOLVE_REMOVED = Histogram('diet_presolve_removed_products', 'Dominated products left out of the LP by presolve',
+                             buckets=COUNT_BUCKETS)
+SOLVER_REJECTED = Counter('diet_solver_rejected_total', 'Solves refused by admission control', ['reason'])
+SOLVER_RUNNING = Gauge('diet_solver_running', 'LP solves holding a solver slot')
+SOLVER_WAITING = Gauge('diet_solver_waiting', 'LP solves waiting for a solver slot')
+STARTUP_SECONDS = Gauge('diet_startup_seconds', 'Time spent in each warm-up stage before serving', ['stage'])
+PROCESS_MEMORY = Gauge('diet_process_memory_bytes', 'Memory of this worker process (pss counts shared pages proportionally)', ['kind'])
+HTTP_REQUESTS = Counter('http_requests_total', 'HTTP requests by endpoint and status code', ['endpoint', 'code'])
+HTTP_SECONDS = Histogram('http_request_seconds', 'HTTP request latency by endpoint', ['endpoint'])
+
+# Stage timings of the request being handled on this thread, for the Server-Timing header
+_request = threading.local()
+
+
+def start_request():
+    _request.timings = []
+
+
+def request_timings():
+    """Returns [(stage, seconds)] recorded since start_request() on this thread and stops recording."""
+    timings = getattr(_request, 'timings', None)
+    _request.timings = None
+    return timings or []
+
+
+@contextmanager
+def timed(stage):
+    """Times the enclosed block as ``stage``."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = getattr(_request, 'timings', None)
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def server_timing_header(timings):
+    """Formats stage timings as a Server-Timing header value (durations in ms, repeated stages summed)."""
+    totals = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ', '.join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in totals.items())
+
+
+def process_memory():
+    """{'rss', 'pss', 'shared'} bytes of this process from /proc, or peak RSS where /proc is missing."""
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            next(f)  # address range header
+            kb = {name: int(value.split()[0]) for name, value in (line.split(':', 1) for line in f)}
+        return {
+            'rss': kb.get('Rss', 0) * 1024,
+            'pss': kb.get('Pss', 0) * 1024,
+            'shared': (kb.get('Shared_Clean', 0) + kb.get('Shared_Dirty', 0)) * 1024
+        }
+    except (OSError, StopIteration, ValueError):
+        pass
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'rss': peak if os.uname().sysname == 'Darwin' else peak * 1024}
+
+
+def record_process_memory():
+    for kind, value in process_memory().items():
+        PROCESS_MEMORY.set(value, kind=kind)
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
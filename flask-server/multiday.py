@@ -0,0 +1,392 @@
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+
+from catalog_store import bit_indices
+from diagnosis import diagnose_infeasibility
+from diet_model import MIN_SOLVE_SECONDS, build_diet_lp, remaining_budget, solve_budget, solve_diet_lp
+from metrics import SOLVER_STATUS, timed
+from optimizer import COVERAGE_GROUPS, allergen_report, available_products, describe_diet, parse_profile, result_cache_key
+
+# Coordinator rounds (solve the days, ban over-repeated products) before the plan is returned as it stands
+MAX_ROUNDS = 50
+
+
+def parse_plan(data, max_days=14, max_repeats=3):
+    """Validates an /optimize/plan body; returns (plan, error message).
+
+    The body is an /optimize profile plus ``days`` (default 7), the plan
+    length, and ``max_repeats``, the most days any product may appear on
+    (default ``max_repeats``). Every day gets the daily norms whatever the
+    ``period``. ``decompose`` (default true) picks the per-day
+    decomposition over one monolithic model of the whole plan.
+    """
+    if not isinstance(data, dict):
+        return None, 'Invalid input: JSON object required'
+    profile, error = parse_profile(dict(data, period='day'))
+    if error:
+        return None, error
+    try:
+        days = int(data.get('days', 7))
+        repeats = int(data.get('max_repeats', max_repeats))
+    except (TypeError, ValueError):
+        return None, 'Invalid input: days and max_repeats must be integers'
+    if not 1 <= days <= max_days:
+        return None, f'Invalid input: days must be between 1 and {max_days}'
+    if repeats < 1:
+        return None, 'Invalid input: max_repeats must be at least 1'
+    return {
+        'profile': profile,
+        'days': days,
+        'max_repeats': min(repeats, days),
+        'decompose': bool(data.get('decompose', True))
+    }, None
+
+
+def plan_cache_key(plan, catalog_version, norm_digits=3):
+    """Result cache key: the profile's solver inputs (see result_cache_key) plus the plan settings."""
+    return json.dumps({
+        'profile': json.loads(result_cache_key(plan['profile'], catalog_version, norm_digits)),
+        'days': plan['days'],
+        'max_repeats': plan['max_repeats'],
+        'decompose': plan['decompose']
+    }, sort_keys=True)
+
+
+def build_plan_rows(catalog, product_ids, profile, days):
+    """(one-day LP, weekly rows) over the catalog products ``product_ids`` for a ``days``-day plan.
+
+    Food groups with a weekly rule (Max_Red_Meat_Week, Min_Fish_Week, ...)
+    have a ``_Week`` row for week periods and a separate ``_Day`` row for
+    single days. A plan drops the ``_Day`` rows from the one-day LP and
+    keeps the ``_Week`` rows, scaled to ``days`` days, as rows linking the
+    days; everything else applies to each day on its own.
+    """
+    args = (profile['norms'], profile['norms_upper'])
+    flags = (profile['vegetarian'], profile['no_added_sugar'])
+    day_lp = build_diet_lp(catalog, product_ids, *args, 1, *flags)
+    week_lp = build_diet_lp(catalog, product_ids, *args, 7, *flags)
+    weekly = [dict(row, rhs=row['rhs'] * days / 7) for row in week_lp['rows'] if row['name'].endswith('_Week')]
+    day_lp['rows'] = [row for row in day_lp['rows'] if not row['name'].endswith('_Day')]
+    return day_lp, weekly
+
+
+def day_subproblem(day_lp, weekly, shares, banned):
+    """The LP of one day: its own rows, its ``shares`` of the weekly rows' rhs and the ``banned`` foods fixed to 0."""
+    return dict(day_lp,
+                rows=day_lp['rows'] + [dict(row, rhs=share) for row, share in zip(weekly, shares)],
+                upper=[0.0 if j in banned else u for j, u in enumerate(day_lp['upper'])])
+
+
+def rebalance_shares(weekly, shares, activity, d):
+    """Moves the slack of every weekly row from the other days to day ``d``; True if any moved.
+
+    Another day's slack is what its current diet leaves unused: the part
+    of a floor it exceeds, or of a cap it does not use. Its share is
+    moved to that diet's own total, so the diet stays feasible and every
+    row's shares still add up to its rhs.
+    """
+    moved = False
+    for r, row in enumerate(weekly):
+        sign = 1 if row['sense'] == '>=' else -1
+        slack = {e: sign * (activity[e][r] - shares[e][r]) for e in range(len(shares)) if e != d}
+        wanted = sum(max(v, 0.0) for v in slack.values())
+        if sign > 0:
+            wanted = min(wanted, shares[d][r])
+        if wanted <= 1e-9:
+            continue
+        left = wanted
+        for e, v in slack.items():
+            take = min(max(v, 0.0), left)
+            shares[e][r] += sign * take
+            left -= take
+        shares[d][r] -= sign * wanted
+        moved = True
+    return moved
+
+
+def build_monolithic_lp(day_lp, weekly, days, max_repeats):
+    """The whole plan as one model: ``days`` copies of the day LP tied together by the weekly rows.
+
+    Column d * n + j is food j on day d. With ``max_repeats`` below
+    ``days`` every such column also gets a binary "eaten that day" column
+    and each food a row capping its days at ``max_repeats``, which makes
+    the model a MIP.
+    """
+    n = len(day_lp['foods'])
+    foods, cost, upper, rows = [], [], [], []
+    for d in range(days):
+        foods.extend({'name': f"d{d + 1}_{f['name']}"} for f in day_lp['foods'])
+        cost.extend(day_lp['cost'])
+        upper.extend(day_lp['upper'])
+        for row in day_lp['rows']:
+            rows.append(dict(row, name=f"d{d + 1}_{row['name']}",
+                             coeffs={d * n + j: c for j, c in row['coeffs'].items()}))
+    for row in weekly:
+        rows.append(dict(row, coeffs={d * n + j: c for d in range(days) for j, c in row['coeffs'].items()}))
+
+    integer = []
+    if max_repeats < days:
+        for d in range(days):
+            for j, f in enumerate(day_lp['foods']):
+                used = len(foods)
+                integer.append(used)
+                foods.append({'name': f"Used_d{d + 1}_{f['name']}"})
+                cost.append(0.0)
+                upper.append(1)
+                rows.append({'name': f"Use_d{d + 1}_{j}", 'coeffs': {d * n + j: 1.0, used: -day_lp['upper'][j]},
+                             'sense': '<=', 'rhs': 0.0})
+        for j in range(n):
+            rows.append({'name': f"Repeat_{j}", 'coeffs': {days * n + d * n + j: 1.0 for d in range(days)},
+                         'sense': '<=', 'rhs': float(max_repeats)})
+    return {'foods': foods, 'cost': cost, 'upper': upper, 'rows': rows, 'integer': integer}
+
+
+def _solve_day(lp, backend, deadline):
+    # Solve budgets are per thread: each day gets what is left of the plan's budget
+    seconds = max(deadline - time.monotonic(), MIN_SOLVE_SECONDS) if deadline is not None else None
+    with solve_budget(seconds):
+        return solve_diet_lp(lp, backend)
+
+
+def _solve_days(pool, problems, backend, deadline, scheduler=None, workers=1):
+    # The caller's slot covers one solve; each further one at a time needs a free scheduler slot, taken without waiting
+    extra = 0
+    if scheduler is not None:
+        while extra < min(workers, len(problems)) - 1 and scheduler.try_acquire():
+            extra += 1
+    parallel = 1 + extra if scheduler is not None else workers
+    results = [None] * len(problems)
+    queued = list(enumerate(problems))
+    running = {}
+    try:
+        while queued or running:
+            while queued and len(running) < parallel:
+                i, lp = queued.pop(0)
+                running[pool.submit(_solve_day, lp, backend, deadline)] = i
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+    finally:
+        wait(running)
+        for _ in range(extra):
+            scheduler.release()
+    return results
+
+
+def _solved(status, objective):
+    return status == 'Optimal' or (status == 'Time Limit' and objective is not None)
+
+
+def solve_decomposed(day_lp, weekly, days, max_repeats, backend='pulp', workers=None, scheduler=None):
+    """Solves the plan day by day, in parallel, coordinating the weekly rows and variety.
+
+    Every day starts with an equal share of each weekly row, which is
+    optimal while all days are alike. Each round solves the days whose
+    LP changed, on up to ``workers`` threads; days with the same LP share
+    one solve. Under a ``scheduler`` the caller holds one slot and a round
+    runs one more solve at a time per slot it finds free (see
+    SolverScheduler.try_acquire), so a plan never runs more solves than
+    it holds slots. A product on more than ``max_repeats`` days is then banned
+    on the days where it is eaten least, and those days are solved again.
+    A day that its new bans make infeasible first gets the other days'
+    weekly slack (see rebalance_shares) and is retried; if it is still
+    infeasible it goes back to its previous diet and from then on drops
+    one product per round, so a product whose ban alone makes the day
+    infeasible stays on that day. Stops once no product can be banned,
+    after MAX_ROUNDS or when the solve budget runs out ('Time Limit').
+
+    Returns (status, amounts per day, rounds).
+    """
+    n = len(day_lp['foods'])
+    budget = remaining_budget()
+    deadline = time.monotonic() + budget if budget is not None else None
+    shares = [[row['rhs'] / days for row in weekly] for _ in range(days)]
+    banned = [set() for _ in range(days)]
+    added = [set() for _ in range(days)]
+    kept = [set() for _ in range(days)]
+    cautious = set()
+    rebalanced = set()
+    solutions = [None] * days
+    stale = set(range(days))
+    status = 'Optimal'
+    rounds = 0
+    workers = workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='plan') as pool:
+        while stale and rounds < MAX_ROUNDS:
+            if deadline is not None and time.monotonic() >= deadline:
+                status = 'Time Limit'
+                break
+            rounds += 1
+            distinct = {}
+            for d in sorted(stale):
+                distinct.setdefault((frozenset(banned[d]), tuple(shares[d])), []).append(d)
+            problems = [day_subproblem(day_lp, weekly, day_shares, bans) for bans, day_shares in distinct]
+            results = _solve_days(pool, problems, backend, deadline, scheduler, workers)
+            failed = []
+            for group, (day_status, amounts, objective) in zip(distinct.values(), results):
+                if day_status == 'Time Limit':
+                    status = 'Time Limit'
+                for d in group:
+                    if _solved(day_status, objective):
+                        solutions[d] = amounts
+                        rebalanced.discard(d)
+                    elif solutions[d] is None:
+                        return day_status, None, rounds
+                    else:
+                        failed.append(d)
+            if status == 'Time Limit':
+                break
+
+            activity = [[sum(c * amounts[j] for j, c in row['coeffs'].items()) for row in weekly] for amounts in solutions]
+            retry = set()
+            for d in failed:
+                if d not in rebalanced and rebalance_shares(weekly, shares, activity, d):
+                    rebalanced.add(d)
+                    retry.add(d)
+                    continue
+                # The last bans left this day without a diet even with the slack: undo them and retry one at a time
+                rebalanced.discard(d)
+                banned[d] -= added[d]
+                if len(added[d]) > 1:
+                    cautious.add(d)
+                else:
+                    kept[d] |= added[d]
+
+            candidates = [[] for _ in range(days)]
+            for j in range(n):
+                eaten_on = [d for d in range(days) if solutions[d][j] > 0]
+                if len(eaten_on) <= max_repeats:
+                    continue
+                # Days that must keep the product come first, then the largest amounts; ties rotate with j
+                ranked = sorted(eaten_on, key=lambda d: (j not in kept[d], -solutions[d][j], (d - j) % days))
+                for d in ranked[max_repeats:]:
+                    if j not in kept[d] and d not in retry:
+                        candidates[d].append((solutions[d][j], j))
+            stale = set(retry)
+            added = [added[d] if d in retry else set() for d in range(days)]
+            for d, bans in enumerate(candidates):
+                if d in cautious and bans:
+                    bans = [min(bans)]
+                for _, j in bans:
+                    banned[d].add(j)
+                    added[d].add(j)
+                    stale.add(d)
+    return status, solutions, rounds
+
+
+def solve_monolithic(day_lp, weekly, days, max_repeats, backend='pulp'):
+    """Solves the plan as one model (see build_monolithic_lp); returns (status, amounts per day)."""
+    lp = build_monolithic_lp(day_lp, weekly, days, max_repeats)
+    status, amounts, objective = solve_diet_lp(lp, backend)
+    if not _solved(status, objective):
+        return status, None
+    n = len(day_lp['foods'])
+    return status, [amounts[d * n:(d + 1) * n] for d in range(days)]
+
+
+def solve_plan(catalog, plan, backend='pulp', workers=None, scheduler=None):
+    """Solves a parsed plan and assembles the per-day diets and the plan totals.
+
+    Each day carries its diet, items, cost, nutrient totals and coverage;
+    the plan carries the same for all days together, the ``weekly`` rows
+    with their totals and a ``variety`` report listing the products still
+    on more than ``max_repeats`` days. An infeasible plan reports the
+    relaxations a single day would need.
+    """
+    profile = plan['profile']
+    days, max_repeats = plan['days'], plan['max_repeats']
+    available = available_products(catalog, profile)
+    product_ids = bit_indices(available)
+    if not product_ids:
+        return {'error': 'No foods available after applying restrictions'}
+    with timed('model_build'):
+        day_lp, weekly = build_plan_rows(catalog, product_ids, profile, days)
+    rounds = None
+    with timed('solve'):
+        if plan['decompose']:
+            status, solutions, rounds = solve_decomposed(day_lp, weekly, days, max_repeats, backend, workers, scheduler)
+        else:
+            status, solutions = solve_monolithic(day_lp, weekly, days, max_repeats, backend)
+    SOLVER_STATUS.inc(status=status)
+
+    if solutions is None:
+        error_msg = {'error': 'No optimal solution found', 'status': status}
+        if status == 'Time Limit':
+            error_msg['details'] = 'The solver ran out of its time budget before reaching a feasible plan'
+        if status == 'Infeasible':
+            relaxations, _ = diagnose_infeasibility(catalog, product_ids, profile['norms'], profile['norms_upper'], 1,
+                                                    profile['vegetarian'], profile['no_added_sugar'], backend)
+            error_msg['details'] = 'Infeasible constraints for a single day'
+            if relaxations:
+                error_msg['details'] += '. Relax: ' + ', '.join(
+                    f"{r['constraint']} ({r['rhs']:.2f} -> {r['relaxed_rhs']:.2f})" for r in relaxations)
+                error_msg['relaxations'] = relaxations
+        return error_msg
+
+    with timed('assemble'):
+        groups = {category: catalog.products_in(category, available) for category in COVERAGE_GROUPS}
+        names = [catalog.columns.name(i) for i in product_ids]
+        plan_days = []
+        for d, amounts in enumerate(solutions):
+            summary = describe_diet(catalog, product_ids, groups, dict(zip(product_ids, amounts)))
+            plan_days.append({
+                'day': d + 1,
+                'diet': summary['diet'],
+                'items': summary['items'],
+                'cost': round(sum(item['cost'] for item in summary['items']), 2),
+                'nutrient_totals': summary['nutrient_totals'],
+                'coverage': summary['coverage']
+            })
+        totals = [sum(amounts[j] for amounts in solutions) for j in range(len(product_ids))]
+        summary = describe_diet(catalog, product_ids, groups, dict(zip(product_ids, totals)))
+        repeats = [[d + 1 for d in range(days) if solutions[d][j] > 0] for j in range(len(product_ids))]
+    result = {
+        'status': status,
+        'days': plan_days,
+        'diet': summary['diet'],
+        'items': summary['items'],
+        'total_cost': round(sum(item['cost'] for item in summary['items']), 2),
+        'nutrient_totals': summary['nutrient_totals'],
+        'coverage': summary['coverage'],
+        'weekly': {row['name']: {'sense': row['sense'], 'rhs': round(row['rhs'], 2),
+                                 'total': round(sum(c * totals[j] for j, c in row['coeffs'].items()), 2)}
+                   for row in weekly},
+        'variety': {
+            'max_repeats': max_repeats,
+            'distinct_products': sum(1 for on in repeats if on),
+            'violations': [{'name': names[j], 'days': on} for j, on in enumerate(repeats) if len(on) > max_repeats]
+        }
+    }
+    if rounds is not None:
+        result['variety']['rounds'] = rounds
+    return result
+
+
+def optimize_plan(catalog, plan, backend='pulp', cache=None, norm_digits=3, scheduler=None, workers=None):
+    """Solves a parsed plan, serving repeated inputs from ``cache``.
+
+    The whole plan holds one ``scheduler`` slot (which may raise
+    scheduler.SolverBusyError), takes free ones for parallel day solves
+    and shares its time budget across rounds; as for households, only
+    solved, not time-limited, results are cached.
+    """
+    key = plan_cache_key(plan, catalog.version, norm_digits) if cache is not None else None
+    result = cache.get(key) if cache is not None else None
+    cache_state = 'hit' if result is not None else 'miss'
+    if result is None:
+        with scheduler.slot() if scheduler is not None else nullcontext():
+            result = solve_plan(catalog, plan, backend, workers, scheduler)
+        if cache is not None and 'error' not in result and result.get('status') != 'Time Limit':
+            cache.set(key, result)
+    payload = dict(result)
+    if 'error' not in payload:
+        norms = plan['profile']['norms']
+        payload['norms'] = {nut: round(norms[nut], 2) for nut in norms}
+        payload['period'] = 'day'
+        payload['excluded_by_allergen'] = allergen_report(catalog, plan['profile']['allergens'])
+    if cache is not None:
+        payload['cache'] = cache_state
+    return payload
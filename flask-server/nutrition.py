@@ -0,0 +1,55 @@
+ACTIVITY_MULTIPLIERS = {
+    "sedentary": 1.4,
+    "low": 1.6,
+    "moderate": 1.8,
+    "active": 1.9,
+    "very active": 2.0
+}
+
+def calculate_bmr(gender, weight, height, age):
+    if gender.lower() == "male":
+        return 88.362 + (13.397 * weight) + (4.799 * height) - (5.677 * age)
+    else:
+        return 447.593 + (9.247 * weight) + (3.098 * height) - (4.330 * age)
+
+def calculate_energy_needs(bmr, activity):
+    multiplier = ACTIVITY_MULTIPLIERS.get(activity.lower(), 1.4)
+    return bmr * multiplier
+
+def get_efsa_norms(gender, weight, age, eer_kcal, period_days=1):
+    mj_per_day = eer_kcal / 238.83
+    norms = {
+        'protein': 0.83 * weight,
+        'fat': (0.20 * eer_kcal) / 9,
+        'carbs': (0.45 * eer_kcal) / 4,
+        'kj': eer_kcal * 4.184,
+        'kcal': eer_kcal,
+        'A': 0.750 if gender.lower() == 'male' else 0.650,
+        'B1': 0.1 * mj_per_day,
+        'B2': 1.6,
+        'PP': 1.6 * mj_per_day,
+        'C': 110 if gender.lower() == 'male' else 95,
+        'Ca': 950,
+        'P': 550,
+        'Fe': 11 if gender.lower() == 'male' else (16 if age < 50 else 11)
+    }
+    norms_upper = {
+        'protein': 2.0 * weight,
+        'fat': (0.30 * eer_kcal) / 9,
+        'carbs': (0.60 * eer_kcal) / 4,
+        'kcal': eer_kcal * 1.1,
+        'kj': eer_kcal * 4.184 * 1.1
+    }
+    
+    # Scale only macronutrients and calories for the period
+    # Vitamins and minerals remain daily norms
+    energy_nutrients = ['protein', 'fat', 'carbs', 'kj', 'kcal']
+    for nut in energy_nutrients:
+        if nut in norms:
+            norms[nut] *= period_days
+    for nut in norms_upper:
+        if nut in energy_nutrients:
+            norms_upper[nut] *= period_days
+    return norms, norms_upper
+
+nut_keys = ['protein', 'fat', 'carbs', 'kj', 'kcal', 'A', 'B1', 'B2', 'PP', 'C', 'Ca', 'P', 'Fe']
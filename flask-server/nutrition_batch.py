@@ -0,0 +1,183 @@
+import csv
+
+from nutrition import ACTIVITY_MULTIPLIERS
+
+try:
+    import numpy as np
+except ImportError:  # batch norms need NumPy
+    np = None
+
+# Whether batch norms are available; callers check this instead of importing NumPy themselves
+HAVE_NUMPY = np is not None
+
+# Nutrients whose norms scale with the period, as in get_efsa_norms()
+ENERGY_NUTRIENTS = ('protein', 'fat', 'carbs', 'kj', 'kcal')
+INVALID_ROW = 'Invalid input: weight, height, and age must be positive numbers'
+
+
+def _codes(values, fn):
+    """fn applied to each distinct value of a string array, broadcast back to the array."""
+    unique, inverse = np.unique(values, return_inverse=True)
+    return np.array([fn(str(value)) for value in unique])[inverse.reshape(-1)]
+
+
+def batch_energy_norms(gender, weight, height, age, activity, period_days):
+    """Vectorized calculate_bmr(), calculate_energy_needs() and get_efsa_norms() over equal-length arrays.
+
+    ``gender`` and ``activity`` are string arrays, the rest numeric. Returns
+    {'bmr', 'kcal', 'norms', 'norms_upper'} where the norms are
+    {nutrient: array}; every value is bit-for-bit the one the scalar
+    functions give for the same row.
+    """
+    weight, height, age = (np.asarray(column, dtype=float) for column in (weight, height, age))
+    period_days = np.asarray(period_days, dtype=float)
+    male = _codes(gender, lambda value: value.lower() == 'male').astype(bool)
+    bmr = np.where(male,
+                   88.362 + (13.397 * weight) + (4.799 * height) - (5.677 * age),
+                   447.593 + (9.247 * weight) + (3.098 * height) - (4.330 * age))
+    eer_kcal = bmr * _codes(activity, lambda value: ACTIVITY_MULTIPLIERS.get(value.lower(), 1.4)).astype(float)
+    mj_per_day = eer_kcal / 238.83
+    ones = np.ones_like(eer_kcal)
+    norms = {
+        'protein': 0.83 * weight,
+        'fat': (0.20 * eer_kcal) / 9,
+        'carbs': (0.45 * eer_kcal) / 4,
+        'kj': eer_kcal * 4.184,
+        'kcal': eer_kcal,
+        'A': np.where(male, 0.750, 0.650),
+        'B1': 0.1 * mj_per_day,
+        'B2': 1.6 * ones,
+        'PP': 1.6 * mj_per_day,
+        'C': np.where(male, 110.0, 95.0),
+        'Ca': 950.0 * ones,
+        'P': 550.0 * ones,
+        'Fe': np.where(male | (age >= 50), 11.0, 16.0)
+    }
+    norms_upper = {
+        'protein': 2.0 * weight,
+        'fat': (0.30 * eer_kcal) / 9,
+        'carbs': (0.60 * eer_kcal) / 4,
+        'kcal': eer_kcal * 1.1,
+        'kj': eer_kcal * 4.184 * 1.1
+    }
+    for values in (norms, norms_upper):
+        for nut in ENERGY_NUTRIENTS:
+            if nut in values:
+                values[nut] = values[nut] * period_days
+    return {'bmr': bmr, 'kcal': eer_kcal, 'norms': norms, 'norms_upper': norms_upper}
+
+
+def _column(data, name, n):
+    value = data.get(name)
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    # A single value applies to every row
+    return [value] * n
+
+
+def _strings(values, default):
+    # Missing values (and empty CSV cells) fall back to the /tdee default
+    return np.array([default if value is None or value == '' else str(value) for value in values], dtype=str)
+
+
+def _numbers(values, defaults):
+    """Float array of ``values``; missing entries take ``defaults``, unparseable ones become NaN."""
+    try:
+        numbers = np.array(values, dtype=float)
+    except (TypeError, ValueError):
+        numbers = np.empty(len(values))
+        for i, value in enumerate(values):
+            try:
+                numbers[i] = float(value) if value != '' else np.nan
+            except (TypeError, ValueError):
+                numbers[i] = np.nan
+    missing = np.array([value is None or value == '' for value in values], dtype=bool)
+    return np.where(missing, defaults, numbers)
+
+
+def profile_columns(data, max_items=None):
+    """Validates columnar /tdee/batch input; returns (columns, error message).
+
+    ``data`` maps gender, weight, height, age, activity and period to
+    equal-length lists; a column given as a single value applies to every
+    row and a missing column or value takes the /tdee default. Rows with a
+    non-numeric or non-positive weight, height or age are kept but flagged
+    in the returned ``valid`` mask.
+    """
+    if not isinstance(data, dict):
+        return None, 'Invalid input: JSON object of columns required'
+    lengths = {len(value) for value in data.values() if isinstance(value, (list, tuple))}
+    if not lengths:
+        return None, 'Invalid input: at least one column must be a list'
+    if len(lengths) > 1:
+        return None, 'Invalid input: all columns must have the same length'
+    n = lengths.pop()
+    if n == 0:
+        return None, 'Invalid input: at least one profile required'
+    if max_items is not None and n > max_items:
+        return None, f'Invalid input: at most {max_items} profiles per batch'
+
+    gender = np.char.lower(_strings(_column(data, 'gender', n), 'male'))
+    male = gender == 'male'
+    weight = _numbers(_column(data, 'weight', n), np.where(male, 70.0, 60.0))
+    height = _numbers(_column(data, 'height', n), np.where(male, 175.0, 165.0))
+    age = _numbers(_column(data, 'age', n), 30.0)
+    period = _strings(_column(data, 'period', n), 'week')
+    with np.errstate(invalid='ignore'):
+        valid = (weight > 0) & (height > 0) & (age > 0) & np.isfinite(weight + height + age)
+    return {
+        'gender': gender,
+        'weight': weight,
+        'height': height,
+        'age': age,
+        'activity': _strings(_column(data, 'activity', n), 'sedentary'),
+        'period_days': np.where(_codes(period, lambda value: value.lower() == 'week').astype(bool), 7, 1),
+        'valid': valid
+    }, None
+
+
+def read_csv_columns(lines):
+    """{header: [cell, ...]} of a CSV file with a header row; empty cells count as missing."""
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return {}
+    rows = [row + [''] * (len(header) - len(row)) for row in reader if row]
+    columns = list(zip(*rows)) if rows else [()] * len(header)
+    return {name.strip().lower(): list(column) for name, column in zip(header, columns)}
+
+
+def _json_values(values, valid, digits):
+    values = np.round(values, digits)
+    if valid.all():
+        return values.tolist()
+    return np.where(valid, values, None).tolist()
+
+
+def iter_norm_chunks(columns, chunk_size=10000, digits=4):
+    """Yields the batch's BMR, EER and norms ``chunk_size`` rows at a time, column by column.
+
+    Each chunk holds its ``offset`` and ``count``, ``bmr``, ``kcal`` and
+    ``period_days`` lists and ``norms``/``norms_upper`` as {nutrient: list},
+    rounded to ``digits`` decimals. Invalid rows are null in every column
+    and listed under ``errors`` with their index.
+    """
+    n = len(columns['valid'])
+    for offset in range(0, n, chunk_size):
+        part = {name: values[offset:offset + chunk_size] for name, values in columns.items()}
+        valid = part['valid']
+        with np.errstate(invalid='ignore'):
+            result = batch_energy_norms(part['gender'], part['weight'], part['height'], part['age'],
+                                        part['activity'], part['period_days'])
+        chunk = {
+            'offset': offset,
+            'count': len(valid),
+            'bmr': _json_values(result['bmr'], valid, digits),
+            'kcal': _json_values(result['kcal'], valid, digits),
+            'period_days': part['period_days'].tolist(),
+            'norms': {nut: _json_values(values, valid, digits) for nut, values in result['norms'].items()},
+            'norms_upper': {nut: _json_values(values, valid, digits) for nut, values in result['norms_upper'].items()}
+        }
+        if not valid.all():
+            chunk['errors'] = [{'index': offset + int(i), 'error': INVALID_ROW} for i in np.flatnonzero(~valid)]
+        yield chunk
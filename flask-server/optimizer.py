@@ -0,0 +1,315 @@
+import hashlib
+import json
+import logging
+from contextlib import nullcontext
+
+from catalog_store import bit_indices
+from diagnosis import diagnose_infeasibility
+from diet_model import linprog
+from metrics import AVAILABLE_PRODUCTS, PRESOLVE_REMOVED, SOLVER_STATUS, timed
+from nutrition import calculate_bmr, calculate_energy_needs, get_efsa_norms, nut_keys
+from presolve import presolve_report, solve_with_presolve
+from sensitivity import analyze_request, sweep
+from taxonomy import ALLERGEN_BITS, requested_allergens
+
+# Food groups reported in the coverage block (grams per category)
+COVERAGE_GROUPS = ['fish', 'poultry', 'red_meat', 'whole_grains', 'refined_grains', 'vegetables', 'fruits', 'legumes', 'sweets']
+
+
+def parse_profile(data):
+    """Validates an /optimize request body; returns (profile, error message)."""
+    if not isinstance(data, dict):
+        return None, 'Invalid input: JSON object required'
+
+    gender = data.get('gender', 'male').lower()
+    try:
+        weight = float(data.get('weight', 70 if gender == 'male' else 60))
+        height = float(data.get('height', 175 if gender == 'male' else 165))
+        age = float(data.get('age', 30))
+        if weight <= 0 or height <= 0 or age <= 0:
+            return None, 'Invalid input: weight, height, and age must be positive'
+        bmi = weight / ((height / 100) ** 2)
+        if bmi < 18.5:
+            logging.warning(f"BMI {bmi:.1f} is underweight")
+    except (TypeError, ValueError):
+        return None, 'Invalid input: weight, height, and age must be numeric'
+
+    activity = data.get('activity', 'sedentary')
+    period = data.get('period', 'week')
+    period_days = 7 if period.lower() == 'week' else 1
+
+    bmr = calculate_bmr(gender, weight, height, age)
+    eer_kcal = calculate_energy_needs(bmr, activity)
+    norms, norms_upper = get_efsa_norms(gender, weight, age, eer_kcal, period_days)
+
+    # Optional vegetarian filter based on request
+    # Accept either diet_type == 'vegetarian' or vegetarian == True
+    diet_type = str(data.get('diet_type', '')).strip().lower()
+    vegetarian_flag = bool(data.get('vegetarian', False)) or diet_type == 'vegetarian'
+
+    return {
+        'gender': gender,
+        'weight': weight,
+        'height': height,
+        'age': age,
+        'activity': activity,
+        'period': period,
+        'period_days': period_days,
+        'norms': norms,
+        'norms_upper': norms_upper,
+        'allergens': requested_allergens(data.get('allergens', [])),
+        'vegetarian': vegetarian_flag,
+        'no_added_sugar': bool(data.get('no_added_sugar', False)),
+        # Infeasible profiles also get the diet under the suggested relaxation
+        'best_effort': bool(data.get('best_effort', False))
+    }, None
+
+
+def round_significant(x, digits):
+    return float(f"{x:.{digits}g}")
+
+
+def result_cache_key(profile, catalog_version, norm_digits=3, sensitivity=False):
+    """Canonical form of the effective solver inputs, used as the result cache key.
+
+    Norms are rounded to ``norm_digits`` significant digits so near-identical
+    profiles (weight/height/age in the same range) share one entry.
+    Results with a sensitivity report are cached apart from plain ones.
+    """
+    key = {
+        'catalog': catalog_version,
+        'norms': {nut: round_significant(v, norm_digits) for nut, v in sorted(profile['norms'].items())},
+        'norms_upper': {nut: round_significant(v, norm_digits) for nut, v in sorted(profile['norms_upper'].items())},
+        'allergens': sorted(profile['allergens']),
+        'vegetarian': profile['vegetarian'],
+        'no_added_sugar': profile['no_added_sugar'],
+        'period_days': profile['period_days']
+    }
+    if profile['best_effort']:
+        key['best_effort'] = True
+    if sensitivity:
+        key['sensitivity'] = True
+    return json.dumps(key, sort_keys=True)
+
+
+def allowed_by_allergens(catalog, requested):
+    """Bitset of products free of the requested allergens, from the catalog's precomputed bitsets."""
+    request_mask = 0
+    for key in requested:
+        request_mask |= ALLERGEN_BITS[key]
+    return catalog.allowed_products(request_mask)
+
+
+def allergen_report(catalog, requested):
+    """Lists each excluded product with the first requested allergen it contains."""
+    excluded_by_allergen = []
+    excluded = catalog.all_products & ~allowed_by_allergens(catalog, requested)
+    while excluded:
+        low = excluded & -excluded
+        i = low.bit_length() - 1
+        reason = next(key for key in requested if catalog.columns.allergen_mask(i) & ALLERGEN_BITS[key])
+        excluded_by_allergen.append({'name': catalog.columns.name(i), 'reason': reason})
+        excluded ^= low
+    return excluded_by_allergen
+
+
+def available_products(catalog, profile):
+    """Bitset of products left after the profile's allergen and vegetarian filters."""
+    with timed('allergen_filter'):
+        available = allowed_by_allergens(catalog, profile['allergens'])
+    with timed('vegetarian_filter'):
+        if profile['vegetarian']:
+            available &= ~catalog.category_products['meat_or_fish']
+    return available
+
+
+def describe_diet(catalog, product_ids, groups, units):
+    """Diet items, nutrient totals and food-group coverage of a solution.
+
+    ``product_ids`` are the available products and ``groups`` maps each
+    COVERAGE_GROUPS category to the available products in it, both as
+    catalog indices; ``units`` is the solver's output, {product index:
+    units of 100 g}.
+    """
+    columns = catalog.columns
+    used = [i for i in product_ids if units[i] > 0]
+    # Build detailed diet items with nutrition data
+    diet_items = []
+    for i in used:
+        diet_items.append({
+            'name': columns.name(i),
+            'grams': round(units[i] * 100, 2),
+            'kcal': round(columns.nutrient(i, 'kcal') * units[i], 2),
+            'protein': round(columns.nutrient(i, 'protein') * units[i], 2),
+            'fat': round(columns.nutrient(i, 'fat') * units[i], 2),
+            'carbs': round(columns.nutrient(i, 'carbs') * units[i], 2),
+            'cost': round(columns.price(i) * units[i], 2)
+        })
+
+    # Coverage block (grams per category)
+    def sum_grams(group):
+        return round(sum(units[i] * 100 for i in groups[group]), 2)
+
+    return {
+        'items': diet_items,
+        # Also keep simple dict format for backwards compatibility
+        'diet': {item['name']: item['grams'] for item in diet_items},
+        'nutrient_totals': {nut: round(sum(columns.nutrient(i, nut) * units[i] for i in used), 2) for nut in nut_keys},
+        'coverage': {group: sum_grams(group) for group in COVERAGE_GROUPS}
+    }
+
+
+def solve_profile(catalog, profile, backend='pulp', sensitivity=False):
+    """Filters the catalog for the profile, solves the LP and assembles the result.
+
+    With ``sensitivity`` the LP is solved on the resident model template
+    whatever the backend, and the result carries its dual values, reduced
+    costs and cost ranging under ``sensitivity``. An infeasible profile
+    reports the smallest relaxation that would make it feasible, plus the
+    diet under that relaxation when the profile asks for ``best_effort``;
+    its ``basket_cost`` is what the products cost, while ``total_cost``
+    of a solved diet is the objective, health nudges included.
+    A solve that runs out of its time budget (see diet_model.solve_budget)
+    reports the status 'Time Limit', with the diet it reached if feasible.
+    """
+    norms = profile['norms']
+
+    available = available_products(catalog, profile)
+    product_ids = bit_indices(available)
+    AVAILABLE_PRODUCTS.observe(len(product_ids))
+
+    if not product_ids:
+        return {'error': 'No foods available after applying restrictions'}
+
+    # Food groups come from the catalog's precomputed category bitsets
+    with timed('category_match'):
+        groups = {category: catalog.products_in(category, available) for category in COVERAGE_GROUPS}
+
+    report = None
+    removed = 0
+    if sensitivity:
+        # Duals and ranging refer to the full model, so presolve is skipped
+        status, units, objective, report = analyze_request(
+            catalog, available, norms, profile['norms_upper'], profile['period_days'],
+            profile['vegetarian'], profile['no_added_sugar'])
+    else:
+        # Dominated products are left out of the LP for large catalogs (same optimal cost)
+        status, units, objective, removed = solve_with_presolve(
+            catalog, available, norms, profile['norms_upper'], profile['period_days'],
+            profile['vegetarian'], profile['no_added_sugar'], backend)
+    SOLVER_STATUS.inc(status=status)
+    PRESOLVE_REMOVED.observe(bin(removed).count('1'))
+
+    # A solve cut short by its time budget still returns the feasible diet it reached, flagged by its status
+    if status != 'Optimal' and not (status == 'Time Limit' and objective is not None):
+        error_msg = {'error': 'No optimal solution found', 'status': status}
+        if status == 'Time Limit':
+            error_msg['details'] = 'The solver ran out of its time budget before reaching a feasible diet'
+        if status == 'Infeasible':
+            # One elastic solve finds which rows to relax, and by how much
+            relaxations, relaxed_units = diagnose_infeasibility(
+                catalog, product_ids, norms, profile['norms_upper'], profile['period_days'],
+                profile['vegetarian'], profile['no_added_sugar'], backend)
+            if relaxations is None:
+                error_msg['details'] = 'Infeasible constraints'
+                return error_msg
+            error_msg['details'] = 'Infeasible constraints. Relax: ' + ', '.join(
+                f"{r['constraint']} ({r['rhs']:.2f} -> {r['relaxed_rhs']:.2f})" for r in relaxations)
+            error_msg['relaxations'] = relaxations
+            if profile.get('best_effort'):
+                summary = describe_diet(catalog, product_ids, groups, dict(zip(product_ids, relaxed_units)))
+                error_msg['best_effort'] = {
+                    'diet': summary['diet'],
+                    'items': summary['items'],
+                    'basket_cost': round(sum(item['cost'] for item in summary['items']), 2),
+                    'nutrient_totals': summary['nutrient_totals'],
+                    'coverage': summary['coverage']
+                }
+        return error_msg
+
+    with timed('assemble'):
+        summary = describe_diet(catalog, product_ids, groups, units)
+
+    result = {
+        'diet': summary['diet'],
+        'items': summary['items'],  # Detailed items with all nutrition info
+        'total_cost': round(objective, 2),
+        'nutrient_totals': summary['nutrient_totals'],
+        'status': status,
+        'coverage': summary['coverage']
+    }
+    if removed:
+        result['presolve'] = presolve_report(catalog, available, removed)
+    if report is not None:
+        result['sensitivity'] = report
+    return result
+
+
+def finish_payload(catalog, profile, result, cache_state=None):
+    """Turns a solver result into the /optimize response payload for ``profile``.
+
+    Successful payloads carry the caller's own ``norms``, ``period`` and
+    allergen report; ``cache_state`` ('hit'/'miss') is reported when set.
+    """
+    payload = dict(result)
+    if 'error' not in payload:
+        norms = profile['norms']
+        payload['norms'] = {nut: round(norms[nut], 2) for nut in norms}
+        payload['period'] = profile['period']
+        payload['excluded_by_allergen'] = allergen_report(catalog, profile['allergens'])
+    if cache_state is not None:
+        payload['cache'] = cache_state
+    return payload
+
+
+def optimize_profile(catalog, profile, backend='pulp', cache=None, norm_digits=3, sensitivity=False, scheduler=None):
+    """Solves a parsed profile, serving repeated solver inputs from ``cache``.
+
+    Solves run in a ``scheduler`` slot when one is given, which may raise
+    scheduler.SolverBusyError; cache hits never wait for a slot.
+    """
+    if cache is None:
+        with scheduler.slot() if scheduler is not None else nullcontext():
+            return finish_payload(catalog, profile, solve_profile(catalog, profile, backend, sensitivity))
+    key = result_cache_key(profile, catalog.version, norm_digits, sensitivity)
+    result = cache.get(key)
+    if result is not None:
+        return finish_payload(catalog, profile, result, 'hit')
+    with scheduler.slot() if scheduler is not None else nullcontext():
+        result = solve_profile(catalog, profile, backend, sensitivity)
+    # A time-limited result depends on load, not only on the inputs
+    if result.get('status') != 'Time Limit':
+        cache.set(key, result)
+    return finish_payload(catalog, profile, result, 'miss')
+
+
+def sweep_profile(catalog, profile, spec, scheduler=None):
+    """Runs a price or norm sweep (see sensitivity.sweep) for a parsed profile; returns (payload, HTTP status).
+
+    The whole sweep holds one ``scheduler`` slot and shares its time budget.
+    """
+    if linprog is None:
+        return {'error': 'Sweeps need SciPy installed on the server'}, 501
+    available = available_products(catalog, profile)
+    if not available:
+        return {'error': 'No foods available after applying restrictions'}, 400
+    if 'product' in spec:
+        positions = catalog.columns.find_all(spec['product'])
+        if not positions:
+            return {'error': f"Unknown product: {spec['product']}"}, 400
+        positions = [i for i in positions if available >> i & 1]
+        if not positions:
+            return {'error': f"Product {spec['product']} is excluded by the profile's restrictions"}, 400
+        # Names are not unique: sweep the first product of that name the profile may eat
+        spec = dict(spec, product_index=positions[0])
+    with scheduler.slot() if scheduler is not None else nullcontext():
+        payload = sweep(catalog, available, profile['norms'], profile['norms_upper'], profile['period_days'],
+                        profile['vegetarian'], profile['no_added_sugar'], spec)
+    payload['period'] = profile['period']
+    return payload, 200
+
+
+def result_id(payload):
+    """Stable content ID of an /optimize payload, used to hand the result to /meal-plan."""
+    content = {key: value for key, value in payload.items() if key not in ('cache', 'result_id')}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()[:32]
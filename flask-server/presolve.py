@@ -0,0 +1,173 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from diet_model import (UPPER_NUTRIENTS, bitset_to_mask, mask_to_bitset, objective_costs, product_upper_bound,
+                        solve_request)
+from metrics import timed
+from nutrition import nut_keys
+
+try:
+    import numpy as np
+except ImportError:  # presolve is skipped without NumPy
+    np = None
+
+# Requests with fewer available products are solved without presolve
+MIN_PRODUCTS = int(os.getenv('DIET_PRESOLVE_MIN_PRODUCTS', '500'))
+# Reductions remembered per catalog version, one per availability mask (allergen/vegetarian combination), LRU
+MAX_REDUCTIONS = int(os.getenv('DIET_PRESOLVE_MAX_REDUCTIONS', '256'))
+
+# Nutrients with both a minimum and a maximum row must match exactly; the rest only have minimums
+LOWER_ONLY_NUTRIENTS = [nut for nut in nut_keys if nut not in UPPER_NUTRIENTS]
+
+
+class DominanceIndex:
+    """Which products are dominated by which, for one catalog version.
+
+    Product j is dominated by product k when both carry the same taxonomy
+    tags (identical food-group rows) and the same macronutrients (which
+    have both minimum and maximum rows), k costs no more and supplies at
+    least as much of every other nutrient. Exact duplicates are ordered by
+    catalog position, so the relation is a strict partial order and every
+    removed product keeps an available dominator.
+    """
+
+    def __init__(self, catalog):
+        self.version = catalog.version
+        self.size = len(catalog)
+        # Product index -> indices of the products dominating it (only dominated products are listed)
+        self.dominators = {}
+        nutrients = catalog.columns.array('nutrients')
+        tags = catalog.columns.array('category_mask')
+        equal = nutrients[:, [nut_keys.index(nut) for nut in UPPER_NUTRIENTS]]
+        # Same tags and macronutrients: group rows by the raw bytes of that key
+        keys = np.ascontiguousarray(np.column_stack([tags.astype(float), equal])).view(f'V{8 * (1 + len(UPPER_NUTRIENTS))}')
+        _, classes, counts = np.unique(keys.ravel(), return_inverse=True, return_counts=True)
+        classes = classes.reshape(-1)
+        supply = nutrients[:, [nut_keys.index(nut) for nut in LOWER_ONLY_NUTRIENTS]]
+        cost = objective_costs(catalog)
+        for c in np.flatnonzero(counts > 1):
+            members = np.flatnonzero(classes == c)
+            self._add_class(members, cost[members], supply[members])
+        self._reductions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _add_class(self, idx, cost, supply):
+        for a, j in enumerate(idx):
+            # k dominates j: no more expensive, no less of any nutrient, and better somewhere (or an earlier duplicate)
+            covers = (cost <= cost[a]) & np.all(supply >= supply[a], axis=1)
+            covers &= (cost < cost[a]) | np.any(supply > supply[a], axis=1) | (idx < j)
+            covers[a] = False
+            if covers.any():
+                self.dominators[j] = idx[covers]
+
+    def removed(self, available):
+        """Bitset of available products dominated by another available product (memoized per mask, MAX_REDUCTIONS kept)."""
+        with self._lock:
+            removed = self._reductions.get(available)
+            if removed is not None:
+                self._reductions.move_to_end(available)
+                return removed
+            mask = bitset_to_mask(available, self.size)
+            dropped = np.zeros(self.size, dtype=bool)
+            for j, dominators in self.dominators.items():
+                if mask[j] and mask[dominators].any():
+                    dropped[j] = True
+            removed = self._reductions[available] = mask_to_bitset(dropped)
+            while len(self._reductions) > MAX_REDUCTIONS:
+                self._reductions.popitem(last=False)
+            return removed
+
+    def blocked(self, removed, kept, amounts, upper):
+        """Removed products whose kept dominators all sit at the per-product cap in ``amounts``.
+
+        Only such products could still improve the objective; an empty
+        result proves the reduced solution optimal for the full model.
+        """
+        kept_mask = bitset_to_mask(kept, self.size)
+        blocked = np.zeros(self.size, dtype=bool)
+        for j in np.flatnonzero(bitset_to_mask(removed, self.size)):
+            dominators = self.dominators[j]
+            dominators = dominators[kept_mask[dominators]]
+            if np.all(amounts[dominators] >= upper - 1e-9):
+                blocked[j] = True
+        return mask_to_bitset(blocked)
+
+    def report(self, catalog, removed, kept):
+        """[{'name', 'dominated_by'}] for each removed product, naming the kept products that dominate it."""
+        kept_mask = bitset_to_mask(kept, self.size)
+        names = catalog.columns.name
+        return [{'name': names(j), 'dominated_by': [names(k) for k in self.dominators[j][kept_mask[self.dominators[j]]]]}
+                for j in np.flatnonzero(bitset_to_mask(removed, self.size))]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_dominance_index(catalog) -> DominanceIndex:
+    """Returns the dominance index for the catalog's version, building it once."""
+    with _indexes_lock:
+        index = _indexes.get(catalog.version)
+        if index is None:
+            index = DominanceIndex(catalog)
+            logging.debug(f"Presolve: {len(index.dominators)} of {len(catalog)} products are dominated")
+            # Only the current catalog version stays resident
+            _indexes.clear()
+            _indexes[catalog.version] = index
+        return index
+
+
+def presolve_products(catalog, available):
+    """Bitset of available products that can be dropped from the LP, or 0 when presolve does not apply."""
+    if np is None or MIN_PRODUCTS <= 0 or bin(available).count('1') < MIN_PRODUCTS:
+        return 0
+    return get_dominance_index(catalog).removed(available)
+
+
+def solve_with_presolve(catalog, available, norms, norms_upper, period_days, vegetarian_flag, no_added_sugar, backend='pulp'):
+    """solve_request() over the available products minus dominated ones, with the same optimal cost.
+
+    Returns (status, {product index: units of 100 g}, objective, bitset of
+    the products left out; see presolve_report). A dropped product whose kept dominators are all at
+    the per-product cap is put back and the LP solved again; a reduced
+    model that is not optimal is re-solved in full, unless it ran out
+    of its time budget.
+    """
+    removed = 0
+    # The resident HiGHS template keeps every column and warm-starts, so only the per-request CBC model is reduced
+    if backend == 'pulp':
+        with timed('presolve'):
+            removed = presolve_products(catalog, available)
+    while True:
+        status, units, objective = solve_request(
+            catalog, available & ~removed, norms, norms_upper, period_days, vegetarian_flag, no_added_sugar, backend)
+        if not removed or status == 'Time Limit':
+            # Out of time: no budget left to restore products or solve the full model
+            break
+        if status != 'Optimal':
+            logging.debug(f"Presolve: reduced model is {status}, solving the full model")
+            removed = 0
+            continue
+        index = get_dominance_index(catalog)
+        amounts = np.zeros(index.size)
+        amounts[list(units)] = list(units.values())
+        blocked = index.blocked(removed, available & ~removed, amounts, product_upper_bound(period_days))
+        if not blocked:
+            break
+        logging.debug(f"Presolve: restoring {bin(blocked).count('1')} products whose dominators are capped")
+        removed &= ~blocked
+    if removed:
+        for j in np.flatnonzero(bitset_to_mask(removed, len(catalog))):
+            units[int(j)] = 0.0
+    return status, units, objective, removed
+
+
+def presolve_report(catalog, available, removed):
+    """The ``presolve`` block of a result: products considered, how many were removed and which, with their dominators."""
+    return {
+        'products': bin(available).count('1'),
+        'removed_dominated': bin(removed).count('1'),
+        'removed': get_dominance_index(catalog).report(catalog, removed, available & ~removed)
+    }
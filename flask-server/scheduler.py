@@ -0,0 +1,98 @@
+import os
+import threading
+from contextlib import contextmanager
+
+from diet_model import solve_budget
+from metrics import SOLVER_REJECTED, SOLVER_RUNNING, SOLVER_WAITING, timed
+
+
+class SolverBusyError(Exception):
+    """Raised when a solve is refused because the wait queue is full or no slot freed up in time."""
+
+
+class SolverScheduler:
+    """Admission control for LP solves.
+
+    At most ``max_concurrent`` solves run at once and at most
+    ``max_waiting`` more wait for a slot, each for up to ``wait_timeout``
+    seconds; anything beyond is refused at once with SolverBusyError.
+    Every admitted block runs under a ``time_budget`` seconds solve budget
+    (see diet_model.solve_budget). Time spent waiting is recorded as the
+    'queue_wait' stage, apart from 'solve'.
+    """
+
+    def __init__(self, max_concurrent=None, max_waiting=32, wait_timeout=30, time_budget=10):
+        self.max_concurrent = max_concurrent or os.cpu_count() or 1
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.time_budget = time_budget
+        self._running = 0
+        self._waiting = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Takes a solver slot for a solve run elsewhere (e.g. in a process pool); pair with release()."""
+        with self._cond:
+            if self._running >= self.max_concurrent:
+                if self._waiting >= self.max_waiting:
+                    self._rejected += 1
+                    SOLVER_REJECTED.inc(reason='queue_full')
+                    raise SolverBusyError(f"Solver queue is full ({self.max_waiting} waiting solves)")
+                self._waiting += 1
+                SOLVER_WAITING.set(self._waiting)
+                try:
+                    admitted = self._cond.wait_for(lambda: self._running < self.max_concurrent, self.wait_timeout)
+                finally:
+                    self._waiting -= 1
+                    SOLVER_WAITING.set(self._waiting)
+                if not admitted:
+                    self._timeouts += 1
+                    SOLVER_REJECTED.inc(reason='wait_timeout')
+                    raise SolverBusyError(f"No solver slot became free within {self.wait_timeout} s")
+            self._running += 1
+            self._admitted += 1
+            SOLVER_RUNNING.set(self._running)
+
+    def try_acquire(self) -> bool:
+        """Takes a solver slot only if one is free right now; returns whether it did (pair with release())."""
+        with self._cond:
+            if self._running >= self.max_concurrent:
+                return False
+            self._running += 1
+            self._admitted += 1
+            SOLVER_RUNNING.set(self._running)
+            return True
+
+    def release(self):
+        with self._cond:
+            self._running -= 1
+            SOLVER_RUNNING.set(self._running)
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self):
+        """Holds a solver slot, with the solve budget applied, for the enclosed block; raises SolverBusyError."""
+        with timed('queue_wait'):
+            self.acquire()
+        try:
+            with solve_budget(self.time_budget):
+                yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'running': self._running,
+                'waiting': self._waiting,
+                'max_concurrent': self.max_concurrent,
+                'max_waiting': self.max_waiting,
+                'wait_timeout': self.wait_timeout,
+                'time_budget': self.time_budget,
+                'admitted': self._admitted,
+                'rejected': self._rejected,
+                'wait_timeouts': self._timeouts
+            }
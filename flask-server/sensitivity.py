@@ -0,0 +1,260 @@
+import logging
+import math
+import os
+
+import diet_model
+from catalog_store import bit_indices
+from diet_model import UPPER_NUTRIENTS, get_model_template, solve_request
+from metrics import timed
+from nutrition import nut_keys
+
+try:
+    import numpy as np
+except ImportError:  # sensitivity analysis needs SciPy (and with it NumPy)
+    np = None
+
+# Most LP solves a single /optimize/sweep request may run
+MAX_SWEEP_SOLVES = int(os.getenv('SWEEP_MAX_SOLVES', '200'))
+# Without highspy there is no ranging: the sweep solves this many evenly spaced values instead
+FALLBACK_SWEEP_POINTS = 21
+# Bisection steps used to locate where an initially infeasible norm sweep turns feasible
+FEASIBILITY_BISECTIONS = 30
+
+
+def _finite(value, digits=4):
+    """Rounded value, or None for an unbounded side (JSON has no infinity)."""
+    value = float(value)
+    return round(value, digits) if math.isfinite(value) else None
+
+
+def _diet(catalog, available, amounts):
+    """{product name: grams} of the products in the diet, as in /optimize's ``diet``."""
+    return {catalog.columns.name(i): round(amounts[i] * 100, 2) for i in bit_indices(available)
+            if round(amounts[i] * 100, 2) > 0}
+
+
+def sensitivity_report(catalog, template, available, amounts, rows, info):
+    """Dual values, reduced costs and cost ranging of one optimal solve.
+
+    ``constraints`` holds every active row by name with its ``shadow_price``
+    (cost change per unit the bound is raised) and the ``rhs_range`` over
+    which that price holds. ``products`` holds every available product with
+    its ``reduced_cost`` (how much cheaper an unused product must get to
+    enter the diet) and the ``price_range`` in which the diet stays optimal.
+    Ranges are only reported when highspy is installed.
+    """
+    activity = template.matrix @ np.asarray(amounts)
+    ranging = info['ranging']
+    constraints = {}
+    for row in rows:
+        r = template.family_index[row['family']]
+        entry = {
+            'sense': row['sense'],
+            'rhs': round(row['rhs'], 4),
+            'activity': round(float(activity[r]), 4),
+            'shadow_price': round(float(info['row_dual'][r]), 6)
+        }
+        if ranging is not None:
+            entry['rhs_range'] = [_finite(ranging['row_down'][r]), _finite(ranging['row_up'][r])]
+        constraints[row['name']] = entry
+    products = {}
+    for i in bit_indices(available):
+        entry = {
+            'units': round(amounts[i], 4),
+            'price_per_100g': catalog.columns.price(i),
+            'reduced_cost': round(float(info['col_dual'][i]), 6)
+        }
+        if ranging is not None:
+            # Ranging is on objective coefficients, which include the health nudges
+            nudge = template.cost[i] - catalog.columns.price(i)
+            entry['price_range'] = [_finite(ranging['cost_down'][i] - nudge), _finite(ranging['cost_up'][i] - nudge)]
+        products[catalog.columns.name(i)] = entry
+    return {'constraints': constraints, 'products': products}
+
+
+def analyze_request(catalog, available, norms, norms_upper, period_days, vegetarian_flag, no_added_sugar):
+    """Solves on the resident model template and reports the solve's sensitivity.
+
+    Returns (status, {product index: units of 100 g}, objective, report);
+    ``report`` is None when the solve is not optimal or SciPy is missing.
+    """
+    if diet_model.linprog is None:
+        logging.warning("SciPy is not installed, solving without sensitivity analysis")
+        return solve_request(catalog, available, norms, norms_upper, period_days, vegetarian_flag,
+                             no_added_sugar) + (None,)
+    with timed('model_build'):
+        template = get_model_template(catalog)
+    with timed('solve'):
+        status, amounts, objective, rows, info = template.analyze(
+            available, norms, norms_upper, period_days, vegetarian_flag, no_added_sugar)
+    units = {i: amounts[i] for i in bit_indices(available)}
+    report = None
+    if info is not None:
+        with timed('sensitivity'):
+            report = sensitivity_report(catalog, template, available, amounts, rows, info)
+    return status, units, objective, report
+
+
+def parse_sweep(data):
+    """Validates the ``sweep`` object of an /optimize/sweep body; returns (spec, error message).
+
+    ``{"product": name, "from": a, "to": b}`` varies the product's price per
+    100 g; ``{"norm": nutrient, "bound": "min"|"max", "from": a, "to": b}``
+    varies that nutrient's minimum (default) or maximum for the period.
+    """
+    sweep = data.get('sweep')
+    if not isinstance(sweep, dict):
+        return None, 'Invalid input: sweep object required'
+    try:
+        start, end = float(sweep['from']), float(sweep['to'])
+    except (KeyError, TypeError, ValueError):
+        return None, 'Invalid input: sweep from and to must be numeric'
+    if not (math.isfinite(start) and math.isfinite(end)) or start >= end:
+        return None, 'Invalid input: sweep from must be below to'
+    if 'product' in sweep:
+        return {'product': str(sweep['product']), 'from': start, 'to': end}, None
+    if 'norm' in sweep:
+        nut = sweep['norm']
+        bound = str(sweep.get('bound', 'min')).lower()
+        if bound not in ('min', 'max'):
+            return None, 'Invalid input: sweep bound must be min or max'
+        if nut not in nut_keys or (bound == 'max' and nut not in UPPER_NUTRIENTS):
+            return None, f'Invalid input: there is no {bound} norm for {nut}'
+        return {'norm': nut, 'bound': bound, 'from': start, 'to': end}, None
+    return None, 'Invalid input: sweep needs a product or a norm'
+
+
+def sweep(catalog, available, norms, norms_upper, period_days, vegetarian_flag, no_added_sugar, spec):
+    """Re-solves the request while one product price or one norm moves from spec['from'] to spec['to'].
+
+    With highspy the sweep is parametric: each solve warm-starts from the
+    previous basis and the next solve happens just past the end of the
+    current basis' ranging interval, so every breakpoint is found and none
+    is skipped. Without highspy FALLBACK_SWEEP_POINTS evenly spaced values
+    are solved and breakpoints are only located to the grid (``exact``
+    is False). Segments between breakpoints carry the diet at their start
+    and the total cost at both ends. A product sweep names its product's
+    catalog index in spec['product_index'].
+    """
+    template = get_model_template(catalog)
+    start, end = spec['from'], spec['to']
+    if 'product' in spec:
+        j = spec['product_index']
+        nudge = template.cost[j] - catalog.columns.price(j)
+
+        def solve_at(value):
+            cost = template.cost.copy()
+            cost[j] = value + nudge
+            return template.analyze(available, norms, norms_upper, period_days, vegetarian_flag, no_added_sugar, cost)
+
+        def slope(amounts, info):
+            return amounts[j]
+
+        def basis_end(value, amounts, info):
+            return info['ranging']['cost_up'][j] - nudge
+    else:
+        family = f"{spec['bound'].capitalize()}_{spec['norm']}"
+        r = template.family_index[family]
+
+        def solve_at(value):
+            if spec['bound'] == 'min':
+                return template.analyze(available, dict(norms, **{spec['norm']: value}), norms_upper,
+                                        period_days, vegetarian_flag, no_added_sugar)
+            return template.analyze(available, norms, dict(norms_upper, **{spec['norm']: value}),
+                                    period_days, vegetarian_flag, no_added_sugar)
+
+        def slope(amounts, info):
+            return info['row_dual'][r]
+
+        def basis_end(value, amounts, info):
+            activity = float((template.matrix[r] @ np.asarray(amounts))[0])
+            # HiGHS reports a slack row's own bound as its range end; a slack row stays slack until
+            # a raised minimum reaches the activity, and a raised maximum never binds
+            if spec['bound'] == 'min' and activity > value + 1e-7:
+                return activity
+            if spec['bound'] == 'max' and activity < value - 1e-7:
+                return math.inf
+            return info['ranging']['row_up'][r]
+
+    points = []
+    solves = 0
+    exact = True
+    truncated = False
+    value = start
+    with timed('sweep'):
+        status, amounts, objective, _, info = solve_at(value)
+        solves += 1
+        if status != 'Optimal':
+            # A single bound is feasible on one interval: find where it starts, if anywhere in range
+            points.append((value, status, None, None, None))
+            status, amounts, objective, _, info = solve_at(end)
+            solves += 1
+            if status != 'Optimal':
+                value = end
+            else:
+                low, high = start, end
+                for _ in range(FEASIBILITY_BISECTIONS):
+                    mid = (low + high) / 2
+                    solves += 1
+                    if solve_at(mid)[0] == 'Optimal':
+                        high = mid
+                    else:
+                        low = mid
+                value = high
+                status, amounts, objective, _, info = solve_at(value)
+                solves += 1
+        while status == 'Optimal':
+            points.append((value, status, objective, amounts, slope(amounts, info)))
+            if info['ranging'] is not None:
+                upper = max(basis_end(value, amounts, info), value)
+                # Step just past the end of this basis' interval
+                value = upper + max(1e-7 * abs(upper), 1e-6 * (end - start))
+            else:
+                exact = False
+                value += (end - start) / (FALLBACK_SWEEP_POINTS - 1)
+            if value > end:
+                break
+            if solves >= MAX_SWEEP_SOLVES:
+                truncated = True
+                break
+            status, amounts, objective, _, info = solve_at(value)
+            solves += 1
+        else:
+            points.append((value, status, None, None, None))
+    logging.debug(f"Sweep of {spec}: {len(points)} intervals in {solves} solves")
+
+    segments = []
+    for k, (value, status, objective, amounts, rate) in enumerate(points):
+        upper = points[k + 1][0] if k + 1 < len(points) else end
+        if truncated and k + 1 == len(points):
+            upper = value
+        if status != 'Optimal':
+            segment = {'from': round(value, 4), 'to': round(upper, 4), 'status': status}
+        else:
+            segment = {
+                'from': round(value, 4),
+                'to': round(upper, 4),
+                'status': status,
+                'diet': _diet(catalog, available, amounts),
+                'total_cost': [round(objective, 2), round(objective + rate * (upper - value), 2)]
+            }
+        previous = segments[-1] if segments else None
+        # Basis changes that leave the set of products unchanged are not breakpoints
+        if previous is not None and previous['status'] == segment['status'] and \
+                previous.get('diet', {}).keys() == segment.get('diet', {}).keys():
+            previous['to'] = segment['to']
+            if 'total_cost' in segment:
+                previous['total_cost'][1] = segment['total_cost'][1]
+            continue
+        segments.append(segment)
+    parameter = {key: spec[key] for key in ('product', 'norm', 'bound') if key in spec}
+    return {
+        'parameter': parameter,
+        'from': start,
+        'to': end,
+        'segments': segments,
+        'breakpoints': [segment['from'] for segment in segments[1:]],
+        'solves': solves,
+        'exact': exact,
+        'truncated': truncated
+    }
@@ -0,0 +1,88 @@
+import unicodedata
+
+
+def normalize_text(text) -> str:
+    """Lowercase, strip spaces and remove diacritics for robust matching."""
+    t = str(text or '').strip().lower()
+    return ''.join(c for c in unicodedata.normalize('NFKD', t) if not unicodedata.combining(c))
+
+
+# Food categories used by the diet constraints. Keywords are lowercase ASCII
+# (no diacritics) and are matched as substrings of the normalized product name.
+FOOD_TAXONOMY = {
+    'oils': ['ella'],
+    'refined_grains': ['makaroni', 'mannas', 'milti', 'maize'],
+    'whole_grains': ['griki', 'auzu', 'rudzu', 'miezu', 'putraimi', 'risi', 'grubas'],
+    'legumes': ['zirn', 'pupi', 'lec', 'soja'],
+    'vegetables': ['tomat', 'gurk', 'burkan', 'biet', 'kapost', 'spinat', 'salat', 'redis', 'kirb', 'kartupel', 'kabac', 'pipar', 'sipol', 'purav', 'skaben'],
+    'fruits': ['abol', 'apelsin', 'banan', 'vinog', 'upen', 'aven', 'zemen', 'mandarin', 'bumbier', 'plum', 'citron', 'dzerven', 'bruklen', 'aprikoz', 'persik', 'kirs'],
+    'offal': ['aknas', 'smadzenes'],
+    'fish': ['ziv', 'silk', 'sprot', 'lasis', 'zandarts', 'menca', 'lidaka', 'karpa', 'kaviar', 'kilav'],
+    'poultry': ['vistas', 'vista', 'titara', 'piles', 'zoss'],
+    'red_meat': ['liellopu', 'cuka', 'tela', 'aita', 'jera', 'cukas'],
+    'processed_meat': ['desa', 'skink', 'cisin', 'zavet'],
+    'sweets': ['sokolade', 'konfekt', 'marmelad', 'cepumi', 'kakao', 'karamel'],
+    'potatoes': ['kartupel'],
+    'pasta': ['makaroni'],
+    'added_sugar': ['cukurs'],
+    # Products excluded by the vegetarian filter. These keep their diacritics and
+    # are matched against the lowercase name only: 'cūk' must not match 'cukurs'.
+    'meat_or_fish': [
+        'gaļa', 'cūk', 'liellop', 'vistas', 'vista', 'teļa', 'tītara', 'truša', 'zoss', 'pīles',
+        'ziv', 'siļķ', 'šprot', 'lasis', 'zandarts', 'menca', 'līdaka', 'karpa', 'kaviār',
+        'aknas', 'smadzenes',
+        'desa', 'šķiņķ', 'cīsiņ', 'žāvētā'
+    ]
+}
+
+# Categories whose keywords are matched with diacritics preserved
+DIACRITIC_CATEGORIES = {'meat_or_fish'}
+
+# Canonical allergen set mapped to Latvian keywords (normalized/ascii) found in
+# the Allergeni column. The position in ALLERGENS is the allergen's mask bit.
+ALLERGEN_KEYWORDS = {
+    'lactose': ['laktoze'],
+    'milk': ['piens', 'laktoze'],
+    'gluten': ['glutens', 'kviesi', 'rudzi', 'miezi', 'auzas'],
+    'eggs': ['olas', 'olu'],
+    'soy': ['soja'],
+    'nuts': ['rieksti', 'zemesrieksti', 'mandeles', 'lazdu', 'valrieksti'],
+    'sesame': ['sezama'],
+    'sulfites': ['sulfiti'],
+    'fish': ['zivis', 'zivju']
+}
+ALLERGENS = tuple(ALLERGEN_KEYWORDS)
+ALLERGEN_BITS = {allergen: 1 << i for i, allergen in enumerate(ALLERGENS)}
+
+
+def categorize(name) -> frozenset:
+    """Returns the set of taxonomy categories a product name belongs to."""
+    lowered = str(name or '').strip().lower()
+    normalized = normalize_text(name)
+    tags = set()
+    for category, keywords in FOOD_TAXONOMY.items():
+        haystack = lowered if category in DIACRITIC_CATEGORIES else normalized
+        if any(kw in haystack for kw in keywords):
+            tags.add(category)
+    return frozenset(tags)
+
+
+def allergen_mask(allergens_text) -> int:
+    """Parses a product's Allergeni string into a bitmask over ALLERGENS."""
+    normalized = normalize_text(allergens_text)
+    mask = 0
+    for allergen, keywords in ALLERGEN_KEYWORDS.items():
+        if any(kw in normalized for kw in keywords):
+            mask |= ALLERGEN_BITS[allergen]
+    return mask
+
+
+def requested_allergens(allergens):
+    """Canonical allergen keys from request input, in request order; unknown keys are dropped."""
+    keys = []
+    for allergen in allergens or []:
+        key = str(allergen or '').strip().lower()
+        if key in ALLERGEN_BITS and key not in keys:
+            keys.append(key)
+    return keys
+
@@ -0,0 +1,125 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# The server modules are imported flat, as app.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('MEAL_PLAN_CACHE_PATH', ':memory:')
+
+
+def completion(content):
+    """Stub answer: a chat completion whose message is ``content``."""
+    return {'status': 200, 'body': json.dumps({'choices': [{'message': {'content': content}}]})}
+
+
+def completion_stream(deltas, fail_after=None):
+    """Stub answer: a streamed chat completion of ``deltas``, cut off after ``fail_after`` of them if set."""
+    lines = [f"data: {json.dumps({'choices': [{'delta': {'content': delta}}]})}" for delta in deltas]
+    if fail_after is not None:
+        return {'status': 200, 'stream': lines[:fail_after], 'abort': True}
+    return {'status': 200, 'stream': lines + ['data: [DONE]']}
+
+
+def error(status, retry_after=None):
+    """Stub answer: an HTTP error, with a Retry-After header if set."""
+    headers = {'Retry-After': str(retry_after)} if retry_after is not None else {}
+    return {'status': status, 'headers': headers, 'body': json.dumps({'error': {'message': f'stub {status}'}})}
+
+
+class StubServer:
+    """Local chat completions server answering POSTs from a script.
+
+    ``script`` is a list of answers (see completion(), completion_stream()
+    and error()) used in order; once it runs out ``default`` answers.
+    ``requests`` records (monotonic time, JSON body) per request and
+    ``on_request`` is called before each answer.
+    """
+
+    def __init__(self):
+        self.script = []
+        self.default = completion('stub meal plan')
+        self.requests = []
+        self.on_request = None
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'null')
+                with stub._lock:
+                    stub.requests.append((time.monotonic(), body))
+                    answer = stub.script.pop(0) if stub.script else stub.default
+                if stub.on_request is not None:
+                    stub.on_request()
+                self.send_response(answer['status'])
+                for name, value in answer.get('headers', {}).items():
+                    self.send_header(name, value)
+                if 'stream' in answer:
+                    self.send_header('Content-Type', 'text/event-stream')
+                    self.send_header('Transfer-Encoding', 'chunked')
+                    self.send_header('Connection', 'close')
+                    self.end_headers()
+                    for line in answer['stream']:
+                        data = f'{line}\n\n'.encode('utf-8')
+                        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+                        self.wfile.flush()
+                    self.close_connection = True
+                    if answer.get('abort'):
+                        # Drop the connection before the last chunk, as a crashed upstream would
+                        self.connection.shutdown(2)
+                    else:
+                        self.wfile.write(b'0\r\n\r\n')
+                    return
+                payload = answer.get('body', '').encode('utf-8')
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}/v1'
+        self._thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+
+    @property
+    def hits(self):
+        return len(self.requests)
+
+
+@pytest.fixture
+def stub():
+    server = StubServer()
+    server._thread.start()
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+
+@pytest.fixture
+def make_app(stub):
+    """Builds the app against the stub completions server; keyword arguments override its config."""
+    from app import create_app
+
+    def make(**config):
+        return create_app(dict({
+            'LOG_LEVEL': 'WARNING',
+            'OPENAI_BASE_URL': stub.base_url,
+            'OPENAI_API_KEY': 'test',
+            'OPENAI_MAX_RETRIES': 0,
+            'MEAL_PLAN_CACHE_PATH': ':memory:',
+            'MEAL_PLAN_JOB_STORE_PATH': None,
+            'OPTIMIZE_RESULT_STORE_PATH': None,
+            'RESULT_CACHE_PATH': None
+        }, **config))
+    return make
@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from batch import make_batch_pool, optimize_batch
+from catalog import DB_PATH, CatalogCache
+from scheduler import SolverScheduler
+
+PROFILES = [{'gender': gender, 'activity': 'moderate', 'period': 'day', 'weight': weight}
+            for gender in ('male', 'female') for weight in (60, 75, 90)]
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return CatalogCache(DB_PATH).get()
+
+
+@pytest.fixture(scope='module')
+def pool():
+    pool = make_batch_pool(2)
+    yield pool
+    pool.shutdown(cancel_futures=True)
+
+
+def test_pool_results_match_serial_and_every_item_is_admitted(catalog, pool):
+    serial = optimize_batch(PROFILES + [{'weight': 'abc'}], catalog)
+    scheduler = SolverScheduler(max_concurrent=2)
+    pooled = optimize_batch(PROFILES + [{'weight': 'abc'}], catalog, pool=pool, scheduler=scheduler, time_budget=5)
+    assert [item['index'] for item in pooled] == list(range(len(PROFILES) + 1))
+    assert pooled[-1]['status'] == 'Invalid'
+    for a, b in zip(serial[:-1], pooled[:-1]):
+        assert b['status'] == a['status'] == 'Optimal'
+        assert b['total_cost'] == pytest.approx(a['total_cost'], abs=0.011)
+    stats = scheduler.stats()
+    assert (stats['admitted'], stats['running']) == (len(PROFILES), 0)
+
+
+def test_busy_scheduler_reports_items_as_busy(catalog, pool):
+    scheduler = SolverScheduler(max_concurrent=1, max_waiting=0)
+    scheduler.acquire()
+    try:
+        items = optimize_batch(PROFILES[:2], catalog, pool=pool, scheduler=scheduler)
+    finally:
+        scheduler.release()
+    assert [item['status'] for item in items] == ['Busy', 'Busy']
+    assert scheduler.stats()['rejected'] == 2
+
+
+def test_batch_route_streams_every_item(make_app):
+    app = make_app(BATCH_WORKERS=2)
+    response = app.test_client().post('/optimize/batch', json={'profiles': PROFILES[:3]})
+    assert response.status_code == 200
+    items = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert sorted(item['index'] for item in items) == [0, 1, 2]
+    assert all(item['status'] == 'Optimal' for item in items)
+    assert app.extensions['diet']['solver_scheduler'].stats()['admitted'] == 3
+    app.extensions['diet']['batch_pool'].shutdown()
@@ -0,0 +1,21 @@
+import pytest
+
+from catalog import DB_PATH, CatalogCache
+from optimizer import parse_profile, solve_profile
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return CatalogCache(DB_PATH).get()
+
+
+def test_best_effort_reports_basket_cost_not_total_cost(catalog):
+    # A vegetarian who eats neither milk nor eggs has no feasible diet in this catalog
+    profile, error = parse_profile({'gender': 'male', 'vegetarian': True, 'allergens': ['milk', 'eggs'], 'best_effort': True})
+    assert error is None
+    result = solve_profile(catalog, profile)
+    assert result['status'] == 'Infeasible' and result['relaxations']
+    best_effort = result['best_effort']
+    assert 'total_cost' not in best_effort
+    assert best_effort['basket_cost'] == pytest.approx(sum(item['cost'] for item in best_effort['items']), abs=0.01)
+    assert best_effort['items']
@@ -0,0 +1,21 @@
+import os
+
+import pytest
+from flask import Flask
+
+from app import load_config
+
+
+@pytest.mark.parametrize('cores,web_concurrency,explicit,expected', [
+    (8, None, None, 8), (8, '4', None, 2), (8, '16', None, 1), (8, '4', '6', 6), (None, '2', None, 1)
+])
+def test_solver_concurrency_splits_cores_between_workers(monkeypatch, cores, web_concurrency, explicit, expected):
+    monkeypatch.setattr(os, 'cpu_count', lambda: cores)
+    for name, value in (('WEB_CONCURRENCY', web_concurrency), ('SOLVER_CONCURRENCY', explicit)):
+        if value is None:
+            monkeypatch.delenv(name, raising=False)
+        else:
+            monkeypatch.setenv(name, value)
+    app = Flask(__name__)
+    load_config(app)
+    assert app.config['SOLVER_CONCURRENCY'] == expected
@@ -0,0 +1,35 @@
+import pytest
+
+from catalog import DB_PATH, CatalogCache
+from catalog_store import bit_indices
+from diet_model import GROUP_ROW_TERMS, OBJECTIVE_NUDGES, build_diet_lp, diet_rows
+from optimizer import available_products, parse_profile
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return CatalogCache(DB_PATH).get()
+
+
+@pytest.mark.parametrize('body', [{'gender': 'male'}, {'gender': 'female', 'period': 'day', 'vegetarian': True},
+                                  {'allergens': ['milk'], 'no_added_sugar': True}])
+def test_lp_from_columns_matches_product_records(catalog, body):
+    profile, _ = parse_profile(body)
+    product_ids = bit_indices(available_products(catalog, profile))
+    lp = build_diet_lp(catalog, product_ids, profile['norms'], profile['norms_upper'], profile['period_days'],
+                       profile['vegetarian'], profile['no_added_sugar'])
+    foods = [catalog.foods[i] for i in product_ids]
+    assert [f['name'] for f in lp['foods']] == [f['name'] for f in foods]
+    assert lp['cost'] == [f['price_per_100g'] + sum(w for category, w in OBJECTIVE_NUDGES.items() if category in f['tags'])
+                          for f in foods]
+    present = set().union(*(f['tags'] for f in foods))
+    families = [row['family'] for row in diet_rows(profile['norms'], profile['norms_upper'], profile['period_days'],
+                                                   profile['vegetarian'], profile['no_added_sugar'], present.__contains__)]
+    assert len(families) == len(lp['rows'])
+    for family, row in zip(families, lp['rows']):
+        if family.startswith(('Min_', 'Max_')):
+            assert row['coeffs'] == {k: f[family[4:]] for k, f in enumerate(foods)}
+        else:
+            expected = {k: sum(sign for category, sign in GROUP_ROW_TERMS[family] if category in f['tags'])
+                        for k, f in enumerate(foods)}
+            assert row['coeffs'] == {k: c for k, c in expected.items() if c}
@@ -0,0 +1,62 @@
+import pytest
+
+from catalog import DB_PATH, CatalogSnapshot, load_products_from_db
+from catalog_store import open_catalog_store
+from diet_model import linprog
+from household import optimize_household, parse_household
+from multiday import optimize_plan, parse_plan
+from optimizer import parse_profile, solve_profile, sweep_profile
+from sensitivity import parse_sweep
+
+needs_scipy = pytest.mark.skipif(linprog is None, reason='SciPy is not installed')
+PROFILE = {'gender': 'male', 'activity': 'moderate', 'period': 'day'}
+
+
+@pytest.fixture(scope='module')
+def catalogs(tmp_path_factory):
+    """The shipped catalog, and the same products with every name shared by two of them."""
+    foods = load_products_from_db(DB_PATH)
+    shared = [dict(f, name=foods[i - i % 2]['name']) for i, f in enumerate(foods)]
+    store_dir = tmp_path_factory.mktemp('store')
+    return (CatalogSnapshot('unique', open_catalog_store(store_dir, 'unique', foods)),
+            CatalogSnapshot('shared', open_catalog_store(store_dir, 'shared', shared)))
+
+
+@pytest.mark.parametrize('backend', ['pulp', pytest.param('highs', marks=needs_scipy)])
+def test_products_sharing_a_name_keep_their_own_amounts(catalogs, backend):
+    unique, shared = catalogs
+    profile, _ = parse_profile(PROFILE)
+    expected = solve_profile(unique, profile, backend)
+    result = solve_profile(shared, profile, backend)
+    assert result['status'] == expected['status'] == 'Optimal'
+    assert result['total_cost'] == pytest.approx(expected['total_cost'], abs=0.011)
+    assert sum(item['cost'] for item in result['items']) == pytest.approx(result['total_cost'], abs=0.05)
+    assert result['nutrient_totals']['kcal'] == pytest.approx(expected['nutrient_totals']['kcal'], abs=0.05)
+
+
+def test_pack_sizes_apply_to_every_product_of_a_name(catalogs):
+    _, shared = catalogs
+    name = shared.columns.name(0)
+    assert shared.columns.find_all(name) == [0, 1]
+    household, error = parse_household({'members': [PROFILE], 'pack_sizes': {name: 1000}}, shared)
+    assert error is None
+    payload = optimize_household(shared, household)
+    assert 'error' not in payload
+
+
+@needs_scipy
+def test_sweep_uses_a_product_the_profile_may_eat(catalogs):
+    _, shared = catalogs
+    profile, _ = parse_profile(PROFILE)
+    spec, error = parse_sweep({'sweep': {'product': shared.columns.name(2), 'from': 0.1, 'to': 5}})
+    assert error is None
+    payload, status_code = sweep_profile(shared, profile, spec)
+    assert status_code == 200 and payload['segments']
+    assert payload['parameter'] == {'product': shared.columns.name(2)}
+
+
+def test_monolithic_plan_over_products_sharing_a_name(catalogs):
+    _, shared = catalogs
+    plan, error = parse_plan({'gender': 'male', 'days': 3, 'max_repeats': 2, 'decompose': False})
+    assert error is None
+    assert optimize_plan(shared, plan)['status'] == 'Optimal'
@@ -0,0 +1,55 @@
+import pytest
+
+from catalog import DB_PATH, CatalogCache
+from household import optimize_household, parse_household
+from multiday import optimize_plan, parse_plan
+from result_cache import ResultCache
+
+MEMBERS = [{'name': 'a', 'gender': 'male', 'activity': 'moderate'}, {'name': 'b', 'gender': 'female', 'activity': 'low'}]
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return CatalogCache(DB_PATH).get()
+
+
+def test_unknown_pack_size_products_are_invalid_input(catalog, make_app):
+    name = catalog.columns.name(0)
+    household, error = parse_household({'members': MEMBERS, 'pack_sizes': {name: 500, 'no such food': 250}}, catalog)
+    assert household is None
+    assert error == 'Invalid input: unknown product in pack_sizes: no such food'
+
+    response = make_app().test_client().post('/optimize/household',
+                                             json={'members': MEMBERS, 'pack_sizes': {'no such food': 250}})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid input: unknown product in pack_sizes: no such food'}
+
+
+def test_only_solved_households_are_cached(catalog):
+    cache = ResultCache(16, 3600)
+    household, error = parse_household({'members': MEMBERS, 'pack_sizes': {catalog.columns.name(0): 500}}, catalog)
+    assert error is None
+    assert optimize_household(catalog, household, cache=cache)['cache'] == 'miss'
+    payload = optimize_household(catalog, household, cache=cache)
+    assert payload['cache'] == 'hit' and 'error' not in payload
+
+    # A vegetarian who eats neither milk nor eggs has no feasible diet here: nothing is cached
+    restricted = [dict(MEMBERS[0], vegetarian=True, allergens=['milk', 'eggs'])]
+    household, error = parse_household({'members': restricted, 'period': 'day'}, catalog)
+    assert error is None
+    assert optimize_household(catalog, household, cache=cache)['status'] == 'Infeasible'
+    assert optimize_household(catalog, household, cache=cache)['cache'] == 'miss'
+
+
+def test_only_solved_plans_are_cached(catalog):
+    cache = ResultCache(16, 3600)
+    plan, error = parse_plan(dict(MEMBERS[0], days=2))
+    assert error is None
+    assert optimize_plan(catalog, plan, cache=cache)['cache'] == 'miss'
+    payload = optimize_plan(catalog, plan, cache=cache)
+    assert payload['cache'] == 'hit' and 'error' not in payload
+
+    plan, error = parse_plan(dict(MEMBERS[0], days=2, vegetarian=True, allergens=['milk', 'eggs']))
+    assert error is None
+    assert 'error' in optimize_plan(catalog, plan, cache=cache)
+    assert optimize_plan(catalog, plan, cache=cache)['cache'] == 'miss'
@@ -0,0 +1,146 @@
+import time
+
+import pytest
+
+from conftest import completion, error
+from llm_client import CircuitOpenError, LLMClient, LLMClientError
+
+BODY = {'messages': [{'role': 'user', 'content': 'plan'}]}
+
+
+def make_client(stub, **kwargs):
+    options = dict(base_url=stub.base_url, api_key='test', connect_timeout=1, read_timeout=5,
+                   max_retries=2, backoff_base=0.001, backoff_max=0.01, breaker_threshold=3, breaker_reset=0.3)
+    options.update(kwargs)
+    return LLMClient(**options)
+
+
+@pytest.mark.parametrize('status', [429, 500, 502, 503, 504])
+def test_retries_honor_retry_after(stub, status):
+    stub.script = [error(status, retry_after=0.2), completion('ok')]
+    client = make_client(stub, backoff_max=1)
+    assert client.chat(BODY) == 'ok'
+    assert stub.hits == 2
+    (first, _), (second, _) = stub.requests
+    # Backoff alone would wait at most 10 ms
+    assert second - first >= 0.2
+    assert client.stats()['retries'] == 1
+
+
+@pytest.mark.parametrize('retry_after', ['86400', 'Fri, 31 Dec 2100 23:59:59 GMT'])
+def test_long_retry_after_is_not_waited_for(stub, retry_after):
+    stub.script = [{'status': 429, 'headers': {'Retry-After': retry_after}, 'body': '{}'}, completion('too late')]
+    client = make_client(stub, backoff_max=1)
+    started = time.monotonic()
+    with pytest.raises(LLMClientError) as e:
+        client.chat(BODY)
+    assert time.monotonic() - started < 1
+    assert e.value.status_code == 429
+    assert stub.hits == 1
+    assert client.stats()['retries'] == 0
+    assert client.breaker.failures == 1
+
+
+def test_retries_give_up_after_max_retries(stub):
+    stub.script = [error(503)] * 3
+    client = make_client(stub)
+    with pytest.raises(LLMClientError) as e:
+        client.chat(BODY)
+    assert e.value.status_code == 503
+    assert stub.hits == 3
+
+
+@pytest.mark.parametrize('status', [400, 401, 404])
+def test_client_errors_are_not_retried(stub, status):
+    stub.script = [error(status)]
+    client = make_client(stub)
+    with pytest.raises(LLMClientError) as e:
+        client.chat(BODY)
+    assert e.value.status_code == status
+    assert stub.hits == 1
+    assert client.stats()['retries'] == 0
+    # Upstream answered: nothing for the breaker to hold against it
+    assert client.breaker.failures == 0
+
+
+def test_client_errors_do_not_open_breaker(stub):
+    stub.script = [error(400)] * 5
+    client = make_client(stub, breaker_threshold=2)
+    for _ in range(5):
+        with pytest.raises(LLMClientError):
+            client.chat(BODY)
+    assert client.breaker.state == 'closed'
+    assert stub.hits == 5
+
+
+def test_breaker_counts_each_call_once(stub):
+    # Two calls of three failed attempts each stay below a threshold of three calls
+    stub.script = [error(429)] * 6
+    client = make_client(stub)
+    for _ in range(2):
+        with pytest.raises(LLMClientError):
+            client.chat(BODY)
+    assert stub.hits == 6
+    assert client.breaker.failures == 2
+    assert client.breaker.state == 'closed'
+
+
+def test_breaker_open_half_open_closed(stub):
+    stub.script = [error(500)] * 3 + [error(500), completion('recovered')]
+    client = make_client(stub, max_retries=0)
+    for _ in range(3):
+        with pytest.raises(LLMClientError):
+            client.chat(BODY)
+    assert client.breaker.state == 'open'
+
+    # Open: fail fast without calling upstream
+    with pytest.raises(CircuitOpenError):
+        client.chat(BODY)
+    assert stub.hits == 3
+
+    # Half-open: one trial call; a failure re-opens the breaker
+    states = []
+    stub.on_request = lambda: states.append(client.breaker.state)
+    time.sleep(0.35)
+    with pytest.raises(LLMClientError):
+        client.chat(BODY)
+    assert states == ['half-open']
+    assert client.breaker.state == 'open'
+
+    # A successful trial closes it again
+    time.sleep(0.35)
+    assert client.chat(BODY) == 'recovered'
+    assert states == ['half-open', 'half-open']
+    assert client.breaker.state == 'closed'
+    assert client.chat(BODY) == 'stub meal plan'
+    assert client.breaker.opens == 2
+
+
+def test_stats_counters(stub):
+    stub.script = [error(503), completion('a'), error(400), error(500), error(500), error(500)]
+    client = make_client(stub)
+    client.chat(BODY)
+    with pytest.raises(LLMClientError):
+        client.chat(BODY)
+    with pytest.raises(LLMClientError):
+        client.chat(BODY)
+    stats = client.stats()
+    assert stub.hits == 6
+    assert stats['requests'] == 6
+    assert stats['retries'] == 3
+    assert stats['successes'] == 1
+    assert stats['failures'] == 2
+    assert stats['rejected'] == 0
+    assert stats['breaker_state'] == 'closed'
+    assert stats['breaker_opens'] == 0
+    assert 0 < stats['latency_max'] and stats['latency_avg'] <= stats['latency_max']
+    assert stats['base_url'] == stub.base_url
+
+    client = make_client(stub, breaker_threshold=1, max_retries=0)
+    stub.script = [error(502)]
+    with pytest.raises(LLMClientError):
+        client.chat(BODY)
+    with pytest.raises(CircuitOpenError):
+        client.chat(BODY)
+    stats = client.stats()
+    assert (stats['failures'], stats['rejected'], stats['breaker_state'], stats['breaker_opens']) == (1, 1, 'open', 1)
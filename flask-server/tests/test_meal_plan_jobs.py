@@ -0,0 +1,127 @@
+import threading
+import time
+
+from conftest import completion, error
+
+PROFILE = {'gender': 'female', 'weight': 60, 'height': 165, 'age': 35, 'period': 'day'}
+
+
+def wait_for_job(client, status_url, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        response = client.get(status_url)
+        if response.json['status'] in ('succeeded', 'failed') or time.monotonic() > deadline:
+            return response
+        time.sleep(0.02)
+
+
+def test_job_is_queued_then_succeeds(make_app, stub):
+    stub.script = [completion('Brokastis: auzu pārslas')]
+    client = make_app().test_client()
+    response = client.post('/meal-plan', json=PROFILE)
+    assert response.status_code == 202
+    job = response.json
+    assert job['status'] == 'queued'
+    assert job['status_url'] == f"/meal-plan/{job['job_id']}"
+
+    response = wait_for_job(client, job['status_url'])
+    assert response.status_code == 200
+    assert response.json['status'] == 'succeeded'
+    result = response.json['result']
+    assert result['meal_plan'] == 'Brokastis: auzu pārslas'
+    assert result['status'] == 'Optimal' and result['diet']
+    assert stub.hits == 1
+    # The prompt lists the optimized diet
+    prompt = stub.requests[0][1]['messages'][1]['content']
+    assert all(name in prompt for name in result['diet'])
+
+
+def test_failed_llm_call_fails_the_job(make_app, stub):
+    stub.script = [error(401)]
+    client = make_app().test_client()
+    job = client.post('/meal-plan', json=PROFILE).json
+    response = wait_for_job(client, job['status_url'])
+    assert response.json['status'] == 'failed'
+    assert response.json['error'] == 'Failed to generate meal plan'
+    assert '401' in response.json['details']
+
+
+def test_unknown_job_is_404(make_app):
+    assert make_app().test_client().get('/meal-plan/nope').status_code == 404
+
+
+def test_wait_true_answers_synchronously(make_app, stub):
+    stub.script = [completion('plan A')]
+    client = make_app().test_client()
+    response = client.post('/meal-plan?wait=true', json=PROFILE)
+    assert response.status_code == 200
+    assert response.json['meal_plan'] == 'plan A'
+    assert response.json['meal_plan_cache'] == 'miss'
+    # The same request is answered from the meal plan cache
+    response = client.post('/meal-plan?wait=true', json=PROFILE)
+    assert response.json['meal_plan'] == 'plan A' and response.json['meal_plan_cache'] == 'hit'
+    assert stub.hits == 1
+
+
+def test_result_id_reuses_the_optimized_diet(make_app, stub):
+    app = make_app()
+    client = app.test_client()
+    optimized = client.post('/optimize', json=PROFILE).json
+    scheduler = app.extensions['diet']['solver_scheduler']
+    admitted = scheduler.stats()['admitted']
+
+    response = client.post('/meal-plan?wait=true', json=dict(PROFILE, result_id=optimized['result_id']))
+    assert response.status_code == 200
+    assert response.json['diet'] == optimized['diet']
+    assert response.json['total_cost'] == optimized['total_cost']
+    # No solve ran for the meal plan
+    assert scheduler.stats()['admitted'] == admitted
+
+    job = client.post('/meal-plan', json=dict(PROFILE, result_id=optimized['result_id'])).json
+    assert wait_for_job(client, job['status_url']).json['result']['diet'] == optimized['diet']
+
+
+def test_unknown_result_id_is_404(make_app, stub):
+    client = make_app().test_client()
+    response = client.post('/meal-plan?wait=true', json=dict(PROFILE, result_id='missing'))
+    assert response.status_code == 404
+    assert response.json['error'] == 'Unknown or expired result_id'
+    job = client.post('/meal-plan', json=dict(PROFILE, result_id='missing')).json
+    response = wait_for_job(client, job['status_url'])
+    assert response.json['status'] == 'failed'
+    assert response.json['error'] == 'Unknown or expired result_id'
+    assert stub.hits == 0
+
+
+def test_full_queue_is_503_with_retry_after(make_app, stub):
+    release = threading.Event()
+    stub.on_request = lambda: release.wait(10)
+    client = make_app(MEAL_PLAN_WORKERS=1, MEAL_PLAN_QUEUE_DEPTH=1, MEAL_PLAN_RETRY_AFTER=7).test_client()
+    try:
+        first = client.post('/meal-plan', json=PROFILE)
+        assert first.status_code == 202
+        response = client.post('/meal-plan', json=dict(PROFILE, age=40))
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '7'
+        assert 'queue is full' in response.json['error']
+    finally:
+        release.set()
+    assert wait_for_job(client, first.json['status_url']).json['status'] == 'succeeded'
+
+
+def test_jobs_and_results_are_shared_between_workers(make_app, stub, tmp_path):
+    # Two apps over the same store files stand in for two server processes
+    stores = {'MEAL_PLAN_JOB_STORE_PATH': str(tmp_path / 'jobs.db'),
+              'OPTIMIZE_RESULT_STORE_PATH': str(tmp_path / 'results.db')}
+    first, second = make_app(**stores).test_client(), make_app(**stores).test_client()
+    stub.script = [completion('shared plan'), completion('plan from the stored diet')]
+
+    job = first.post('/meal-plan', json=PROFILE).json
+    response = wait_for_job(second, job['status_url'])
+    assert response.json['status'] == 'succeeded'
+    assert response.json['result']['meal_plan'] == 'shared plan'
+
+    result_id = first.post('/optimize', json=PROFILE).json['result_id']
+    response = second.post('/meal-plan?wait=true', json=dict(PROFILE, result_id=result_id))
+    assert response.status_code == 200
+    assert response.json['meal_plan'] == 'plan from the stored diet'
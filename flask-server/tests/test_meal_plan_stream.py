@@ -0,0 +1,95 @@
+import json
+import threading
+import time
+
+from conftest import completion_stream, error
+
+PROFILE = {'gender': 'male', 'weight': 80, 'height': 180, 'age': 40, 'period': 'day'}
+
+
+def sse_events(response):
+    """[(event, data)] of a Server-Sent Events response body."""
+    events = []
+    for message in response.get_data(as_text=True).split('\n\n'):
+        if not message.strip():
+            continue
+        fields = dict(line.split(': ', 1) for line in message.split('\n'))
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def test_event_order_diet_tokens_summary(make_app, stub):
+    stub.script = [completion_stream(['Brokastis', ': ', 'auzu pārslas'])]
+    client = make_app().test_client()
+    response = client.post('/meal-plan/stream', json=PROFILE)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    events = sse_events(response)
+    assert [event for event, _ in events] == ['diet', 'token', 'token', 'token', 'summary']
+    diet, summary = events[0][1], events[-1][1]
+    assert diet['status'] == 'Optimal' and diet['diet']
+    assert [data['content'] for event, data in events if event == 'token'] == ['Brokastis', ': ', 'auzu pārslas']
+    assert summary['meal_plan'] == 'Brokastis: auzu pārslas'
+    assert summary['diet'] == diet['diet'] and summary['total_cost'] == diet['total_cost']
+    assert stub.requests[0][1]['stream'] is True
+
+    # A finished stream is cached and replayed as a single token
+    events = sse_events(client.post('/meal-plan/stream', json=PROFILE))
+    assert [event for event, _ in events] == ['diet', 'token', 'summary']
+    assert events[-1][1]['meal_plan'] == 'Brokastis: auzu pārslas'
+    assert stub.hits == 1
+
+
+def test_upstream_error_before_stream(make_app, stub):
+    stub.script = [error(500)]
+    events = sse_events(make_app().test_client().post('/meal-plan/stream', json=PROFILE))
+    assert [event for event, _ in events] == ['diet', 'error']
+    assert events[-1][1]['error'] == 'Failed to generate meal plan'
+    assert '500' in events[-1][1]['details']
+
+
+def test_upstream_failure_mid_stream(make_app, stub):
+    stub.script = [completion_stream(['Brokastis', ': ', 'auzu pārslas'], fail_after=2)]
+    client = make_app().test_client()
+    events = sse_events(client.post('/meal-plan/stream', json=PROFILE))
+    assert [event for event, _ in events] == ['diet', 'token', 'token', 'error']
+    # The partial meal plan is not cached
+    stub.script = [completion_stream(['Vakariņas'])]
+    events = sse_events(client.post('/meal-plan/stream', json=PROFILE))
+    assert events[-1][0] == 'summary' and events[-1][1]['meal_plan'] == 'Vakariņas'
+
+
+def test_concurrent_identical_streams_share_one_upstream_call(make_app, stub):
+    app = make_app()
+    cache = app.extensions['diet']['meal_plan_cache']
+
+    def hold_until_coalesced():
+        deadline = time.monotonic() + 10
+        while cache.coalesced == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    stub.on_request = hold_until_coalesced
+    stub.script = [completion_stream(['Vakariņas', ': zupa'])]
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(sse_events(app.test_client().post('/meal-plan/stream', json=PROFILE))))
+               for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(15)
+    assert stub.hits == 1 and cache.coalesced == 1
+    tokens = sorted([data['content'] for event, data in events if event == 'token'] for events in results)
+    assert tokens == [['Vakariņas', ': zupa'], ['Vakariņas: zupa']]
+    assert all(events[-1][1]['meal_plan'] == 'Vakariņas: zupa' for events in results)
+
+
+def test_broken_cache_still_streams(make_app, stub):
+    app = make_app()
+    app.extensions['diet']['meal_plan_cache']._conn.close()
+    stub.script = [completion_stream(['Pusdienas']), completion_stream(['Pusdienas'])]
+    client = app.test_client()
+    for _ in range(2):
+        events = sse_events(client.post('/meal-plan/stream', json=PROFILE))
+        assert [event for event, _ in events] == ['diet', 'token', 'summary']
+        assert events[-1][1]['meal_plan'] == 'Pusdienas'
+    assert stub.hits == 2
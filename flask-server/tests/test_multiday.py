@@ -0,0 +1,55 @@
+import threading
+
+import pytest
+
+import multiday
+from catalog import DB_PATH, CatalogCache
+from multiday import optimize_plan, parse_plan
+from scheduler import SolverScheduler
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return CatalogCache(DB_PATH).get()
+
+
+@pytest.fixture
+def peak_solves(monkeypatch):
+    """Records the most day solves running at once."""
+    lock = threading.Lock()
+    state = {'running': 0, 'peak': 0}
+    solve_day = multiday._solve_day
+
+    def counted(*args):
+        with lock:
+            state['running'] += 1
+            state['peak'] = max(state['peak'], state['running'])
+        try:
+            return solve_day(*args)
+        finally:
+            with lock:
+                state['running'] -= 1
+
+    monkeypatch.setattr(multiday, '_solve_day', counted)
+    return state
+
+
+@pytest.mark.parametrize('slots,busy,expected', [(1, 0, 1), (3, 0, 3), (3, 1, 2)])
+def test_plan_runs_no_more_solves_than_slots(catalog, peak_solves, slots, busy, expected):
+    plan, error = parse_plan({'gender': 'male', 'activity': 'moderate', 'days': 7, 'max_repeats': 2})
+    assert error is None
+    scheduler = SolverScheduler(max_concurrent=slots, time_budget=30)
+    for _ in range(busy):
+        scheduler.acquire()
+    result = optimize_plan(catalog, plan, scheduler=scheduler, workers=8)
+    assert result['status'] == 'Optimal'
+    assert peak_solves['peak'] <= expected
+    assert scheduler.stats()['running'] == busy
+
+
+def test_infeasible_plan_reports_relaxations(catalog):
+    plan, error = parse_plan({'gender': 'male', 'days': 2, 'vegetarian': True, 'allergens': ['milk', 'eggs']})
+    assert error is None
+    result = optimize_plan(catalog, plan)
+    assert result['status'] == 'Infeasible'
+    assert result['details'].startswith('Infeasible constraints for a single day')
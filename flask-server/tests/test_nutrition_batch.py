@@ -0,0 +1,107 @@
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from nutrition import ACTIVITY_MULTIPLIERS, calculate_bmr, calculate_energy_needs, get_efsa_norms
+from nutrition_batch import INVALID_ROW, batch_energy_norms, iter_norm_chunks, profile_columns
+
+ACTIVITIES = list(ACTIVITY_MULTIPLIERS) + ['Very Active', 'unknown']
+
+
+def random_profiles(n, seed=0):
+    """Columns of ``n`` random valid profiles: both genders, ages around 50, every activity, day and week."""
+    rng = random.Random(seed)
+    ages = [49, 49.99, 50, 50.01, 51]
+    return {
+        'gender': [rng.choice(['male', 'female', 'Male', 'FEMALE']) for _ in range(n)],
+        'weight': [round(rng.uniform(35, 160), rng.choice([0, 1, 3])) for _ in range(n)],
+        'height': [round(rng.uniform(140, 210), rng.choice([0, 1])) for _ in range(n)],
+        'age': [rng.choice(ages) if rng.random() < 0.2 else round(rng.uniform(1, 95), 1) for _ in range(n)],
+        'activity': [rng.choice(ACTIVITIES) for _ in range(n)],
+        'period': [rng.choice(['day', 'week', 'Week']) for _ in range(n)]
+    }
+
+
+def scalar_row(gender, weight, height, age, activity, period):
+    period_days = 7 if period.lower() == 'week' else 1
+    bmr = calculate_bmr(gender, weight, height, age)
+    eer_kcal = calculate_energy_needs(bmr, activity)
+    norms, norms_upper = get_efsa_norms(gender, weight, age, eer_kcal, period_days)
+    return bmr, eer_kcal, norms, norms_upper
+
+
+def test_batch_norms_match_scalar_bit_for_bit():
+    data = random_profiles(5000)
+    columns, error = profile_columns(data)
+    assert error is None and columns['valid'].all()
+    result = batch_energy_norms(columns['gender'], columns['weight'], columns['height'], columns['age'],
+                                columns['activity'], columns['period_days'])
+    for i, row in enumerate(zip(*(data[name] for name in ('gender', 'weight', 'height', 'age', 'activity', 'period')))):
+        bmr, eer_kcal, norms, norms_upper = scalar_row(*row)
+        assert result['bmr'][i] == bmr
+        assert result['kcal'][i] == eer_kcal
+        assert {nut: result['norms'][nut][i] for nut in norms} == norms
+        assert {nut: result['norms_upper'][nut][i] for nut in norms_upper} == norms_upper
+        assert set(result['norms']) == set(norms) and set(result['norms_upper']) == set(norms_upper)
+
+
+def test_chunks_match_scalar_and_null_invalid_rows():
+    data = random_profiles(1000, seed=1)
+    invalid = {3: ('weight', 0), 10: ('height', -170), 11: ('age', 'abc'), 500: ('weight', float('nan')), 999: ('age', '')}
+    for i, (name, value) in invalid.items():
+        data[name][i] = value
+    # An empty age takes the default, so that row is valid
+    invalid.pop(999)
+    columns, error = profile_columns(data)
+    assert error is None
+
+    chunks = list(iter_norm_chunks(columns, chunk_size=128))
+    assert [chunk['offset'] for chunk in chunks] == list(range(0, 1000, 128))
+    assert sum(chunk['count'] for chunk in chunks) == 1000
+    errors = [e for chunk in chunks for e in chunk.get('errors', [])]
+    assert errors == [{'index': i, 'error': INVALID_ROW} for i in sorted(invalid)]
+
+    for chunk in chunks:
+        for k in range(chunk['count']):
+            i = chunk['offset'] + k
+            if i in invalid:
+                assert chunk['bmr'][k] is None and chunk['kcal'][k] is None
+                assert all(values[k] is None for values in chunk['norms'].values())
+                assert all(values[k] is None for values in chunk['norms_upper'].values())
+                continue
+            age = data['age'][i] if data['age'][i] != '' else 30.0
+            bmr, eer_kcal, norms, norms_upper = scalar_row(data['gender'][i], data['weight'][i], data['height'][i],
+                                                           age, data['activity'][i], data['period'][i])
+            # Chunks are rounded to 4 decimals
+            assert chunk['bmr'][k] == pytest.approx(bmr, abs=5.001e-5)
+            assert chunk['kcal'][k] == pytest.approx(eer_kcal, abs=5.001e-5)
+            assert chunk['period_days'][k] == (7 if data['period'][i].lower() == 'week' else 1)
+            for nut, value in norms.items():
+                assert chunk['norms'][nut][k] == pytest.approx(value, abs=5.001e-5)
+            for nut, value in norms_upper.items():
+                assert chunk['norms_upper'][nut][k] == pytest.approx(value, abs=5.001e-5)
+
+
+def test_single_values_broadcast_and_defaults():
+    columns, error = profile_columns({'weight': [80, 55], 'gender': 'female'})
+    assert error is None
+    assert columns['gender'].tolist() == ['female', 'female']
+    assert columns['height'].tolist() == [165.0, 165.0]
+    assert columns['age'].tolist() == [30.0, 30.0]
+    assert columns['period_days'].tolist() == [7, 7]
+    assert profile_columns({'weight': [1, 2], 'age': [1]})[1] == 'Invalid input: all columns must have the same length'
+    assert profile_columns({'weight': list(range(5))}, max_items=4)[1] == 'Invalid input: at most 4 profiles per batch'
+
+
+def test_empty_columns_are_invalid_input(make_app):
+    assert profile_columns({'weight': []}) == (None, 'Invalid input: at least one profile required')
+    client = make_app().test_client()
+    for body in ({'weight': []}, {'gender': [], 'weight': [], 'age': []}):
+        response = client.post('/tdee/batch', json=body)
+        assert response.status_code == 400
+        assert response.get_json() == {'error': 'Invalid input: at least one profile required'}
+    # A CSV file with only its header row
+    response = client.post('/tdee/batch', data='gender,weight,height,age\n', content_type='text/csv')
+    assert response.status_code == 400
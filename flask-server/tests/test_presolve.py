@@ -0,0 +1,46 @@
+import pytest
+
+pytest.importorskip('numpy')
+
+import presolve
+from catalog import DB_PATH, CatalogSnapshot, load_products_from_db
+from catalog_store import open_catalog_store
+from optimizer import parse_profile, solve_profile
+
+
+@pytest.fixture(scope='module')
+def catalog(tmp_path_factory):
+    """The shipped products plus a dearer copy of each, which the original dominates."""
+    foods = load_products_from_db(DB_PATH)
+    dearer = [dict(f, name=f"{f['name']} (premium)", price_per_100g=f['price_per_100g'] + 1) for f in foods]
+    return CatalogSnapshot('premium', open_catalog_store(tmp_path_factory.mktemp('store'), 'premium', foods + dearer))
+
+
+def test_presolve_reports_removed_products_and_dominators(catalog, monkeypatch):
+    profile, _ = parse_profile({'gender': 'female', 'activity': 'moderate'})
+    full = solve_profile(catalog, profile)
+    assert 'presolve' not in full
+
+    monkeypatch.setattr(presolve, 'MIN_PRODUCTS', 1)
+    result = solve_profile(catalog, profile)
+    assert result['total_cost'] == pytest.approx(full['total_cost'], abs=0.011)
+    report = result['presolve']
+    assert report['products'] == len(catalog)
+    # Tags come from the names, so a few copies land in another class and stay
+    assert len(catalog) // 2 >= report['removed_dominated'] == len(report['removed']) > len(catalog) // 4
+    for item in report['removed']:
+        assert item['name'].endswith(' (premium)')
+        assert item['dominated_by'] == [item['name'][:-len(' (premium)')]]
+
+
+def test_reductions_are_bounded(catalog, monkeypatch):
+    monkeypatch.setattr(presolve, 'MAX_REDUCTIONS', 2)
+    index = presolve.DominanceIndex(catalog)
+    masks = [catalog.all_products, catalog.all_products & ~1, catalog.all_products & ~2]
+    for available in masks:
+        index.removed(available)
+    assert list(index._reductions) == masks[1:]
+    # A hit moves its mask to the most recent end
+    index.removed(masks[1])
+    index.removed(catalog.all_products & ~4)
+    assert list(index._reductions) == [masks[1], catalog.all_products & ~4]
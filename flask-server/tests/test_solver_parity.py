@@ -0,0 +1,38 @@
+import itertools
+
+import pytest
+
+pytest.importorskip('scipy')
+
+from catalog import DB_PATH, CatalogCache
+from optimizer import parse_profile, solve_profile
+
+# 2 x 4 x 2 x 2 x 2 x 2 = 128 profiles, feasible and infeasible ones
+PROFILE_GRID = {
+    'gender': ('male', 'female'),
+    'activity': ('sedentary', 'low', 'moderate', 'very active'),
+    'period': ('day', 'week'),
+    'allergens': ((), ('milk', 'eggs')),
+    'vegetarian': (False, True),
+    'no_added_sugar': (False, True)
+}
+PROFILES = [dict(zip(PROFILE_GRID, values)) for values in itertools.product(*PROFILE_GRID.values())]
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return CatalogCache(DB_PATH).get()
+
+
+@pytest.mark.parametrize('body', PROFILES, ids=lambda body: '-'.join(str(v) for v in body.values()))
+def test_highs_matches_pulp(catalog, body):
+    profile, error = parse_profile(dict(body, allergens=list(body['allergens'])))
+    assert error is None
+    pulp = solve_profile(catalog, profile, 'pulp')
+    highs = solve_profile(catalog, profile, 'highs')
+
+    assert highs.get('status') == pulp.get('status')
+    assert ('error' in highs) == ('error' in pulp)
+    if 'error' not in pulp:
+        # Alternate optima may pick different diets; only the optimal cost must agree
+        assert highs['total_cost'] == pytest.approx(pulp['total_cost'], abs=0.011)
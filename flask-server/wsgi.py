@@ -0,0 +1,19 @@
+"""Production entry point: ``gunicorn -c gunicorn.conf.py wsgi:app``.
+
+The app is built and warmed up when this module is imported, which with
+gunicorn's ``preload_app`` happens once in the master before workers fork.
+"""
+import time
+
+_started = time.perf_counter()
+
+from app import after_fork, create_app, warm_up  # noqa: E402
+
+app = create_app()
+warm_up(app)
+# Import, configuration and warm-up, in seconds
+startup_seconds = time.perf_counter() - _started
+
+
+def post_fork():
+    after_fork(app)